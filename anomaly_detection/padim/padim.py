@@ -3,7 +3,6 @@ import sys
 import time
 from collections import OrderedDict
 import random
-import pickle
 
 import numpy as np
 import cv2
@@ -49,12 +48,20 @@ parser.add_argument(
     help='arch model.'
 )
 parser.add_argument(
-    '-f', '--feat', metavar="PICKLE_FILE", default=None,
-    help='train set feature pkl files.'
+    '-f', '--feat', metavar="FEAT_DIR", default=None,
+    help='train set feature directory (or pkl file of older versions).'
+)
+parser.add_argument(
+    '--feat_dtype', default='float32', choices=('float32', 'float16'),
+    help='data type of the saved train set feature.'
+)
+parser.add_argument(
+    '--n_jobs', type=int, default=1,
+    help='number of processes to calculate the inverse of covariance.'
 )
 parser.add_argument(
     '-bs', '--batch_size', default=32,
-    help='batch size.'
+    help='batch size of training and of scoring the test images.'
 )
 parser.add_argument(
     '-tr', '--train_dir', metavar="DIR", default="./train",
@@ -155,17 +162,17 @@ def plot_fig(file_list, test_imgs, scores, anormal_scores, gt_imgs, threshold, s
 
 def train_from_image_or_video(net, params):
     # training
-    train_outputs = training(net, params, IMAGE_RESIZE, IMAGE_SIZE, KEEP_ASPECT, int(args.batch_size), args.train_dir, args.aug, args.aug_num, args.seed, logger)
+    dtype = np.dtype(args.feat_dtype)
+    train_outputs = training(net, params, IMAGE_RESIZE, IMAGE_SIZE, KEEP_ASPECT, int(args.batch_size), args.train_dir, args.aug, args.aug_num, args.seed, logger, n_jobs=args.n_jobs, dtype=dtype)
 
     # save learned distribution
     if args.feat:
         train_feat_file = args.feat
     else:
         train_dir = args.train_dir
-        train_feat_file = "%s.pkl" % os.path.basename(train_dir)
+        train_feat_file = "%s_feat" % os.path.splitext(os.path.basename(os.path.normpath(train_dir)))[0]
     logger.info('saving train set feature to: %s ...' % train_feat_file)
-    with open(train_feat_file, 'wb') as f:
-        pickle.dump(train_outputs, f)
+    save_train_outputs(train_feat_file, train_outputs, params, IMAGE_SIZE, dtype=dtype)
     logger.info('saved.')
 
     return train_outputs
@@ -191,19 +198,37 @@ def load_gt_imgs(gt_type_dir):
     return gt_imgs
 
 
-def decide_threshold_from_gt_image(net, params, train_outputs, gt_imgs):
-    score_map = []
-    for i_img in range(0, len(args.input)):
-        logger.info('from (%s) ' % (args.input[i_img]))
+def load_test_imgs(image_paths):
+    test_imgs = []
+    for image_path in image_paths:
+        logger.info('from (%s) ' % (image_path))
 
-        image_path = args.input[i_img]
         img = load_image(image_path)
         img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB)
         img = preprocess(img, IMAGE_RESIZE, keep_aspect=KEEP_ASPECT, crop_size = IMAGE_SIZE)
 
-        dist_tmp = infer(net, params, train_outputs, img, IMAGE_SIZE)
+        test_imgs.append(img)
+    return test_imgs
 
-        score_map.append(dist_tmp)
+
+def infer_test_imgs(net, params, train_outputs, image_paths):
+    # score the test images batch_size images at a time
+    batch_size = int(args.batch_size)
+
+    test_imgs = []
+    score_map = []
+    for i_img in range(0, len(image_paths), batch_size):
+        imgs = load_test_imgs(image_paths[i_img:i_img + batch_size])
+        dist_list = infer_batch(net, params, train_outputs, imgs, IMAGE_SIZE)
+
+        test_imgs.extend([img[0] for img in imgs])
+        score_map.extend(list(dist_list))
+
+    return test_imgs, score_map
+
+
+def decide_threshold_from_gt_image(net, params, train_outputs, gt_imgs):
+    _, score_map = infer_test_imgs(net, params, train_outputs, args.input)
 
     scores = normalize_scores(score_map, IMAGE_SIZE)
 
@@ -216,21 +241,13 @@ def infer_from_image(net, params, train_outputs, threshold, gt_imgs):
         logger.error("Input file not found")
         return
 
-    test_imgs = []
-
-    score_map = []
-    for i_img in range(0, len(args.input)):
-        logger.info('from (%s) ' % (args.input[i_img]))
-
-        image_path = args.input[i_img]
-        img = load_image(image_path)
-        img = cv2.cvtColor(img, cv2.COLOR_BGRA2RGB)
-        img = preprocess(img, IMAGE_RESIZE, keep_aspect=KEEP_ASPECT, crop_size = IMAGE_SIZE)
+    if args.benchmark:
+        logger.info('BENCHMARK mode')
+        test_imgs = []
+        score_map = []
+        for img in load_test_imgs(args.input):
+            test_imgs.append(img[0])
 
-        test_imgs.append(img[0])
-
-        if args.benchmark:
-            logger.info('BENCHMARK mode')
             total_time = 0
             for i in range(args.benchmark_count):
                 start = int(round(time.time() * 1000))
@@ -240,10 +257,10 @@ def infer_from_image(net, params, train_outputs, threshold, gt_imgs):
                 if i != 0:
                     total_time = total_time + (end - start)
             logger.info(f'\taverage time {total_time / (args.benchmark_count - 1)} ms')
-        else:
-            dist_tmp = infer(net, params, train_outputs, img, IMAGE_SIZE)
 
-        score_map.append(dist_tmp)
+            score_map.append(dist_tmp)
+    else:
+        test_imgs, score_map = infer_test_imgs(net, params, train_outputs, args.input)
 
     scores = normalize_scores(score_map, IMAGE_SIZE)
     anormal_scores = calculate_anormal_scores(score_map, IMAGE_SIZE)
@@ -297,8 +314,7 @@ def infer_from_video(net, params, train_outputs, threshold):
 def train_and_infer(net, params):
     if args.feat:
         logger.info('loading train set feature from: %s' % args.feat)
-        with open(args.feat, 'rb') as f:
-            train_outputs = pickle.load(f)
+        train_outputs = load_train_outputs(args.feat, params, IMAGE_SIZE)
         logger.info('loaded.')
     else:
         train_outputs = train_from_image_or_video(net, params)
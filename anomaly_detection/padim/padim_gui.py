@@ -229,12 +229,11 @@ def train_button_clicked():
     train_outputs = training(net, params, get_image_resize(), get_image_crop_size(), get_keep_aspect(), batch_size, train_dir, aug, aug_num, seed, logger)
 
     # save learned distribution
-    train_feat_file = "train.pkl"
+    train_feat_file = "train_feat"
     #train_dir = args.train_dir
-    #train_feat_file = "%s.pkl" % os.path.basename(train_dir)
+    #train_feat_file = "%s_feat" % os.path.basename(train_dir)
     logger.info('saving train set feature to: %s ...' % train_feat_file)
-    with open(train_feat_file, 'wb') as f:
-        pickle.dump(train_outputs, f)
+    save_train_outputs(train_feat_file, train_outputs, params, get_image_crop_size())
     logger.info('saved.')
 
     global score_cache
@@ -261,8 +260,7 @@ def test_button_clicked():
     net = ailia.Net(model_path, weight_path, env_id=env_id)
 
     # load trained model
-    with open("train.pkl", 'rb') as f:
-        train_outputs = pickle.load(f)
+    train_outputs = load_train_outputs("train_feat", params, get_image_crop_size())
     
     threshold = slider_index / 100.0
 
@@ -4,12 +4,14 @@ import cv2
 from collections import OrderedDict
 import random
 import pickle
+from concurrent.futures import ProcessPoolExecutor
 
 from PIL import Image
 from image_utils import normalize_image  # noqa: E402
 from detector_utils import load_image  # noqa: E402
+from functional import embedding_concat  # noqa: E402
+from feature_store_utils import save_feature_store, load_feature_store, check_header  # noqa: E402
 
-from scipy.spatial.distance import mahalanobis
 from scipy.ndimage import gaussian_filter
 
 from sklearn.metrics import precision_recall_curve
@@ -22,41 +24,6 @@ MODEL_RESNET18_PATH = 'resnet18.onnx.prototxt'
 WEIGHT_WIDE_RESNET50_2_PATH = 'wide_resnet50_2.onnx'
 MODEL_WIDE_RESNET50_2_PATH = 'wide_resnet50_2.onnx.prototxt'
 
-def embedding_concat(x, y):
-    B, C1, H1, W1 = x.shape
-    _, C2, H2, W2 = y.shape
-
-    assert H1 == W1
-
-    s = H1 // H2
-    sel = [np.array([i for i in range(i, H1, s)]) for i in range(s)]
-
-    a = np.zeros((B, C1 * s * s, H2 * W2))
-    for b in range(B):
-        for c in range(C1):
-            for i in range(s * s):
-                a[b, c * s * s + i, :] = x[
-                    b, c, sel[i // s][:, None], sel[i % s]
-                ].flatten()
-    x = a.reshape((B, C1, -1, H2, W2))
-    z = np.zeros((B, C1 + C2, s * s, H2, W2))
-    for i in range(s * s):
-        z[:, :, i, :, :] = np.concatenate((x[:, :, i, :, :], y), axis=1)
-    z = z.reshape((B, -1, H2 * W2))
-
-    _, C3, _ = z.shape
-    a = np.zeros((B, C3 // (s * s), H1, W1))
-    for b in range(B):
-        for c in range(C3 // (s * s)):
-            for i in range(s * s):
-                x = z[b, c * s * s + i, :].reshape((H2, W2))
-                a[
-                    b, c, sel[i // s][:, None], sel[i % s]
-                ] = x
-
-    return a
-
-
 def preprocess(img, size, crop_size, mask=False, keep_aspect = True):
     h, w = img.shape[:2]
 
@@ -170,7 +137,104 @@ def capture_training_frames_from_video(train_dir):
     return train_imgs
 
 
-def training(net, params, size, crop_size, keep_aspect, batch_size, train_dir, aug, aug_num, seed, logger):
+def update_gaussian(N, mean, M2, embedding_vectors, chunk_size=256):
+    """
+    Merge a batch into the running statistics of every position.
+
+    N : number of samples accumulated so far
+    mean : (C, H * W) float64 or None
+    M2 : (H * W, C, C) float32 or None, sum of squared deviations from mean
+    embedding_vectors : (B, C, H * W)
+    """
+    B, C, HW = embedding_vectors.shape
+    if mean is None:
+        mean = np.zeros((C, HW), dtype=np.float64)
+        M2 = np.zeros((HW, C, C), dtype=np.float32)
+
+    batch_mean = embedding_vectors.mean(axis=0, dtype=np.float64)
+    # (B, C, H * W) -> (H * W, B, C)
+    dev = (embedding_vectors - batch_mean[None]).transpose(2, 0, 1)
+    delta = (batch_mean - mean).T
+
+    n = N + B
+    scale = N * B / n
+    for i in range(0, HW, chunk_size):
+        d = dev[i:i + chunk_size]
+        m2 = np.matmul(d.transpose(0, 2, 1), d)
+        dl = delta[i:i + chunk_size]
+        m2 += scale * dl[:, :, None] * dl[:, None, :]
+        M2[i:i + chunk_size] += m2
+
+    mean += (batch_mean - mean) * (B / n)
+
+    return n, mean, M2
+
+
+def _inv_chunk(cov):
+    return np.linalg.inv(cov)
+
+
+def invert_covariance(M2, N, reg=0.01, chunk_size=256, n_jobs=1):
+    """
+    Calculate the inverse of covariance (M2 / (N - 1) + reg * I) of every position.
+    M2 is overwritten with the result to avoid keeping a second (H * W, C, C) array.
+    """
+    HW, C, _ = M2.shape
+    I = np.identity(C, dtype=M2.dtype)
+    M2 /= (N - 1)
+    M2 += reg * I
+
+    ranges = [(i, min(i + chunk_size, HW)) for i in range(0, HW, chunk_size)]
+    if n_jobs is not None and n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = executor.map(_inv_chunk, [M2[s:e] for s, e in ranges])
+            for (s, e), cov_inv in zip(ranges, results):
+                M2[s:e] = cov_inv
+    else:
+        for s, e in ranges:
+            M2[s:e] = np.linalg.inv(M2[s:e])
+
+    return M2
+
+
+def save_train_outputs(path, train_outputs, params, crop_size, dtype=np.float32):
+    """
+    Save train_outputs as a feature store directory which can be memory-mapped.
+    """
+    mean, _, cov_inv, idx = train_outputs
+    header = {
+        "model": "padim",
+        "arch": params["arch"],
+        "feat_names": list(params["feat_names"]),
+        "crop_size": crop_size,
+        "idx": [int(i) for i in idx],
+    }
+    arrays = {
+        "mean": mean.astype(dtype, copy=False),
+        "cov_inv": cov_inv.astype(dtype, copy=False),
+    }
+    save_feature_store(path, header, arrays)
+
+
+def load_train_outputs(path, params=None, crop_size=None):
+    """
+    Load train_outputs saved by save_train_outputs, or a pickle file of older versions.
+    """
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    header, arrays = load_feature_store(path)
+    check_header(
+        header, model="padim",
+        arch=params["arch"] if params else None,
+        feat_names=params["feat_names"] if params else None,
+        crop_size=crop_size)
+
+    return [arrays["mean"], None, arrays["cov_inv"], header["idx"]]
+
+
+def training(net, params, size, crop_size, keep_aspect, batch_size, train_dir, aug, aug_num, seed, logger, n_jobs=1, dtype=np.float32):
     # set seed
     random.seed(seed)
     idx = random.sample(range(0, params["t_d"]), params["d"])
@@ -194,6 +258,7 @@ def training(net, params, size, crop_size, keep_aspect, batch_size, train_dir, a
         logger.info('extract train set features with augmentation')
         aug_num = aug_num
     mean = None
+    M2 = None
     N = 0
     for i_aug in range(aug_num):
         for i_img in range(0, len(train_imgs), batch_size):
@@ -221,9 +286,6 @@ def training(net, params, size, crop_size, keep_aspect, batch_size, train_dir, a
                     img = preprocess_aug(img, size, crop_size, keep_aspect=keep_aspect)
                 imgs.append(img)
 
-            # countup N
-            N += len(imgs)
-
             imgs = np.vstack(imgs)
 
             logger.debug(f'input images shape: {imgs.shape}')
@@ -249,38 +311,61 @@ def training(net, params, size, crop_size, keep_aspect, batch_size, train_dir, a
             B, C, H, W = embedding_vectors.shape
             embedding_vectors = embedding_vectors.reshape(B, C, H * W)
 
-            # initialize mean and covariance matrix
-            if (mean is None):
-                mean = np.zeros((C, H * W), dtype=np.float32)
-                cov = np.zeros((C, C, H * W), dtype=np.float32)
-
-            # calculate multivariate Gaussian distribution
-            # (add up mean and covariance matrix)
-            mean += np.sum(embedding_vectors, axis=0)
-            for i in range(H * W):
-                # https://github.com/numpy/numpy/blob/v1.21.0/numpy/lib/function_base.py#L2324-L2543
-                m = embedding_vectors[:, :, i]
-                m = m - (mean[:, [i]].T / N)
-                cov[:, :, i] += m.T @ m
-
-    # devide mean by N
-    mean = mean / N
+            # accumulate mean and covariance matrix (Welford / Chan's update)
+            N, mean, M2 = update_gaussian(N, mean, M2, embedding_vectors)
+
     # devide covariance by N-1, and calculate inverse
-    I = np.identity(C)
-    for i in range(H * W):
-        cov[:, :, i] = (cov[:, :, i] / (N - 1)) + 0.01 * I
+    cov_inv = invert_covariance(M2, N, n_jobs=n_jobs)
+    cov_inv = cov_inv.astype(dtype, copy=False)
+    mean = mean.astype(dtype)
 
-    cov_inv = np.zeros(cov.shape)
-    for i in range(H * W):
-        cov_inv[:, :, i] = np.linalg.inv(cov[:, :, i])
-    
-    train_outputs = [mean, cov, cov_inv, idx]
+    # covariance itself is not required for inference, so it is not kept
+    train_outputs = [mean, None, cov_inv, idx]
     return train_outputs
 
-def infer(net, params, train_outputs, img, crop_size):
+
+def get_cov_inv(train_outputs):
+    """
+    Return cov_inv as a contiguous (H * W, C, C) array.
+    Features saved by older versions hold cov_inv as (C, C, H * W),
+    they are converted once and the result is written back to train_outputs.
+    """
+    mean, cov_inv = train_outputs[0], train_outputs[2]
+    C, HW = mean.shape
+    if cov_inv.shape == (C, C, HW) and C != HW:
+        cov_inv = np.ascontiguousarray(cov_inv.transpose(2, 0, 1))
+        train_outputs[2] = cov_inv
+    return cov_inv
+
+
+def mahalanobis_distance(embedding_vectors, mean, cov_inv, chunk_size=1024):
+    """
+    Mahalanobis distance of every patch of every image at once.
+
+    embedding_vectors : (B, C, H * W)
+    mean : (C, H * W)
+    cov_inv : (H * W, C, C)
+    return : (B, H * W)
+    """
+    B, C, HW = embedding_vectors.shape
+    dtype = np.result_type(embedding_vectors.dtype, cov_inv.dtype)
+
+    # (B, C, H * W) -> (H * W, B, C)
+    delta = (embedding_vectors - mean[None]).transpose(2, 0, 1).astype(dtype)
+
+    dist = np.zeros((HW, B), dtype=dtype)
+    for i in range(0, HW, chunk_size):
+        d = delta[i:i + chunk_size]
+        m = np.matmul(d, cov_inv[i:i + chunk_size])
+        dist[i:i + chunk_size] = np.einsum('pbc,pbc->pb', m, d)
+
+    dist = np.sqrt(np.maximum(dist, 0))
+
+    return dist.T
+
+
+def infer_batch(net, params, train_outputs, imgs, crop_size):
     # prepare input data
-    imgs = []
-    imgs.append(img)
     imgs = np.vstack(imgs)
 
     # inference
@@ -306,23 +391,28 @@ def infer(net, params, train_outputs, img, crop_size):
     embedding_vectors = embedding_vectors.reshape(B, C, H * W)
 
     # calculate distance matrix
-    dist_tmp = np.zeros([B, (H * W)])
-    for i in range(H * W):
-        mean = train_outputs[0][:, i]
-        conv_inv = train_outputs[2][:, :, i] # calculate inverse on training phase (np.linalg.inv(train_outputs[1][:, :, i]))
-        dist = [mahalanobis(sample[:, i], mean, conv_inv) for sample in embedding_vectors]
-        dist_tmp[:, i] = dist
+    mean = train_outputs[0]
+    cov_inv = get_cov_inv(train_outputs)  # calculate inverse on training phase
+    dist_list = mahalanobis_distance(embedding_vectors, mean, cov_inv)
 
     # upsample
-    dist_tmp = dist_tmp.reshape(H, W)
-    dist_tmp = np.array(Image.fromarray(dist_tmp).resize(
-            (crop_size, crop_size), resample=Image.BILINEAR)
-        )
+    score_map = np.zeros((B, crop_size, crop_size), dtype=np.float32)
+    for i in range(B):
+        dist_tmp = dist_list[i].reshape(H, W).astype(np.float32)
+        score_map[i] = np.array(Image.fromarray(dist_tmp).resize(
+                (crop_size, crop_size), resample=Image.BILINEAR)
+            )
 
     # apply gaussian smoothing on the score map
-    dist_tmp = gaussian_filter(dist_tmp, sigma=4)
+    score_map = gaussian_filter(score_map, sigma=(0, 4, 4))
+
+    return score_map
+
+
+def infer(net, params, train_outputs, img, crop_size):
+    dist_tmp = infer_batch(net, params, train_outputs, [img], crop_size)
 
-    return dist_tmp
+    return dist_tmp[0]
 
 
 def normalize_scores(score_map, crop_size, roi_img = None):
@@ -381,6 +471,7 @@ def get_params(arch):
 
     # create param
     params = {
+        "arch": arch,
         "feat_names": feat_names,
         "t_d": t_d,
         "d": d,
@@ -34,16 +34,58 @@ from sampler import Sampler
 class KCenterGreedy(Sampler):
     NAME = "kcenter"
 
-    def __init__(self, X, y, seed, metric='euclidean'):
+    def __init__(self, X, y, seed, metric='euclidean', chunk_size=65536):
         self.X = X
         self.y = y
         self.flat_X = self.flatten_X()
         self.features = self.flat_X
         self.metric = metric
+        self.chunk_size = chunk_size
         self.min_distances = None
+        self.sq_norms = None
         self.n_obs: int = self.X.shape[0]
         self.already_selected = []
 
+    def transform(self, model):
+        """Transform features chunk by chunk to bound the memory of projection.
+
+        Args:
+          model: model with scikit-like API with transform implemented
+        """
+        features = [
+            np.asarray(model.transform(self.flat_X[i:i + self.chunk_size]),
+                       dtype=np.float32)
+            for i in range(0, self.n_obs, self.chunk_size)
+        ]
+        return np.ascontiguousarray(np.vstack(features))
+
+    def distances(self, x):
+        """Calculate distances from all examples to x, chunk by chunk.
+
+        Args:
+          x: features of cluster centers
+
+        Returns:
+          minimum distance of each example to x as (n_obs, 1) array
+        """
+        if self.metric != 'euclidean':
+            dist = pairwise_distances(self.features, x, metric=self.metric)
+            return np.min(dist, axis=1).reshape(-1, 1)
+
+        if self.sq_norms is None:
+            self.sq_norms = np.einsum('ij,ij->i', self.features, self.features)
+
+        x = np.asarray(x, dtype=self.features.dtype)
+        x_sq_norms = np.einsum('ij,ij->i', x, x)
+        min_dist = np.empty((self.n_obs, 1), dtype=self.features.dtype)
+        for i in range(0, self.n_obs, self.chunk_size):
+            f = self.features[i:i + self.chunk_size]
+            dist = self.sq_norms[i:i + self.chunk_size, None] - 2 * (f @ x.T) \
+                + x_sq_norms[None, :]
+            min_dist[i:i + self.chunk_size, 0] = np.min(dist, axis=1)
+
+        return np.sqrt(np.maximum(min_dist, 0))
+
     def update_distances(self, cluster_centers, only_new=True, reset_dist=False):
         """Update min distances given cluster centers.
 
@@ -62,12 +104,12 @@ class KCenterGreedy(Sampler):
         if cluster_centers:
             # Update min_distances for all examples given new cluster center.
             x = self.features[cluster_centers]
-            dist = pairwise_distances(self.features, x, metric=self.metric)
+            dist = self.distances(x)
 
             if self.min_distances is None:
-                self.min_distances = np.min(dist, axis=1).reshape(-1,1)
+                self.min_distances = dist
             else:
-                self.min_distances = np.minimum(self.min_distances, dist)
+                np.minimum(self.min_distances, dist, out=self.min_distances)
 
     def select_batch_(self, model, already_selected, N, **kwargs):
         """
@@ -87,7 +129,8 @@ class KCenterGreedy(Sampler):
             # Assumes that the transform function takes in original data and not
             # flattened data.
             print('Getting transformed features...')
-            self.features = model.transform(self.X)
+            self.features = self.transform(model)
+            self.sq_norms = None
             print('Calculating distances...')
             self.update_distances(already_selected, only_new=False, reset_dist=True)
         except:
@@ -110,7 +153,7 @@ class KCenterGreedy(Sampler):
             new_batch.append(ind)
 
         print('Maximum distance from cluster centers is %0.2f'
-                % max(self.min_distances))
+                % np.max(self.min_distances))
 
         self.already_selected = already_selected
         return new_batch
@@ -1,5 +1,4 @@
 import os
-import pickle
 import sys
 import time
 from typing import Any, Dict, List, Optional
@@ -53,9 +52,9 @@ parser.add_argument(
 parser.add_argument(
     "-f",
     "--feat",
-    metavar="PICKLE_FILE",
+    metavar="FEAT_DIR",
     default=None,
-    help="train set feature pkl files.",
+    help="train set feature directory (or pkl file of older versions).",
 )
 parser.add_argument("-bs", "--batch_size", default=32, help="batch size.")
 parser.add_argument(
@@ -104,6 +103,30 @@ parser.add_argument(
     default=9,
     help="the number of neighbors",
 )
+parser.add_argument(
+    "--index",
+    default="flat",
+    choices=("flat", "ivf", "hnsw"),
+    help="nearest neighbor index, ivf and hnsw are approximate and faster for large coreset.",
+)
+parser.add_argument(
+    "--nlist",
+    type=int,
+    default=1024,
+    help="the number of clusters of ivf index",
+)
+parser.add_argument(
+    "--nprobe",
+    type=int,
+    default=8,
+    help="the number of clusters visited by ivf search (larger is more accurate)",
+)
+parser.add_argument(
+    "--ef_search",
+    type=int,
+    default=64,
+    help="the depth of exploration of hnsw search (larger is more accurate)",
+)
 args = update_parser(parser)
 
 
@@ -214,12 +237,11 @@ def train_from_image_or_video(net: ailia.wrapper.Net, params: Dict[str, Any]):
         train_feat_file = args.feat
     else:
         train_dir = args.train_dir
-        train_feat_file = "%s.pkl" % os.path.basename(train_dir)
+        train_feat_file = "%s_feat" % os.path.splitext(os.path.basename(os.path.normpath(train_dir)))[0]
 
     logger.info("saving train set feature to : %s ..." % train_feat_file)
 
-    with open(train_feat_file, "wb") as f:
-        pickle.dump(train_outputs, f)
+    save_train_outputs(train_feat_file, train_outputs, params)
 
     logger.info("saved.")
     return train_outputs
@@ -388,11 +410,21 @@ def infer_from_video(
 def train_and_infer(net: ailia.wrapper.Net, params: Dict[str, Any]):
     if args.feat:
         logger.info('loading train set feature from: %s' % args.feat)
-        with open(args.feat, 'rb') as f:
-            embedding_coreset = pickle.load(f)
+        embedding_coreset = load_train_outputs(args.feat, params)
         logger.info('loaded.')
     else:
         embedding_coreset = train_from_image_or_video(net, params)
+        if embedding_coreset is None:
+            return
+
+    # build the nearest neighbor index once and share it for all images
+    index = build_index(
+        embedding_coreset,
+        index_type=args.index,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        ef_search=args.ef_search,
+    )
 
     if args.threshold is None:
         if args.video:
@@ -407,16 +439,16 @@ def train_and_infer(net: ailia.wrapper.Net, params: Dict[str, Any]):
 
             gt_imgs = load_gt_imgs(gt_type_dir)
 
-            threshold = decide_threshold_from_gt_image(net, params, embedding_coreset, gt_imgs)
+            threshold = decide_threshold_from_gt_image(net, params, index, gt_imgs)
             logger.info('Optimal threshold: %f' % threshold)
     else:
         threshold = args.threshold
         gt_imgs = None
 
     if args.video:
-        infer_from_video(net, params, embedding_coreset, threshold)
+        infer_from_video(net, params, index, threshold)
     else:
-        infer_from_image(net, params, embedding_coreset, threshold, gt_imgs)
+        infer_from_image(net, params, index, threshold, gt_imgs)
     logger.info('Script finished successfully.')
 
 
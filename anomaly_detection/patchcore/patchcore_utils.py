@@ -1,18 +1,17 @@
-from tqdm import tqdm
 import logging
 import os
 import sys
 import pickle
 from collections import OrderedDict
-from itertools import product
 from typing import Any, Dict, List, Tuple
 
 import ailia
 import cv2
-import faiss
 import numpy as np
 from detector_utils import load_image  # noqa: E402
 from image_utils import normalize_image  # noqa: E402
+from functional import embedding_concat  # noqa: E402
+from feature_store_utils import save_feature_store, load_feature_store, check_header  # noqa: E402
 from PIL import Image
 from scipy.ndimage import gaussian_filter
 from skimage import morphology
@@ -22,6 +21,13 @@ from sklearn.random_projection import SparseRandomProjection
 
 from k_center_greedy import KCenterGreedy
 
+try:
+    import faiss
+except ModuleNotFoundError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
 IMAGE_SIZE = 224
 
 WEIGHT_RESNET18_PATH = "resnet18.onnx"
@@ -116,45 +122,6 @@ def visualize(
     return heat_map, mask, vis_img
 
 
-def embedding_concat(x: np.ndarray, y: np.ndarray) -> np.ndarray:
-    """
-    Concatenate feature maps
-
-    Args:
-        x np.ndarray: feature maps
-        y np.ndarray: feature maps
-
-    Returns:
-        np.ndarray: concatenated feature maps
-    """
-    B, C1, H1, W1 = x.shape
-    _, C2, H2, W2 = y.shape
-
-    if not H1 == W1:
-        raise Exception("Invalid shape")
-
-    s = H1 // H2
-    sel = [np.array([i for i in range(i, H1, s)]) for i in range(s)]
-
-    a = np.zeros((B, C1 * s * s, H2 * W2))
-    for b, c, i in product(range(B), range(C1), range(s * s)):
-        a[b, c * s * s + i, :] = x[b, c, sel[i // s][:, None], sel[i % s]].flatten()
-
-    x = a.reshape((B, C1, -1, H2, W2))
-    z = np.zeros((B, C1 + C2, s * s, H2, W2))
-    for i in range(s * s):
-        z[:, :, i, :, :] = np.concatenate((x[:, :, i, :, :], y), axis=1)
-    z = z.reshape((B, -1, H2 * W2))
-
-    _, C3, _ = z.shape
-    a = np.zeros((B, C3 // (s * s), H1, W1))
-    for b, c, i in product(range(B), range(C3 // (s * s)), range(s * s)):
-        x = z[b, c * s * s + i, :].reshape((H2, W2))
-        a[b, c, sel[i // s][:, None], sel[i % s]] = x
-
-    return a
-
-
 def preprocess(
     img: np.ndarray, size: int, mask: bool = False, keep_aspect: bool = True
 ) -> np.ndarray:
@@ -245,14 +212,19 @@ def generate_dataset_from_video(
     return train_imgs
 
 
-def reshape_embedding(embedding: np.ndarray) -> List[np.ndarray]:
-    embedding_list = []
-    B, _, H, W = embedding.shape
+def reshape_embedding(embedding: np.ndarray) -> np.ndarray:
+    """
+    Reshape feature maps to the list of feature vectors at every pixel
+
+    Args:
+        embedding np.ndarray: (B, C, H, W) feature maps
 
-    for b, h, w in tqdm(product(range(B), range(H), range(W)), total=B*H*W):
-        embedding_list.append(embedding[b, :, h, w])
+    Returns:
+        np.ndarray: (B * H * W, C) feature vectors
+    """
+    B, C, H, W = embedding.shape
 
-    return embedding_list
+    return embedding.transpose(0, 2, 3, 1).reshape(B * H * W, C)
 
 
 def training(
@@ -338,7 +310,7 @@ def training(
                     (embedding_vectors, _embedding_vectors), axis=0
                 )
 
-    embedding_vectors = np.array(reshape_embedding(embedding_vectors))
+    embedding_vectors = reshape_embedding(embedding_vectors)
     randomprojector = SparseRandomProjection(
         n_components="auto", eps=0.9
     )  # 'auto' => Johnson-Lindenstrauss lemma
@@ -354,16 +326,163 @@ def training(
     print("initial embedding size : ", embedding_vectors.shape)  #  (245760, 1536)
     print("final embedding size : ", embedding_coreset.shape)
 
-    index = faiss.IndexFlatL2(embedding_coreset.shape[1])
-    index.add(embedding_coreset)
-    os.makedirs("embeddings/", exist_ok=True)
-    faiss.write_index(index, "embeddings/index.faiss")
     return embedding_coreset
 
 
+def save_train_outputs(
+    path: str, embedding_coreset: np.ndarray, params: Dict[str, Any]
+):
+    """
+    Save embedding coreset as a feature store directory which can be memory-mapped
+
+    Args:
+        path str: directory to save
+        embedding_coreset np.ndarray: embedding coreset
+        params Dict[str, Any]: parameters returned by get_params
+    """
+    header = {
+        "model": "patchcore",
+        "arch": params["arch"],
+        "feat_names": list(params["feat_names"]),
+        "crop_size": IMAGE_SIZE,
+        "idx": None,
+    }
+    arrays = {
+        "embedding_coreset": embedding_coreset.astype(np.float32, copy=False),
+    }
+    save_feature_store(path, header, arrays)
+
+
+def load_train_outputs(path: str, params: Dict[str, Any]) -> np.ndarray:
+    """
+    Load embedding coreset saved by save_train_outputs, or a pickle file of older versions
+
+    Args:
+        path str: feature store directory or pickle file
+        params Dict[str, Any]: parameters returned by get_params
+
+    Returns:
+        np.ndarray: embedding coreset
+    """
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    header, arrays = load_feature_store(path)
+    check_header(
+        header,
+        model="patchcore",
+        arch=params["arch"],
+        feat_names=params["feat_names"],
+        crop_size=IMAGE_SIZE,
+    )
+
+    return arrays["embedding_coreset"]
+
+
+class NumpyIndexFlatL2:
+    """
+    Exact nearest neighbor search with NumPy, used when faiss is not installed.
+    Same interface and results (squared L2 distances) as faiss.IndexFlatL2.
+    """
+
+    def __init__(self, d: int, chunk_size: int = 4096):
+        self.d = d
+        self.chunk_size = chunk_size
+        self.xb = np.zeros((0, d), dtype=np.float32)
+        self.xb_sq_norms = np.zeros((0,), dtype=np.float32)
+
+    @property
+    def ntotal(self) -> int:
+        return self.xb.shape[0]
+
+    def add(self, x: np.ndarray):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        self.xb = np.vstack((self.xb, x))
+        self.xb_sq_norms = np.einsum("ij,ij->i", self.xb, self.xb)
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        k = min(k, self.ntotal)
+        D = np.zeros((x.shape[0], k), dtype=np.float32)
+        I = np.zeros((x.shape[0], k), dtype=np.int64)
+        for i in range(0, x.shape[0], self.chunk_size):
+            q = x[i : i + self.chunk_size]
+            dist = (
+                np.einsum("ij,ij->i", q, q)[:, None]
+                - 2 * (q @ self.xb.T)
+                + self.xb_sq_norms[None, :]
+            )
+            np.maximum(dist, 0, out=dist)
+            if k < dist.shape[1]:
+                idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            else:
+                idx = np.broadcast_to(np.arange(dist.shape[1]), dist.shape)
+            d = np.take_along_axis(dist, idx, axis=1)
+            order = np.argsort(d, axis=1)
+            D[i : i + self.chunk_size] = np.take_along_axis(d, order, axis=1)
+            I[i : i + self.chunk_size] = np.take_along_axis(idx, order, axis=1)
+        return D, I
+
+
+def build_index(
+    embedding_coreset: np.ndarray,
+    index_type: str = "flat",
+    nlist: int = 1024,
+    nprobe: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 40,
+    ef_search: int = 64,
+):
+    """
+    Build nearest neighbor index of embedding coreset.
+    Build it once and pass it to infer.
+
+    Args:
+        embedding_coreset np.ndarray: embedding coreset
+        index_type str: "flat" (exact), "ivf" or "hnsw" (approximate)
+        nlist int: the number of clusters of "ivf"
+        nprobe int: the number of clusters visited by "ivf" search, larger is more accurate and slower
+        hnsw_m int: the number of links per node of "hnsw"
+        ef_construction int: the depth of exploration on building "hnsw"
+        ef_search int: the depth of exploration on searching "hnsw", larger is more accurate and slower
+
+    Returns:
+        index for searching nearest neighbors, faiss.Index or NumpyIndexFlatL2
+    """
+    embedding_coreset = np.ascontiguousarray(embedding_coreset, dtype=np.float32)
+    n, d = embedding_coreset.shape
+
+    if faiss is None:
+        if index_type != "flat":
+            logger.warning(
+                "faiss is not installed, so use exact search with NumPy instead of %s"
+                % index_type
+            )
+        index = NumpyIndexFlatL2(d)
+    elif index_type == "flat":
+        index = faiss.IndexFlatL2(d)
+    elif index_type == "ivf":
+        nlist = max(1, min(nlist, n))
+        quantizer = faiss.IndexFlatL2(d)
+        index = faiss.IndexIVFFlat(quantizer, d, nlist)
+        index.train(embedding_coreset)
+        index.nprobe = min(nprobe, nlist)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+    else:
+        raise ValueError("Unknown index type: %s" % index_type)
+
+    index.add(embedding_coreset)
+    return index
+
+
 def get_params(arch: str, n_neighbors: int) -> Tuple[str, str, Dict[str, Any]]:
     weight_path, model_path, feat_names, t_d, d = MODEL_SETTINGS[arch]
     params = {
+        "arch": arch,
         "feat_names": feat_names,
         "t_d": t_d,
         "d": d,
@@ -421,7 +540,7 @@ def cvt2heatmap(gray: np.ndarray) -> np.ndarray:
 def infer(
     net: ailia.wrapper.Net,
     params: Dict[str, Any],
-    embedding_coreset: np.ndarray,
+    index: Any,
     img: np.ndarray,
 ):
     height, width = img.shape[-2:]
@@ -435,8 +554,7 @@ def infer(
 
     embedding_vectors = concat_embedding_layers(test_outputs)
 
-    index = faiss.read_index("embeddings/index.faiss")
-    embedding_test = np.array(reshape_embedding(embedding_vectors))
+    embedding_test = reshape_embedding(embedding_vectors)
     score_patches, _ = index.search(embedding_test, k=params["n_neighbors"])
 
     anomaly_map = score_patches[:, 0].reshape((56, 56))
@@ -237,6 +237,7 @@ class Inference(BaseInference):
         waveform: np.ndarray,
         sample_rate: int,
         hook: Optional[Callable],
+        callback: Optional[Callable] = None,
     ) -> Union[SlidingWindowFeature, Tuple[SlidingWindowFeature]]:
         """Slide model on a waveform
 
@@ -251,6 +252,11 @@ class Inference(BaseInference):
             processed with two keyword arguments:
             - `completed`: the number of chunks that have been processed so far
             - `total`: the total number of chunks
+        callback: Optional[Callable]
+            When a callable is provided, it is called everytime a batch is
+            processed with the index of the first chunk of the batch and the
+            (tuple of) batch output, e.g. to start processing the first chunks
+            while the model is still sliding over the next ones.
 
         Returns
         -------
@@ -334,6 +340,9 @@ class Inference(BaseInference):
                 self.specifications, __append_batch, outputs, batch_outputs
             )
 
+            if callback is not None:
+                callback(c, batch_outputs)
+
             if hook is not None:
                 hook(completed=c + self.batch_size, total=num_chunks + has_last_chunk)
 
@@ -346,6 +355,9 @@ class Inference(BaseInference):
                 self.specifications, __append_batch, outputs, last_outputs
             )
 
+            if callback is not None:
+                callback(num_chunks, last_outputs)
+
             if hook is not None:
                 hook(
                     completed=num_chunks + has_last_chunk,
@@ -387,7 +399,10 @@ class Inference(BaseInference):
         )
 
     def __call__(
-        self, file: AudioFile, hook: Optional[Callable] = None
+        self,
+        file: AudioFile,
+        hook: Optional[Callable] = None,
+        callback: Optional[Callable] = None,
     ) -> Union[
         Tuple[Union[SlidingWindowFeature, np.ndarray]],
         Union[SlidingWindowFeature, np.ndarray],
@@ -403,6 +418,9 @@ class Inference(BaseInference):
             with two keyword arguments:
             - `completed`: the number of chunks that have been processed so far
             - `total`: the total number of chunks
+        callback : callable, optional
+            When a callable is provided, it is called everytime a batch is processed
+            with the index of its first chunk and its output (see `slide`).
 
         Returns
         -------
@@ -415,7 +433,7 @@ class Inference(BaseInference):
         waveform, sample_rate = self.audio(file)
         
         if self.window == "sliding":
-            return self.slide(waveform, sample_rate, hook=hook)
+            return self.slide(waveform, sample_rate, hook=hook, callback=callback)
  
 
     @staticmethod
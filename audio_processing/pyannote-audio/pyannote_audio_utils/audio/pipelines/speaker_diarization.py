@@ -23,13 +23,13 @@
 """Speaker diarization pipelines"""
 
 import functools
-import itertools
 import math
 import textwrap
 import warnings
 import numpy as np
 
-from typing import Callable, Optional, Text, Union, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Text, Tuple, Union, Mapping
 from pathlib import Path
 
 from pyannote_audio_utils.core import Annotation, SlidingWindow, SlidingWindowFeature
@@ -37,18 +37,15 @@ from pyannote_audio_utils.pipeline.parameter import ParamDict, Uniform
 from pyannote_audio_utils.audio import Audio, Inference, Pipeline
 from pyannote_audio_utils.audio.core.io import AudioFile
 from pyannote_audio_utils.audio.pipelines.clustering import Clustering
-from pyannote_audio_utils.audio.pipelines.speaker_verification import ONNXWeSpeakerPretrainedSpeakerEmbedding
+from pyannote_audio_utils.audio.pipelines.speaker_verification import (
+    ONNXWeSpeakerPretrainedSpeakerEmbedding,
+    interpolate_masks,
+)
 from pyannote_audio_utils.audio.pipelines.utils import SpeakerDiarizationMixin
 
 AudioFile = Union[Text, Path, Mapping]
 PipelineModel = Union[Text, Mapping]
 
-def batchify(iterable, batch_size: int = 32, fillvalue=None):
-    """Batchify iterable"""
-    # batchify('ABCDEFG', 3) --> ['A', 'B', 'C']  ['D', 'E', 'F']  [G, ]
-    args = [iter(iterable)] * batch_size
-    return itertools.zip_longest(*args, fillvalue=fillvalue)
-
 
 class SpeakerDiarization(SpeakerDiarizationMixin, Pipeline):
     """Speaker diarization pipeline
@@ -163,13 +160,16 @@ class SpeakerDiarization(SpeakerDiarizationMixin, Pipeline):
         self.clustering = Klustering.value(metric=metric)
 
 
-    def get_segmentations(self, file, hook=None) -> SlidingWindowFeature:
+    def get_segmentations(self, file, hook=None, callback=None) -> SlidingWindowFeature:
         """Apply segmentation model
 
         Parameter
         ---------
         file : AudioFile
         hook : Optional[Callable]
+        callback : Optional[Callable]
+            Called with the index of the first chunk and the segmentation of
+            every batch of chunks, as soon as it is processed.
 
         Returns
         -------
@@ -178,7 +178,9 @@ class SpeakerDiarization(SpeakerDiarizationMixin, Pipeline):
         
         if hook is not None:
             hook = functools.partial(hook, "segmentation", None)
-        segmentations: SlidingWindowFeature = self._segmentation(file, hook=hook)
+        segmentations: SlidingWindowFeature = self._segmentation(
+            file, hook=hook, callback=callback
+        )
 
         return segmentations
 
@@ -205,107 +207,231 @@ class SpeakerDiarization(SpeakerDiarizationMixin, Pipeline):
         Returns
         -------
         embeddings : (num_chunks, num_speakers, dimension) array
+            NaN for inactive (or not active long enough) speakers.
         """
 
         # when optimizing the hyper-parameters of this pipeline with frozen
         # "segmentation.threshold", one can reuse the embeddings from the first trial,
         # bringing a massive speed up to the optimization process (and hence allowing to use
         # a larger search space).
-   
-        duration = binary_segmentations.sliding_window.duration
-        num_chunks, num_frames, num_speakers = binary_segmentations.data.shape
+
+        waveform, _ = self._audio(file)
+        chunks = binary_segmentations.sliding_window
+        num_chunks = len(binary_segmentations.data)
+        batch_size = max(1, self.embedding_batch_size)
+
+        def inputs(start: int):
+            masks = binary_segmentations.data[start : start + batch_size]
+            return self._embedding_inputs(waveform, chunks, start, masks, exclude_overlap)
+
+        starts = list(range(0, num_chunks, batch_size))
+        batch_count = len(starts)
+
+        if hook is not None:
+            hook("embeddings", None, total=batch_count, completed=0)
+
+        embedding_batches = []
+
+        # prepare (waveform, features, masks) of next batch
+        # while embedding model processes current one
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_inputs = executor.submit(inputs, starts[0]) if starts else None
+            for i, start in enumerate(starts, 1):
+                masks, features = next_inputs.result()
+                if i < batch_count:
+                    next_inputs = executor.submit(inputs, starts[i])
+
+                embedding_batch = self._embed(masks, features)
+                # (num_chunks_in_batch, num_speakers, dimension) np.ndarray
+
+                embedding_batches.append(embedding_batch)
+
+                if hook is not None:
+                    hook("embeddings", embedding_batch, total=batch_count, completed=i)
+
+        return np.vstack(embedding_batches)
+
+    def get_segmentations_and_embeddings(
+        self,
+        file,
+        exclude_overlap: bool = False,
+        hook: Optional[Callable] = None,
+    ) -> Tuple[SlidingWindowFeature, np.ndarray]:
+        """Apply segmentation model and extract embeddings concurrently
+
+        Same as `get_segmentations` followed by `get_embeddings`, except that
+        embeddings of every batch of chunks are extracted (in another thread)
+        as soon as its segmentation is available, while the segmentation model
+        processes the next batch.
+
+        Parameters
+        ----------
+        file : AudioFile
+        exclude_overlap : bool, optional
+            Exclude overlapping speech regions when extracting embeddings.
+        hook : Optional[Callable]
+
+        Returns
+        -------
+        segmentations : (num_chunks, num_frames, num_speakers) SlidingWindowFeature
+        embeddings : (num_chunks, num_speakers, dimension) array
+        """
+
+        waveform, _ = self._audio(file)
+        chunks = SlidingWindow(
+            start=0.0, duration=self._segmentation.duration, step=self._segmentation.step
+        )
+
+        def embed(start: int, masks: np.ndarray) -> np.ndarray:
+            return self._embed(
+                *self._embedding_inputs(waveform, chunks, start, masks, exclude_overlap)
+            )
+
+        # segmentation and embedding models run in different threads,
+        # each model being only used by one thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            embedding_batches = []
+
+            def callback(start: int, masks: np.ndarray):
+                embedding_batches.append(executor.submit(embed, start, masks))
+
+            segmentations = self.get_segmentations(file, hook=hook, callback=callback)
+
+            batch_count = len(embedding_batches)
+            if hook is not None:
+                hook("embeddings", None, total=batch_count, completed=0)
+
+            for i, future in enumerate(embedding_batches, 1):
+                embedding_batches[i - 1] = future.result()
+                if hook is not None:
+                    hook("embeddings", embedding_batches[i - 1], total=batch_count, completed=i)
+
+        embeddings = np.vstack(embedding_batches)
+
+        return segmentations, embeddings
+
+    def _embedding_inputs(
+        self,
+        waveform: np.ndarray,
+        chunks: SlidingWindow,
+        start: int,
+        binary_segmentations: np.ndarray,
+        exclude_overlap: bool = False,
+    ) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """Masks and features of a batch of chunks
+
+        Parameters
+        ----------
+        waveform : (1, num_samples) np.ndarray
+            Whole waveform.
+        chunks : SlidingWindow
+            Chunks sliding window.
+        start : int
+            Index of the first chunk of the batch.
+        binary_segmentations : (num_chunks, num_frames, num_speakers) np.ndarray
+            Binarized segmentation of the chunks of the batch.
+        exclude_overlap : bool, optional
+            See `get_embeddings`.
+
+        Returns
+        -------
+        masks : (num_chunks, num_speakers, num_fbank_frames) np.ndarray
+            Binary masks, resampled to fbank frames. All-zero for speakers
+            that are not active long enough to extract an embedding.
+        features : list of (num_fbank_frames, num_mel_bins) np.ndarray
+            Fbank features of every chunk (None for chunks with no active speaker).
+        """
+
+        num_chunks, num_frames, num_speakers = binary_segmentations.shape
+        duration = chunks.duration
+        sample_rate = self._embedding.sample_rate
+        num_samples = math.floor(duration * sample_rate)
 
         if exclude_overlap:
-            
             # minimum number of samples needed to extract an embedding
             # (a lower number of samples would result in an error)
             min_num_samples = self._embedding.min_num_samples
 
             # corresponding minimum number of frames
-            num_samples = duration * self._embedding.sample_rate
-            min_num_frames = math.ceil(num_frames * min_num_samples / num_samples)
+            min_num_frames = math.ceil(num_frames * min_num_samples / (duration * sample_rate))
 
             # zero-out frames with overlapping speech
             clean_frames = 1.0 * (
-                np.sum(binary_segmentations.data, axis=2, keepdims=True) < 2
-            )
-            clean_segmentations = SlidingWindowFeature(
-                binary_segmentations.data * clean_frames,
-                binary_segmentations.sliding_window,
+                np.sum(binary_segmentations, axis=2, keepdims=True) < 2
             )
-        
+            clean_segmentations = binary_segmentations * clean_frames
+
         else:
             min_num_frames = -1
-            clean_segmentations = SlidingWindowFeature(
-                binary_segmentations.data, binary_segmentations.sliding_window
-            )
-        
-        def iter_waveform_and_mask():
-            for (chunk, masks), (_, clean_masks) in zip(binary_segmentations, clean_segmentations):
-                # chunk: Segment(t, t + duration)
-                # masks: (num_frames, local_num_speakers) np.ndarray
-
-                waveform, _ = self._audio.crop(
-                    file,
-                    chunk,
-                    duration=duration,
-                    mode="pad",
-                )
-                # waveform: (1, num_samples) torch.Tensor
-
-                # mask may contain NaN (in case of partial stitching)
-                masks = np.nan_to_num(masks, nan=0.0).astype(np.float32)
-                clean_masks = np.nan_to_num(clean_masks, nan=0.0).astype(np.float32)
-
-                for mask, clean_mask in zip(masks.T, clean_masks.T):
-                    # mask: (num_frames, ) np.ndarray
-
-                    if np.sum(clean_mask) > min_num_frames:
-                        used_mask = clean_mask
-                    else:
-                        used_mask = mask
-
-                    # yield waveform[None], torch.from_numpy(used_mask)[None]
-                    yield waveform[None], used_mask[None]
-                    
-                    # w: (1, 1, num_samples) torch.Tensor
-                    # m: (1, num_frames) torch.Tensor
-
-        batches = batchify(
-            iter_waveform_and_mask(),
-            batch_size=self.embedding_batch_size,
-            fillvalue=(None, None),
+            clean_segmentations = binary_segmentations
+
+        # mask may contain NaN (in case of partial stitching)
+        masks = np.nan_to_num(binary_segmentations, nan=0.0).astype(np.float32)
+        clean_masks = np.nan_to_num(clean_segmentations, nan=0.0).astype(np.float32)
+
+        # use non-overlapping speech, unless it is too short
+        use_clean = np.sum(clean_masks, axis=1, keepdims=True) > min_num_frames
+        masks = np.where(use_clean, clean_masks, masks).transpose(0, 2, 1)
+        # (num_chunks, num_speakers, num_frames) np.ndarray
+
+        num_fbank_frames = self._embedding.num_frames(num_samples)
+        masks = interpolate_masks(
+            masks.reshape(-1, num_frames), num_fbank_frames
+        ).reshape(num_chunks, num_speakers, num_fbank_frames) > 0.5
+
+        # drop (chunk, speaker) pairs that are too short to be embedded
+        masks &= (
+            np.sum(masks, axis=2, keepdims=True) >= self._embedding.min_num_frames
         )
-        
 
-        batch_count = math.ceil(num_chunks * num_speakers / self.embedding_batch_size)
+        # chunks are views of the waveform (zero-padded past its end)
+        features = [None] * num_chunks
+        active = np.flatnonzero(np.any(masks, axis=(1, 2)))
+        waveforms = []
+        for c in active:
+            start_sample = math.floor(chunks[start + c].start * sample_rate)
+            chunk = waveform[:, start_sample : start_sample + num_samples]
+            if chunk.shape[1] < num_samples:
+                chunk = np.pad(chunk, ((0, 0), (0, num_samples - chunk.shape[1])))
+            waveforms.append(chunk)
 
-        embedding_batches = []
+        if waveforms:
+            for c, feature in zip(active, self._embedding.compute_fbank(waveforms)):
+                features[c] = feature
 
-        if hook is not None:
-            hook("embeddings", None, total=batch_count, completed=0)
+        return masks, features
 
-        for i, batch in enumerate(batches, 1):
-            waveforms, masks = zip(*filter(lambda b: b[0] is not None, batch))
+    def _embed(self, masks: np.ndarray, features: List[np.ndarray]) -> np.ndarray:
+        """Extract embeddings of a batch of chunks
 
-            waveform_batch = np.vstack(waveforms)
-            # (batch_size, 1, num_samples) torch.Tensor
+        Parameters
+        ----------
+        masks, features :
+            See `_embedding_inputs`.
 
-            mask_batch = np.vstack(masks)
-            # (batch_size, num_frames) torch.Tensor
-            
-            embedding_batch: np.ndarray = self._embedding(
-                waveform_batch, masks=mask_batch
-            )
-            # (batch_size, dimension) np.ndarray
+        Returns
+        -------
+        embeddings : (num_chunks, num_speakers, dimension) np.ndarray
+            NaN for speakers with an all-zero mask.
+        """
 
-            embedding_batches.append(embedding_batch)
+        num_chunks, num_speakers, _ = masks.shape
+        embeddings = np.NAN * np.zeros((num_chunks, num_speakers, self._embedding.dimension))
 
-            if hook is not None:
-                hook("embeddings", embedding_batch, total=batch_count, completed=i)
-        
-        embedding_batches = np.vstack(embedding_batches)
-        embeddings = embedding_batches.reshape([num_chunks, -1 , embedding_batches.shape[-1]])
+        # sort (chunk, speaker) pairs by active duration, so that
+        # features of the same length are batched together
+        chunk_index, speaker_index = np.nonzero(np.any(masks, axis=2))
+        durations = np.sum(masks[chunk_index, speaker_index], axis=1)
+        order = np.argsort(-durations, kind="stable")
+        chunk_index, speaker_index = chunk_index[order], speaker_index[order]
+
+        masked_features = [
+            features[c][masks[c, s]] for c, s in zip(chunk_index, speaker_index)
+        ]
+        if masked_features:
+            embeddings[chunk_index, speaker_index] = self._embedding.embed_features(
+                masked_features, batch_size=max(1, self.embedding_batch_size)
+            )
 
         return embeddings
 
@@ -410,7 +536,12 @@ class SpeakerDiarization(SpeakerDiarizationMixin, Pipeline):
             max_speakers=max_speakers,
         )
         
-        segmentations = self.get_segmentations(file, hook=hook)
+        # embeddings are extracted while the segmentation model is running
+        segmentations, embeddings = self.get_segmentations_and_embeddings(
+            file,
+            exclude_overlap=self.embedding_exclude_overlap,
+            hook=hook,
+        )
         hook("segmentation", segmentations)
         #   shape: (num_chunks, num_frames, local_num_speakers)
 
@@ -435,13 +566,6 @@ class SpeakerDiarization(SpeakerDiarizationMixin, Pipeline):
 
             return diarization
 
-        embeddings = self.get_embeddings(
-            file,
-            binarized_segmentations,
-            exclude_overlap=self.embedding_exclude_overlap,
-            hook=hook,
-        )
-        
         hook("embeddings", embeddings)
         #   shape: (num_chunks, local_num_speakers, dimension)
 
@@ -21,8 +21,9 @@
 # SOFTWARE.
 
 
+import warnings
 from functools import cached_property
-from typing import Optional, Text, Union, Mapping
+from typing import Optional, Sequence, Text, Union, Mapping
 
 import numpy as np
 import ailia
@@ -32,6 +33,23 @@ from pyannote_audio_utils.audio.core.inference import BaseInference
 
 PipelineModel = Union[Text, Mapping]
 
+
+def interpolate_masks(masks: np.ndarray, num_frames: int) -> np.ndarray:
+    """Nearest-neighbor interpolation of masks to `num_frames` frames
+
+    Parameters
+    ----------
+    masks : (batch_size, num_mask_frames) np.ndarray
+
+    Returns
+    -------
+    interpolated : (batch_size, num_frames) np.ndarray
+    """
+    _, num_mask_frames = masks.shape
+    index = np.floor(np.arange(num_frames) * num_mask_frames / num_frames).astype(np.int64)
+    return masks[:, index].astype(np.float64)
+
+
 class ONNXWeSpeakerPretrainedSpeakerEmbedding(BaseInference):
     """Pretrained WeSpeaker speaker embedding
 
@@ -101,6 +119,10 @@ class ONNXWeSpeakerPretrainedSpeakerEmbedding(BaseInference):
             self.session_ = ailia.Net(emb_path, weight=embedding, env_id=args.env_id)
         
         self.args = args
+
+        # whether the model accepts a batch of features
+        self.batch_features = True
+        self._num_frames = {}
  
     @cached_property
     def sample_rate(self) -> int:
@@ -154,6 +176,13 @@ class ONNXWeSpeakerPretrainedSpeakerEmbedding(BaseInference):
     def min_num_frames(self) -> int:
         return self.compute_fbank(np.random.randn(1, 1, self.min_num_samples)).shape[1]
 
+    def num_frames(self, num_samples: int) -> int:
+        """Number of fbank frames of a `num_samples` long waveform"""
+        if num_samples not in self._num_frames:
+            features = self.compute_fbank(np.zeros((1, 1, num_samples)))
+            self._num_frames[num_samples] = features.shape[1]
+        return self._num_frames[num_samples]
+
     def compute_fbank(
         self,
         waveforms: np.ndarray,
@@ -167,6 +196,9 @@ class ONNXWeSpeakerPretrainedSpeakerEmbedding(BaseInference):
         Parameters
         ----------
         waveforms : (batch_size, num_channels, num_samples)
+            Batch of waveforms, or sequence of (num_channels, num_samples)
+            waveforms with the same number of samples (e.g. views of a longer
+            waveform, which are not copied into a batch).
 
         Returns
         -------
@@ -174,12 +206,10 @@ class ONNXWeSpeakerPretrainedSpeakerEmbedding(BaseInference):
 
         Source: https://github.com/wenet-e2e/wespeaker/blob/45941e7cba2c3ea99e232d02bedf617fc71b0dad/wespeaker/bin/infer_onnx.py#L30C1-L50
         """
-        
-        waveforms = waveforms * (1 << 15)
 
         ### ここで少しずれる ###
         features_numpy = np.stack([compute_fbank_feats(
-            waveform=waveform[0],
+            waveform=waveform[0] * (1 << 15),
             num_mel_bins=num_mel_bins,
             frame_length=frame_length,
             frame_shift=frame_shift,
@@ -194,6 +224,84 @@ class ONNXWeSpeakerPretrainedSpeakerEmbedding(BaseInference):
  
         return features - np.mean(features, axis=1, keepdims=True)
 
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Run the model
+
+        Parameters
+        ----------
+        features : (batch_size, num_frames, num_mel_bins) np.ndarray
+
+        Returns
+        -------
+        embeddings : (batch_size, dimension) np.ndarray
+        """
+        if self.batch_features and 1 < len(features):
+            try:
+                embeddings = self._predict(features)
+                if len(embeddings) == len(features):
+                    return embeddings
+            except self._batch_errors():
+                pass
+            # e.g. model exported with a fixed batch size
+            warnings.warn(
+                "Speaker embedding model does not accept a batch of features: "
+                "running them one by one."
+            )
+            self.batch_features = False
+
+        return np.concatenate([self._predict(feature[None]) for feature in features])
+
+    def _batch_errors(self):
+        """Errors raised by the runtime for an input shape the model does not accept"""
+        if self.args.onnx:
+            from onnxruntime.capi.onnxruntime_pybind11_state import InvalidArgument
+
+            return (InvalidArgument,)
+        names = (
+            "AiliaInvalidArgumentException",
+            "AiliaInvalidLayerException",
+            "AiliaUnsettledShapeException",
+        )
+        return tuple(getattr(ailia, name) for name in names if hasattr(ailia, name))
+
+    def _predict(self, features: np.ndarray) -> np.ndarray:
+        if self.args.onnx:
+            return self.session_.run(output_names=["embs"], input_feed={"feats": features})[0]
+        return self.session_.predict([features])[0]
+
+    def embed_features(
+        self, features: Sequence[np.ndarray], batch_size: int = 32
+    ) -> np.ndarray:
+        """Extract embeddings from (masked) features
+
+        Features of the same length are run through the model as a batch,
+        so sorting them by length beforehand yields fuller batches.
+
+        Parameters
+        ----------
+        features : sequence of (num_frames, num_mel_bins) np.ndarray
+            Features (with at least `min_num_frames` frames).
+        batch_size : int, optional
+            Maximum batch size.
+
+        Returns
+        -------
+        embeddings : (len(features), dimension) np.ndarray
+        """
+        embeddings = np.zeros((len(features), self.dimension))
+
+        start = 0
+        while start < len(features):
+            num_frames = len(features[start])
+            end = start + 1
+            while end < len(features) and end - start < batch_size \
+                    and len(features[end]) == num_frames:
+                end += 1
+            embeddings[start:end] = self.predict(np.stack(features[start:end]))
+            start = end
+
+        return embeddings
+
     def __call__(
         self, waveforms: np.ndarray, masks: Optional[np.ndarray] = None
     ) -> np.ndarray:
@@ -219,31 +327,17 @@ class ONNXWeSpeakerPretrainedSpeakerEmbedding(BaseInference):
 
         batch_size_masks, _ = masks.shape
         assert batch_size == batch_size_masks
-        
-        def interpolate_numpy(input_array, size):
-            output_array = np.zeros((input_array.shape[0],size))
-            
-            for i in range(output_array.shape[0]):
-                for j in range(output_array.shape[1]):
-                    ii = int(np.floor(i * input_array.shape[0] / output_array.shape[0]))
-                    jj = int(np.floor(j * input_array.shape[1] / output_array.shape[1]))
-                    output_array[i, j] = input_array[ii, jj]
-            return output_array
-
-        imasks = interpolate_numpy(masks,size=num_frames)
+
+        imasks = interpolate_masks(masks, num_frames)
         imasks = imasks > 0.5
         
         embeddings = np.NAN * np.zeros((batch_size, self.dimension))
 
-        for f, (feature, imask) in enumerate(zip(features, imasks)):
-            masked_feature = feature[imask]
-            if masked_feature.shape[0] < self.min_num_frames:
-                continue
-            
-            if self.args.onnx:
-                embeddings[f] = self.session_.run(output_names=["embs"],input_feed={"feats": masked_feature[None]},)[0][0]
-            else:
-                embeddings[f] = self.session_.predict([masked_feature[None]])[0][0]
+        # skip too short masked features
+        valid = np.flatnonzero(np.sum(imasks, axis=1) >= self.min_num_frames)
+        masked_features = [features[f][imasks[f]] for f in valid]
+        if len(valid) > 0:
+            embeddings[valid] = self.embed_features(masked_features, batch_size=batch_size)
 
         return embeddings
 
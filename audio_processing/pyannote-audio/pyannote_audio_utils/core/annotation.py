@@ -134,6 +134,7 @@ from . import (
 )
 from .segment import Segment, SlidingWindow
 from .timeline import Timeline
+from .utils import intervals
 from .feature import SlidingWindowFeature
 from .utils.generators import string_generator, int_generator
 from .utils.types import Label, Key, Support, LabelGenerator, TrackName, CropMode
@@ -290,6 +291,44 @@ class Annotation:
                 else:
                     yield segment, track
 
+    def _columns(
+        self, labels: Optional[List[Label]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Tracks as columns (one row per track, in chronological order)
+
+        Parameters
+        ----------
+        labels : list, optional
+            Labels used to encode track labels. Defaults to `self.labels()`.
+            Tracks whose label is not in `labels` are skipped.
+
+        Returns
+        -------
+        starts, ends : (n_tracks, ) np.ndarray
+            Start and end times of the tracks.
+        codes : (n_tracks, ) np.ndarray
+            Index of the track labels in `labels`.
+        """
+        if labels is None:
+            labels = self.labels()
+        index = {label: k for k, label in enumerate(labels)}
+
+        starts, ends, codes = [], [], []
+        for segment, tracks in self._tracks.items():
+            for label in tracks.values():
+                code = index.get(label)
+                if code is None:
+                    continue
+                starts.append(segment.start)
+                ends.append(segment.end)
+                codes.append(code)
+
+        return (
+            np.array(starts, dtype=np.float64),
+            np.array(ends, dtype=np.float64),
+            np.array(codes, dtype=np.int64),
+        )
+
     def _updateTimeline(self):
         self._timeline = Timeline(segments=self._tracks, uri=self.uri)
         self._timelineNeedsUpdate = False
@@ -1422,12 +1461,16 @@ class Annotation:
 
         matrix = np.zeros((len(I), len(J)))
 
-        # iterate over intersecting tracks and accumulate durations
-        for (segment, track), (other_segment, other_track) in self.co_iter(other):
-            i = I[self[segment, track]]
-            j = J[other[other_segment, other_track]]
-            duration = (segment & other_segment).duration
-            matrix[i, j] += duration
+        # find all pairs of intersecting tracks at once
+        starts, ends, i = self._columns(i_labels)
+        other_starts, other_ends, j = other._columns(j_labels)
+        k, K = intervals.co_indices(starts, ends, other_starts, other_ends)
+
+        # accumulate durations of their (non-empty) intersection
+        start = intervals.round_time(np.maximum(starts[k], other_starts[K]))
+        end = intervals.round_time(np.minimum(ends[k], other_ends[K]))
+        duration = np.where(intervals.non_empty(start, end), end - start, 0.)
+        np.add.at(matrix, (i[k], j[K]), duration)
 
         return matrix
 
@@ -92,10 +92,12 @@ import warnings
 from typing import (Optional, Iterable, List, Union, Callable,
                     TextIO, Tuple, TYPE_CHECKING, Iterator, Dict, Text)
 
+import numpy as np
 from sortedcontainers import SortedList
 
 from . import PYANNOTE_SEGMENT
 from .segment import Segment
+from .utils import intervals
 from .utils.types import Support, Label, CropMode
 
 
@@ -131,6 +133,13 @@ class Timeline:
     -------
     timeline : Timeline
         New timeline
+
+    Note
+    ----
+    Segments are also stored as arrays of start and end times (see
+    `Timeline.to_arrays`), on which support, crop, gaps, etc. are computed.
+    `Segment` instances are only created when the timeline is iterated, so a
+    timeline created with `Timeline.from_arrays` stays cheap until then.
     """
 
     @classmethod
@@ -139,6 +148,39 @@ class Timeline:
         timeline = cls(segments=segments, uri=uri)
         return timeline
 
+    @classmethod
+    def from_arrays(cls, starts: np.ndarray, ends: np.ndarray,
+                    uri: Optional[str] = None) -> 'Timeline':
+        """Create timeline from arrays of segment boundaries
+
+        Parameters
+        ----------
+        starts, ends : (n, ) np.ndarray
+            Start and end times of the segments, in any order.
+            Empty and duplicate segments are removed.
+        uri : string, optional
+            name of segmented resource
+
+        Returns
+        -------
+        timeline : Timeline
+            New timeline
+        """
+        starts, ends = intervals.normalize(
+            intervals.round_time(starts), intervals.round_time(ends))
+        return cls._from_sorted_arrays(starts, ends, uri=uri)
+
+    @classmethod
+    def _from_sorted_arrays(cls, starts: np.ndarray, ends: np.ndarray,
+                            uri: Optional[str] = None) -> 'Timeline':
+        # starts and ends are expected to be normalized already
+        timeline = cls(uri=uri)
+        timeline._segments_set = None
+        starts.flags.writeable = False
+        ends.flags.writeable = False
+        timeline._starts, timeline._ends = starts, ends
+        return timeline
+
     def __init__(self,
                  segments: Optional[Iterable[Segment]] = None,
                  uri: str = None):
@@ -147,27 +189,82 @@ class Timeline:
 
         # set of segments (used for checking inclusion)
         # Store only non-empty Segments.
-        segments_set = set([segment for segment in segments if segment])
-
-        self.segments_set_ = segments_set
+        self._segments_set = set([segment for segment in segments if segment])
 
         # sorted list of segments (used for sorted iteration)
-        self.segments_list_ = SortedList(segments_set)
+        # and sorted list of (possibly redundant) segment boundaries,
+        # both created on demand
+        self._segments_list = None
+        self._segments_boundaries = None
 
-        # sorted list of (possibly redundant) segment boundaries
-        boundaries = (boundary for segment in segments_set for boundary in segment)
-        self.segments_boundaries_ = SortedList(boundaries)
+        # sorted arrays of segment start and end times, created on demand
+        self._starts = None
+        self._ends = None
 
         # path to (or any identifier of) segmented resource
         self.uri: str = uri
 
+    @property
+    def segments_set_(self) -> set:
+        if self._segments_set is None:
+            self._segments_set = set(self._segments_from_arrays())
+        return self._segments_set
+
+    @property
+    def segments_list_(self) -> SortedList:
+        if self._segments_list is None:
+            if self._segments_set is None:
+                # arrays are already sorted
+                segments = self._segments_from_arrays()
+                self._segments_set = set(segments)
+                self._segments_list = SortedList(segments)
+            else:
+                self._segments_list = SortedList(self._segments_set)
+        return self._segments_list
+
+    @property
+    def segments_boundaries_(self) -> SortedList:
+        if self._segments_boundaries is None:
+            starts, ends = self.to_arrays()
+            self._segments_boundaries = SortedList(
+                np.concatenate([starts, ends]).tolist())
+        return self._segments_boundaries
+
+    def _segments_from_arrays(self) -> List[Segment]:
+        return [Segment(start=start, end=end)
+                for start, end in zip(self._starts.tolist(), self._ends.tolist())]
+
+    def _invalidate_arrays(self):
+        self._starts = None
+        self._ends = None
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Segment boundaries as arrays
+
+        Returns
+        -------
+        starts, ends : (n, ) np.ndarray
+            Read-only start and end times of the segments, in chronological
+            order (see `Timeline.__iter__`).
+        """
+        if self._starts is None:
+            segments = self.segments_list_
+            starts = np.array([segment.start for segment in segments], dtype=np.float64)
+            ends = np.array([segment.end for segment in segments], dtype=np.float64)
+            starts.flags.writeable = False
+            ends.flags.writeable = False
+            self._starts, self._ends = starts, ends
+        return self._starts, self._ends
+
     def __len__(self):
         """Number of segments
 
         >>> len(timeline)  # timeline contains three segments
         3
         """
-        return len(self.segments_set_)
+        if self._segments_set is None:
+            return len(self._starts)
+        return len(self._segments_set)
 
     def __nonzero__(self):
         return self.__bool__()
@@ -180,7 +277,7 @@ class Timeline:
         ... else:
         ...    # timeline is empty
         """
-        return len(self.segments_set_) > 0
+        return len(self) > 0
 
     def __iter__(self) -> Iterable[Segment]:
         """Iterate over segments (in chronological order)
@@ -215,11 +312,16 @@ class Timeline:
         >>> timeline1 == timeline3
         False
         """
+        if self._segments_set is None or other._segments_set is None:
+            starts, ends = self.to_arrays()
+            other_starts, other_ends = other.to_arrays()
+            return np.array_equal(starts, other_starts) and \
+                np.array_equal(ends, other_ends)
         return self.segments_set_ == other.segments_set_
 
     def __ne__(self, other: 'Timeline'):
         """Inequality"""
-        return self.segments_set_ != other.segments_set_
+        return not self == other
 
     def index(self, segment: Segment) -> int:
         """Get index of (existing) segment
@@ -268,11 +370,14 @@ class Timeline:
 
         segments_set_.add(segment)
 
-        self.segments_list_.add(segment)
+        if self._segments_list is not None:
+            self._segments_list.add(segment)
+
+        if self._segments_boundaries is not None:
+            self._segments_boundaries.add(segment.start)
+            self._segments_boundaries.add(segment.end)
 
-        segments_boundaries_ = self.segments_boundaries_
-        segments_boundaries_.add(segment.start)
-        segments_boundaries_.add(segment.end)
+        self._invalidate_arrays()
 
         return self
 
@@ -300,11 +405,14 @@ class Timeline:
 
         segments_set_.remove(segment)
 
-        self.segments_list_.remove(segment)
+        if self._segments_list is not None:
+            self._segments_list.remove(segment)
 
-        segments_boundaries_ = self.segments_boundaries_
-        segments_boundaries_.remove(segment.start)
-        segments_boundaries_.remove(segment.end)
+        if self._segments_boundaries is not None:
+            self._segments_boundaries.remove(segment.start)
+            self._segments_boundaries.remove(segment.end)
+
+        self._invalidate_arrays()
 
         return self
 
@@ -342,14 +450,21 @@ class Timeline:
 
         segments_set = self.segments_set_
 
-        segments_set |= timeline.segments_set_
+        # only add the new segments to the sorted lists
+        new_segments = timeline.segments_set_ - segments_set
+        if not new_segments:
+            return self
 
-        # sorted list of segments (used for sorted iteration)
-        self.segments_list_ = SortedList(segments_set)
+        segments_set |= new_segments
+
+        if self._segments_list is not None:
+            self._segments_list.update(new_segments)
+
+        if self._segments_boundaries is not None:
+            self._segments_boundaries.update(
+                boundary for segment in new_segments for boundary in segment)
 
-        # sorted list of (possibly redundant) segment boundaries
-        boundaries = (boundary for segment in segments_set for boundary in segment)
-        self.segments_boundaries_ = SortedList(boundaries)
+        self._invalidate_arrays()
 
         return self
 
@@ -374,8 +489,12 @@ class Timeline:
         This does the same as timeline.update(...) except it returns a new
         timeline, and the original one is not modified.
         """
-        segments = self.segments_set_ | timeline.segments_set_
-        return Timeline(segments=segments, uri=self.uri)
+        starts, ends = self.to_arrays()
+        other_starts, other_ends = timeline.to_arrays()
+        starts, ends = intervals.normalize(
+            np.concatenate([starts, other_starts]),
+            np.concatenate([ends, other_ends]))
+        return Timeline._from_sorted_arrays(starts, ends, uri=self.uri)
 
     def co_iter(self, other: 'Timeline') -> Iterator[Tuple[Segment, Segment]]:
         """Iterate over pairs of intersecting segments
@@ -399,13 +518,14 @@ class Timeline:
             Yields pairs of intersecting segments in chronological order.
         """
 
-        for segment in self.segments_list_:
+        i, j = intervals.co_indices(*self.to_arrays(), *other.to_arrays())
+        if len(i) == 0:
+            return
 
-            # iterate over segments that starts before 'segment' ends
-            temp = Segment(start=segment.end, end=segment.end)
-            for other_segment in other.segments_list_.irange(maximum=temp):
-                if segment.intersects(other_segment):
-                    yield segment, other_segment
+        segments = list(self.segments_list_)
+        other_segments = list(other.segments_list_)
+        for i_, j_ in zip(i.tolist(), j.tolist()):
+            yield segments[i_], other_segments[j_]
 
     def crop_iter(self,
                   support: Support,
@@ -419,6 +539,39 @@ class Timeline:
         :func:`pyannote.core.Timeline.crop`
         """
 
+        i, starts, ends = self._crop_arrays(support, mode)
+        if len(i) == 0:
+            return
+
+        segments = list(self.segments_list_)
+
+        # loose and strict modes
+        if mode != 'intersection':
+            for i_ in i.tolist():
+                yield segments[i_]
+            return
+
+        # intersection mode
+        for i_, start, end in zip(i.tolist(), starts.tolist(), ends.tolist()):
+            mapped_to = Segment(start=start, end=end)
+            if returns_mapping:
+                yield segments[i_], mapped_to
+            else:
+                yield mapped_to
+
+    def _crop_arrays(self, support: Support, mode: CropMode) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Vectorized crop
+
+        Returns
+        -------
+        i : np.ndarray
+            Index of the original segment of each cropped segment
+            (one per pair of intersecting segment and support segment).
+        starts, ends : np.ndarray
+            Boundaries of the cropped segments.
+        """
+
         if mode not in {'loose', 'strict', 'intersection'}:
             raise ValueError("Mode must be one of 'loose', 'strict', or "
                              "'intersection'.")
@@ -434,36 +587,30 @@ class Timeline:
                 segments = []
 
             support = Timeline(segments=segments, uri=self.uri)
-            for yielded in self.crop_iter(support, mode=mode,
-                                          returns_mapping=returns_mapping):
-                yield yielded
-            return
 
         # if 'support' is a `Timeline`, we use its support
-        support = support.support()
+        support_starts, support_ends = support.support().to_arrays()
+
+        starts, ends = self.to_arrays()
+        i, j = intervals.co_indices(
+            starts, ends, support_starts, support_ends, disjoint=True)
 
         # loose mode
         if mode == 'loose':
-            for segment, _ in self.co_iter(support):
-                yield segment
-            return
+            return i, starts[i], ends[i]
 
         # strict mode
         if mode == 'strict':
-            for segment, other_segment in self.co_iter(support):
-                if segment in other_segment:
-                    yield segment
-            return
+            included = (support_starts[j] <= starts[i]) & \
+                       (support_ends[j] >= ends[i])
+            i = i[included]
+            return i, starts[i], ends[i]
 
         # intersection mode
-        for segment, other_segment in self.co_iter(support):
-            mapped_to = segment & other_segment
-            if not mapped_to:
-                continue
-            if returns_mapping:
-                yield segment, mapped_to
-            else:
-                yield mapped_to
+        cropped_starts = intervals.round_time(np.maximum(starts[i], support_starts[j]))
+        cropped_ends = intervals.round_time(np.minimum(ends[i], support_ends[j]))
+        non_empty = intervals.non_empty(cropped_starts, cropped_ends)
+        return i[non_empty], cropped_starts[non_empty], cropped_ends[non_empty]
 
     def crop(self,
              support: Support,
@@ -523,8 +670,9 @@ class Timeline:
                 mapping[mapped_to] = mapping.get(mapped_to, list()) + [segment]
             return Timeline(segments=segments, uri=self.uri), mapping
 
-        return Timeline(segments=self.crop_iter(support, mode=mode),
-                        uri=self.uri)
+        _, starts, ends = self._crop_arrays(support, mode)
+        starts, ends = intervals.normalize(starts, ends)
+        return Timeline._from_sorted_arrays(starts, ends, uri=self.uri)
 
     def overlapping(self, t: float) -> List[Segment]:
         """Get list of segments overlapping `t`
@@ -548,10 +696,11 @@ class Timeline:
         --------
         :func:`pyannote.core.Timeline.overlapping`
         """
-        segment = Segment(start=t, end=t)
-        for segment in self.segments_list_.irange(maximum=segment):
-            if segment.overlaps(t):
-                yield segment
+        starts, ends = self.to_arrays()
+        # segments starting exactly at t are not considered (as they sort
+        # after Segment(t, t))
+        for i in np.flatnonzero((starts < t) & (t <= ends)).tolist():
+            yield self.segments_list_[i]
 
     def get_overlap(self) -> 'Timeline':
         """Get overlapping parts of the timeline.
@@ -571,12 +720,8 @@ class Timeline:
        overlap : `pyannote.core.Timeline`
            Timeline of the overlaps.
        """
-        overlaps_tl = Timeline(uri=self.uri)
-        for s1, s2 in self.co_iter(self):
-            if s1 == s2:
-                continue
-            overlaps_tl.add(s1 & s2)
-        return overlaps_tl.support()
+        starts, ends = intervals.overlap(*self.to_arrays())
+        return Timeline._from_sorted_arrays(starts, ends, uri=self.uri)
 
     def extrude(self,
                 removed: Support,
@@ -724,12 +869,10 @@ class Timeline:
 
         # if at least one gap intersects with a segment from "other", 
         # "self" does not cover "other" entirely --> return False
-        for _ in gaps.co_iter(other):
-            return False
-
         # if no gap intersects with a segment from "other", 
         # "self" covers "other" entirely --> return True
-        return True
+        i, _ = intervals.co_indices(*gaps.to_arrays(), *other.to_arrays())
+        return len(i) == 0
 
     def copy(self, segment_func: Optional[Callable[[Segment], Segment]] = None) \
             -> 'Timeline':
@@ -753,7 +896,7 @@ class Timeline:
         # if segment_func is not provided
         # just add every segment
         if segment_func is None:
-            return Timeline(segments=self.segments_list_, uri=self.uri)
+            return Timeline._from_sorted_arrays(*self.to_arrays(), uri=self.uri)
 
         # if is provided
         # apply it to each segment before adding them
@@ -788,11 +931,9 @@ class Timeline:
         <Segment(0, 10)>
 
         """
-        if self.segments_set_:
-            segments_boundaries_ = self.segments_boundaries_
-            start = segments_boundaries_[0]
-            end = segments_boundaries_[-1]
-            return Segment(start=start, end=end)
+        if self:
+            starts, ends = self.to_arrays()
+            return Segment(start=float(starts[0]), end=float(np.max(ends)))
 
         return Segment(start=0.0, end=0.0)
 
@@ -805,9 +946,11 @@ class Timeline:
         """
 
         # The support of an empty timeline is an empty timeline.
-        if not self:
-            return
+        starts, ends = self._support_arrays(collar)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield Segment(start=start, end=end)
 
+    def _support_arrays(self, collar: float = 0.) -> Tuple[np.ndarray, np.ndarray]:
         # Principle:
         #   * gather all segments with no gap between them
         #   * add one segment per resulting group (their union |)
@@ -815,31 +958,7 @@ class Timeline:
         #   Since segments are kept sorted internally,
         #   there is no need to perform an exhaustive segment clustering.
         #   We just have to consider them in their natural order.
-
-        # Initialize new support segment
-        # as very first segment of the timeline
-        new_segment = self.segments_list_[0]
-
-        for segment in self:
-
-            # If there is no gap between new support segment and next segment
-            # OR there is a gap with duration < collar seconds,
-            possible_gap = segment ^ new_segment
-            if not possible_gap or possible_gap.duration < collar:
-                # Extend new support segment using next segment
-                new_segment |= segment
-
-            # If there actually is a gap and the gap duration >= collar
-            # seconds,
-            else:
-                yield new_segment
-
-                # Initialize new support segment as next segment
-                # (right after the gap)
-                new_segment = segment
-
-        # Add new segment to the timeline support
-        yield new_segment
+        return intervals.merge(*self.to_arrays(), collar=collar)
 
     def support(self, collar: float = 0.) -> 'Timeline':
         """Timeline support
@@ -876,7 +995,8 @@ class Timeline:
         support : Timeline
             Timeline support
         """
-        return Timeline(segments=self.support_iter(collar), uri=self.uri)
+        starts, ends = self._support_arrays(collar)
+        return Timeline._from_sorted_arrays(starts, ends, uri=self.uri)
 
     def duration(self) -> float:
         """Timeline duration
@@ -892,7 +1012,8 @@ class Timeline:
 
         # The timeline duration is the sum of the durations
         # of the segments in the timeline support.
-        return sum(s.duration for s in self.support_iter())
+        starts, ends = self._support_arrays()
+        return float(np.sum(ends - starts))
 
     def gaps_iter(self, support: Optional[Support] = None) -> Iterator[Segment]:
         """Like `gaps` but returns a segment generator instead
@@ -903,6 +1024,13 @@ class Timeline:
 
         """
 
+        starts, ends = self._gaps_arrays(support)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield Segment(start=start, end=end)
+
+    def _gaps_arrays(self, support: Optional[Support] = None) \
+            -> Tuple[np.ndarray, np.ndarray]:
+
         if support is None:
             support = self.extent()
 
@@ -912,35 +1040,16 @@ class Timeline:
 
         # segment support
         if isinstance(support, Segment):
-
-            # `end` is meant to store the end time of former segment
-            # initialize it with beginning of provided segment `support`
-            end = support.start
-
-            # support on the intersection of timeline and provided segment
-            for segment in self.crop(support, mode='intersection').support():
-
-                # add gap between each pair of consecutive segments
-                # if there is no gap, segment is empty, therefore not added
-                gap = Segment(start=end, end=segment.start)
-                if gap:
-                    yield gap
-
-                # keep track of the end of former segment
-                end = segment.end
-
-            # add final gap (if not empty)
-            gap = Segment(start=end, end=support.end)
-            if gap:
-                yield gap
+            support_starts = np.array([support.start], dtype=np.float64)
+            support_ends = np.array([support.end], dtype=np.float64)
 
         # timeline support
-        elif isinstance(support, Timeline):
+        else:
+            support_starts, support_ends = support._support_arrays()
 
-            # yield gaps for every segment in support of provided timeline
-            for segment in support.support():
-                for gap in self.gaps_iter(support=segment):
-                    yield gap
+        # parts of the support which are not covered by the timeline support
+        return intervals.difference(
+            support_starts, support_ends, *self._support_arrays())
 
     def gaps(self, support: Optional[Support] = None) \
             -> 'Timeline':
@@ -971,8 +1080,8 @@ class Timeline:
         :func:`pyannote.core.Timeline.extent`
 
         """
-        return Timeline(segments=self.gaps_iter(support=support),
-                        uri=self.uri)
+        starts, ends = self._gaps_arrays(support=support)
+        return Timeline._from_sorted_arrays(starts, ends, uri=self.uri)
 
     def segmentation(self) -> 'Timeline':
         """Segmentation
@@ -995,43 +1104,17 @@ class Timeline:
             (unique) timeline with same support and same set of segment
             boundaries as original timeline, but with no overlapping segments.
         """
-        # COMPLEXITY: O(n)
-        support = self.support()
-
-        # COMPLEXITY: O(n.log n)
         # get all boundaries (sorted)
         # |------|    |------|     |----|
         #   |--|    |-----|     |----------|
         # becomes
         # | |  | |  | |   |  |  |  |    |  |
-        timestamps = set([])
-        for (start, end) in self:
-            timestamps.add(start)
-            timestamps.add(end)
-        timestamps = sorted(timestamps)
-
-        # create new partition timeline
-        # | |  | |  | |   |  |  |  |    |  |
-        # becomes
+        # and only keep segments that are covered by original timeline
         # |-|--|-|  |-|---|--|  |--|----|--|
+        starts, ends, count = intervals.elementary(*self.to_arrays())
+        keep = (count > 0) & intervals.non_empty(starts, ends)
 
-        # start with an empty copy
-        timeline = Timeline(uri=self.uri)
-
-        if len(timestamps) == 0:
-            return Timeline(uri=self.uri)
-
-        segments = []
-        start = timestamps[0]
-        for end in timestamps[1:]:
-            # only add segments that are covered by original timeline
-            segment = Segment(start=start, end=end)
-            if segment and support.overlapping(segment.middle):
-                segments.append(segment)
-            # next segment...
-            start = end
-
-        return Timeline(segments=segments, uri=self.uri)
+        return Timeline._from_sorted_arrays(starts[keep], ends[keep], uri=self.uri)
 
     def to_annotation(self,
                       generator: Union[str, Iterable[Label], None, None] = 'string',
@@ -0,0 +1,209 @@
+"""Vectorized operations on intervals
+
+Intervals are stored as two float arrays of start and end times.
+These functions are the building blocks of the array-backed `Timeline`, and
+follow the semantics of `Segment` (emptiness, intersection) with
+`SEGMENT_PRECISION` tolerance.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from .. import segment as _segment
+
+Intervals = Tuple[np.ndarray, np.ndarray]
+
+
+def round_time(t: np.ndarray) -> np.ndarray:
+    """Round timestamps the same way as `Segment` (see `Segment.set_precision`)"""
+    t = np.asarray(t, dtype=np.float64)
+    if _segment.AUTO_ROUND_TIME:
+        precision = _segment.SEGMENT_PRECISION
+        t = np.trunc(t / precision + 0.5) * precision
+    return t
+
+
+def non_empty(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Mask of non-empty intervals (see `Segment.__bool__`)"""
+    return (ends - starts) > _segment.SEGMENT_PRECISION
+
+
+def normalize(starts: np.ndarray, ends: np.ndarray) -> Intervals:
+    """Sort intervals, and remove empty and duplicate ones
+
+    Parameters
+    ----------
+    starts, ends : (n, ) np.ndarray
+        Interval boundaries, in any order.
+
+    Returns
+    -------
+    starts, ends : (m, ) np.ndarray
+        Non-empty unique intervals, sorted like `Segment` (by start, then end).
+    """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1)
+
+    keep = non_empty(starts, ends)
+    starts, ends = starts[keep], ends[keep]
+
+    order = np.lexsort((ends, starts))
+    starts, ends = starts[order], ends[order]
+
+    if len(starts) > 1:
+        new = np.ones(len(starts), dtype=bool)
+        new[1:] = (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1])
+        starts, ends = starts[new], ends[new]
+
+    return starts, ends
+
+
+def merge(starts: np.ndarray, ends: np.ndarray, collar: float = 0.) -> Intervals:
+    """Merge overlapping intervals (and the ones separated by less than `collar`)
+
+    Parameters
+    ----------
+    starts, ends : (n, ) np.ndarray
+        Non-empty intervals, sorted by start time.
+    collar : float, optional
+        Merge intervals separated by less than `collar` seconds.
+
+    Returns
+    -------
+    starts, ends : (m, ) np.ndarray
+        Disjoint intervals, sorted by start time.
+    """
+    if len(starts) < 2:
+        return starts, ends
+
+    # gap between each interval and the union of the previous ones
+    # (negative when they overlap)
+    previous_end = np.maximum.accumulate(ends)[:-1]
+    gap = starts[1:] - np.minimum(previous_end, ends[1:])
+    new = np.ones(len(starts), dtype=bool)
+    new[1:] = (gap > _segment.SEGMENT_PRECISION) & (gap >= collar)
+
+    first = np.flatnonzero(new)
+    return starts[first], np.maximum.reduceat(ends, first)
+
+
+def co_indices(starts: np.ndarray, ends: np.ndarray,
+               other_starts: np.ndarray, other_ends: np.ndarray,
+               disjoint: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices of pairs of intersecting intervals (see `Segment.intersects`)
+
+    Parameters
+    ----------
+    starts, ends : (n, ) np.ndarray
+        Non-empty intervals, sorted by start time.
+    other_starts, other_ends : (m, ) np.ndarray
+        Non-empty intervals, sorted by start time.
+    disjoint : bool, optional
+        Set to True when `other` intervals do not overlap each other
+        (e.g. a timeline support) to narrow down the candidate pairs.
+
+    Returns
+    -------
+    i, j : (k, ) np.ndarray
+        `(starts[i], ends[i])` intersects `(other_starts[j], other_ends[j])`.
+        Pairs are sorted by i, then j.
+    """
+    if len(starts) == 0 or len(other_starts) == 0:
+        empty = np.zeros((0, ), dtype=np.int64)
+        return empty, empty
+
+    # candidates start before the interval ends...
+    hi = np.searchsorted(other_starts, ends, side='left')
+    # ... and end after the interval starts
+    if disjoint:
+        lo = np.searchsorted(other_ends, starts, side='right')
+    else:
+        max_duration = np.max(other_ends - other_starts)
+        lo = np.searchsorted(other_starts, starts - max_duration, side='left')
+
+    counts = np.maximum(hi - lo, 0)
+    total = np.sum(counts)
+    i = np.repeat(np.arange(len(starts)), counts)
+    j = np.repeat(lo, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    precision = _segment.SEGMENT_PRECISION
+    s, e = starts[i], ends[i]
+    S, E = other_starts[j], other_ends[j]
+    intersects = ((s < S) & (S < e - precision)) | \
+                 ((s > S) & (s < E - precision)) | \
+                 (s == S)
+
+    return i[intersects], j[intersects]
+
+
+def elementary(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Split time at every interval boundary
+
+    Parameters
+    ----------
+    starts, ends : (n, ) np.ndarray
+        Intervals, in any order.
+
+    Returns
+    -------
+    starts, ends : (m, ) np.ndarray
+        Consecutive elementary intervals between two successive boundaries.
+    count : (m, ) np.ndarray
+        Number of intervals covering each elementary interval.
+    """
+    boundaries = np.unique(np.concatenate([starts, ends]))
+    middle = .5 * (boundaries[:-1] + boundaries[1:])
+    count = np.searchsorted(np.sort(starts), middle, side='right') - \
+        np.searchsorted(np.sort(ends), middle, side='left')
+    return boundaries[:-1], boundaries[1:], count
+
+
+def overlap(starts: np.ndarray, ends: np.ndarray) -> Intervals:
+    """Parts covered by at least two intervals
+
+    Returns
+    -------
+    starts, ends : (m, ) np.ndarray
+        Disjoint non-empty intervals, sorted by start time.
+    """
+    starts, ends, count = elementary(starts, ends)
+    keep = count > 1
+    starts, ends = merge(starts[keep], ends[keep])
+    keep = non_empty(starts, ends)
+    return starts[keep], ends[keep]
+
+
+def difference(starts: np.ndarray, ends: np.ndarray,
+               other_starts: np.ndarray, other_ends: np.ndarray) -> Intervals:
+    """Parts of intervals not covered by other intervals
+
+    Parameters
+    ----------
+    starts, ends : (n, ) np.ndarray
+        Disjoint intervals, sorted by start time.
+    other_starts, other_ends : (m, ) np.ndarray
+        Disjoint intervals, sorted by start time.
+
+    Returns
+    -------
+    starts, ends : (k, ) np.ndarray
+        Disjoint non-empty intervals, sorted by start time.
+    """
+    if len(starts) == 0:
+        return starts, ends
+
+    t0, t1, _ = elementary(
+        np.concatenate([starts, other_starts]), np.concatenate([ends, other_ends]))
+    middle = .5 * (t0 + t1)
+
+    def covered(s, e):
+        k = np.searchsorted(s, middle, side='right') - 1
+        return (k >= 0) & (middle < e[np.maximum(k, 0)])
+
+    keep = covered(starts, ends)
+    if len(other_starts) > 0:
+        keep &= ~covered(other_starts, other_ends)
+
+    starts, ends = merge(t0[keep], t1[keep])
+    keep = non_empty(starts, ends)
+    return starts[keep], ends[keep]
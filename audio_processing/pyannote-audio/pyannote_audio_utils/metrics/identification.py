@@ -25,7 +25,9 @@
 
 # AUTHORS
 # Hervé BREDIN - http://herve.niderb.fr
-from typing import Optional
+from typing import Optional, Dict
+
+import numpy as np
 
 from pyannote_audio_utils.core import Annotation, Timeline
 
@@ -47,6 +49,36 @@ IER_MISS = MATCH_MISSED_DETECTION
 IER_NAME = 'identification error rate'
 
 
+def _match_counts(reference_counts: np.ndarray,
+                  hypothesis_counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """Vectorized `LabelMatcher` counts
+
+    Parameters
+    ----------
+    reference_counts, hypothesis_counts : (n_segments, n_labels) np.ndarray
+        Number of reference (resp. hypothesis) labels on each segment
+        (see `UEMSupportMixin.count_labels`).
+
+    Returns
+    -------
+    counts : dict
+        Same keys as `LabelMatcher` counts, with one count per segment.
+    """
+    # one-to-one mapping maximizing the number of matches
+    # pairs as many equal labels as possible...
+    correct = np.sum(np.minimum(reference_counts, hypothesis_counts), axis=1)
+    # ... and remaining labels with each other, or with nothing
+    NR = np.sum(reference_counts, axis=1)
+    NH = np.sum(hypothesis_counts, axis=1)
+    return {
+        MATCH_TOTAL: NR,
+        MATCH_CORRECT: correct,
+        MATCH_CONFUSION: np.minimum(NR, NH) - correct,
+        MATCH_MISSED_DETECTION: np.maximum(NR - NH, 0),
+        MATCH_FALSE_ALARM: np.maximum(NH - NR, 0),
+    }
+
+
 class IdentificationErrorRate(UEMSupportMixin, BaseMetric):
     """Identification error rate
 
@@ -130,6 +162,19 @@ class IdentificationErrorRate(UEMSupportMixin, BaseMetric):
         if skip_overlap is None:
             skip_overlap = self.skip_overlap
 
+        # labels are matched by equality: count them all at once
+        if type(self.matcher_) is LabelMatcher:
+            R, H = self.uemify(
+                reference, hypothesis, uem=uem,
+                collar=collar, skip_overlap=skip_overlap)
+            durations, r, h = self.count_labels(
+                R, H, self.common_timeline(R, H))
+            counts = _match_counts(r, h)
+            for component in (IER_TOTAL, IER_CORRECT, IER_CONFUSION,
+                              IER_MISS, IER_FALSE_ALARM):
+                detail[component] += float(np.dot(durations, counts[component]))
+            return detail
+
         R, H, common_timeline = self.uemify(
             reference, hypothesis, uem=uem,
             collar=collar, skip_overlap=skip_overlap,
@@ -199,6 +244,19 @@ class IdentificationPrecision(UEMSupportMixin, Precision):
                            **kwargs) -> Details:
         detail = self.init_components()
 
+        # labels are matched by equality: count them all at once
+        if type(self.matcher_) is LabelMatcher:
+            R, H = self.uemify(
+                reference, hypothesis, uem=uem,
+                collar=self.collar, skip_overlap=self.skip_overlap)
+            durations, r, h = self.count_labels(
+                R, H, self.common_timeline(R, H))
+            counts = _match_counts(r, h)
+            detail[PRECISION_RETRIEVED] += float(np.dot(durations, np.sum(h, axis=1)))
+            detail[PRECISION_RELEVANT_RETRIEVED] += \
+                float(np.dot(durations, counts[IER_CORRECT]))
+            return detail
+
         R, H, common_timeline = self.uemify(
             reference, hypothesis, uem=uem,
             collar=self.collar, skip_overlap=self.skip_overlap,
@@ -250,6 +308,19 @@ class IdentificationRecall(UEMSupportMixin, Recall):
                            **kwargs) -> Details:
         detail = self.init_components()
 
+        # labels are matched by equality: count them all at once
+        if type(self.matcher_) is LabelMatcher:
+            R, H = self.uemify(
+                reference, hypothesis, uem=uem,
+                collar=self.collar, skip_overlap=self.skip_overlap)
+            durations, r, h = self.count_labels(
+                R, H, self.common_timeline(R, H))
+            counts = _match_counts(r, h)
+            detail[RECALL_RELEVANT] += float(np.dot(durations, counts[IER_TOTAL]))
+            detail[RECALL_RELEVANT_RETRIEVED] += \
+                float(np.dot(durations, counts[IER_CORRECT]))
+            return detail
+
         R, H, common_timeline = self.uemify(
             reference, hypothesis, uem=uem,
             collar=self.collar, skip_overlap=self.skip_overlap,
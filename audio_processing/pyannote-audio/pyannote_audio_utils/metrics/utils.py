@@ -29,7 +29,10 @@
 import warnings
 from typing import Optional, Tuple, Union
 
+import numpy as np
+
 from pyannote_audio_utils.core import Timeline, Segment, Annotation
+from pyannote_audio_utils.core.utils import intervals
 
 
 class UEMSupportMixin:
@@ -68,32 +71,26 @@ class UEMSupportMixin:
         if collar == 0. and not skip_overlap:
             return uem
 
-        collars, overlap_regions = [], []
+        starts, ends = [], []
 
-        # build list of collars if needed
+        # build collars if needed
         if collar > 0.:
-            # iterate over all segments in reference
-            for segment in reference.itersegments():
-                # add collar centered on start time
-                t = segment.start
-                collars.append(Segment(t - .5 * collar, t + .5 * collar))
-
-                # add collar centered on end time
-                t = segment.end
-                collars.append(Segment(t - .5 * collar, t + .5 * collar))
+            # centered on start and end times of all segments in reference
+            t = np.concatenate(reference.get_timeline(copy=False).to_arrays())
+            starts.append(t - .5 * collar)
+            ends.append(t + .5 * collar)
 
-        # build list of overlap regions if needed
+        # build overlap regions if needed
         if skip_overlap:
-            # iterate over pair of intersecting segments
-            for (segment1, track1), (segment2, track2) in reference.co_iter(reference):
-                if segment1 == segment2 and track1 == track2:
-                    continue
-                # add their intersection
-                overlap_regions.append(segment1 & segment2)
+            # regions covered by at least two tracks
+            track_starts, track_ends, _ = reference._columns()
+            overlap_starts, overlap_ends = intervals.overlap(track_starts, track_ends)
+            starts.append(overlap_starts)
+            ends.append(overlap_ends)
 
-        segments = collars + overlap_regions
+        timeline = Timeline.from_arrays(np.concatenate(starts), np.concatenate(ends))
 
-        return Timeline(segments=segments).support().gaps(support=uem)
+        return timeline.support().gaps(support=uem)
 
     def common_timeline(self, reference: Annotation, hypothesis: Annotation) \
             -> Timeline:
@@ -116,6 +113,49 @@ class UEMSupportMixin:
         timeline.update(hypothesis.get_timeline(copy=False))
         return timeline.segmentation()
 
+    def count_labels(self,
+                     reference: Annotation,
+                     hypothesis: Annotation,
+                     timeline: Timeline) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Count labels of reference and hypothesis on every timeline segment
+
+        Same as projecting reference and hypothesis onto timeline
+        (see `project`) and calling `get_labels(segment, unique=False)`
+        for each segment, without creating the projections.
+
+        Parameters
+        ----------
+        reference, hypothesis : Annotation
+        timeline : Timeline
+            Timeline made of disjoint segments (e.g. `common_timeline`).
+
+        Returns
+        -------
+        durations : (n_segments, ) np.ndarray
+            Duration of timeline segments.
+        reference_counts, hypothesis_counts : (n_segments, n_labels) np.ndarray
+            Number of reference (resp. hypothesis) tracks of each label
+            on each timeline segment. Labels are the union of reference and
+            hypothesis labels, so that the same label shares the same column.
+        """
+        labels = reference.labels()
+        known = set(labels)
+        labels += [label for label in hypothesis.labels() if label not in known]
+
+        starts, ends = timeline.to_arrays()
+
+        counts = []
+        for annotation in (reference, hypothesis):
+            track_starts, track_ends, codes = annotation._columns(labels)
+            i, k = intervals.co_indices(
+                track_starts, track_ends, starts, ends, disjoint=True)
+            count = np.zeros((len(starts), len(labels)), dtype=np.int64)
+            np.add.at(count, (k, codes[i]), 1)
+            counts.append(count)
+
+        return ends - starts, counts[0], counts[1]
+
     def project(self, annotation: Annotation, timeline: Timeline) -> Annotation:
         """Project annotation onto timeline segments
 
@@ -135,6 +135,21 @@ parser.add_argument(
     action='store_true',
     help='display intermediate state.'
 )
+parser.add_argument(
+    '--vad',
+    action='store_true',
+    help='transcribe only the speech regions detected by Silero VAD.'
+)
+parser.add_argument(
+    '--vad_threshold', default=0.5, type=float,
+    help='speech threshold of Silero VAD.'
+)
+parser.add_argument(
+    '--batch_size', default=1, type=int,
+    help='number of 30-second windows decoded at once. '
+         'if larger than 1, the windows of all input files are packed into batches '
+         'and decoded independently (without the previous text as the prompt).'
+)
 args = update_parser(parser)
 
 if args.ailia_audio:
@@ -264,6 +279,10 @@ WEIGHT_DEC_LARGE_V3_FIX_KV_CACHE_PB_PATH = "decoder_large_v3_fix_kv_cache_weight
 
 REMOTE_PATH = 'https://storage.googleapis.com/ailia-models/whisper/'
 
+WEIGHT_VAD_PATH = 'silero_vad.onnx'
+MODEL_VAD_PATH = 'silero_vad.onnx.prototxt'
+REMOTE_VAD_PATH = 'https://storage.googleapis.com/ailia-models/silero-vad/'
+
 
 # ======================
 # Secondaty Functions
@@ -376,6 +395,50 @@ def compression_ratio(text) -> float:
     return len(text) / len(zlib.compress(text.encode("utf-8")))
 
 
+def detect_speech(wav, vad_model):
+    """
+    Get the speech regions of the audio by Silero VAD as [(start, end), ...] in samples.
+    """
+    from utils_vad import get_speech_timestamps
+
+    speech_timestamps = get_speech_timestamps(
+        wav, vad_model, threshold=args.vad_threshold, sampling_rate=SAMPLE_RATE)
+    return [(ts['start'], ts['end']) for ts in speech_timestamps]
+
+
+def collect_speech(wav, speech_chunks):
+    """
+    Concatenate the speech regions, so that the silence is not encoded.
+    """
+    if len(speech_chunks) == 0:
+        return wav[:0]
+    return np.concatenate([wav[start:end] for start, end in speech_chunks])
+
+
+def restore_timestamps(segments, speech_chunks):
+    """
+    Map the start and end of the segments transcribed from the collected speech
+    back to the timeline of the original audio.
+    """
+    starts = np.array([start for start, _ in speech_chunks])
+    lengths = np.array([end - start for start, end in speech_chunks])
+    offsets = np.cumsum(lengths) - lengths  # start of each region in the collected speech
+
+    def restore(t, is_end):
+        sample = t * SAMPLE_RATE
+        # the end on the boundary of regions belongs to the former region
+        i = np.searchsorted(offsets, sample, side='left' if is_end else 'right') - 1
+        i = max(i, 0)
+        sample = min(max(sample - offsets[i], 0), lengths[i])
+        return float(starts[i] + sample) / SAMPLE_RATE
+
+    for segment in segments:
+        segment["start"] = restore(segment["start"], False)
+        segment["end"] = restore(segment["end"], True)
+
+    return segments
+
+
 # ======================
 # Main functions
 # ======================
@@ -408,7 +471,7 @@ def get_audio_features(enc_net, mel):
 def inference_logits(
         dec_net, tokens, audio_features,
         kv_cache=None, initial_token_length=None,
-        constant_audio_feature=False):
+        constant_audio_feature=False, feed_kv_cache=False):
     n_group = tokens.shape[0]
     initial_token_length = initial_token_length if initial_token_length else tokens.shape[-1]
     is_init_kv_cache = False
@@ -459,7 +522,7 @@ def inference_logits(
 
             dec_net.predict([tokens, audio_features, kv_cache, offset], output=output)
         else:
-            if is_init_kv_cache or not COPY_BLOB_DATA_ENABLE or args.dynamic_kv_cache:
+            if is_init_kv_cache or feed_kv_cache or not COPY_BLOB_DATA_ENABLE or args.dynamic_kv_cache:
                 if constant_audio_feature:
                     dec_net.predict({
                         "tokens": tokens, "kv_cache": kv_cache, "offset": offset},
@@ -493,6 +556,19 @@ def inference_logits(
         return logits, kv_cache
 
 
+def get_kv_cache(dec_net, kv_cache):
+    """
+    Get the latest kv_cache which is kept in the decoder by copy_blob_data.
+    """
+    if args.onnx or REQUIRE_CONSTANT_SHAPE_BETWEEN_INFERENCE \
+            or not COPY_BLOB_DATA_ENABLE or args.dynamic_kv_cache:
+        return kv_cache
+
+    idx = dec_net.find_blob_index_by_name("output_kv_cache")
+    length = kv_cache.shape[2]
+    return dec_net.get_blob_data(idx)[:, :, :length, :]
+
+
 def detect_language(enc_net, dec_net, mel, tokenizer=None):
     """
     Detect the spoken language in the audio, and return them as list of strings, along with the ids
@@ -552,7 +628,7 @@ DecodingResult = namedtuple('DecodingResult', [
 def decode(enc_net, dec_net, mel, options):
     single = mel.ndim == 2
     if single:
-        mel = mel.unsqueeze(0)
+        mel = np.expand_dims(mel, axis=0)
 
     language = options.get("language") or "en"
     tokenizer = get_tokenizer(
@@ -600,8 +676,12 @@ def decode(enc_net, dec_net, mel, options):
     decoder.reset()
     n_audio = mel.shape[0]
 
-    audio_features = get_audio_features(enc_net, mel)
-    tokens = np.repeat(np.array([initial_tokens]), n_audio, axis=-1)
+    # skip encoder forward pass if already-encoded audio features were given
+    if mel.shape[-2:] != (dims.n_audio_ctx, dims.n_audio_state):
+        audio_features = get_audio_features(enc_net, mel)
+    else:
+        audio_features = mel
+    tokens = np.repeat(np.array([initial_tokens]), n_audio, axis=0)
     languages = [language] * audio_features.shape[0]
 
     # repeat the audio & text tensors by the group size, for beam search or best-of-n sampling
@@ -614,14 +694,21 @@ def decode(enc_net, dec_net, mel, options):
     initial_token_length = len(initial_tokens)
     kv_cache = None
 
+    # the sequences which emitted EOT are dropped from the batch (greedy decoding only,
+    # the beam search keeps the state of every audio)
+    drop_finished = options.get("beam_size") is None
+    active = np.arange(n_batch)
+    active_features = audio_features
+    resized_step = 0
+
     # sampling loop
     for i in range(sample_len):
         if args.debug:
             start = int(round(time.time() * 1000))
-        constant_audio_feature = (i >= 2)
+        constant_audio_feature = (i >= resized_step + 2)
         logits, kv_cache = inference_logits(
-            dec_net, tokens, audio_features, kv_cache, initial_token_length,
-            constant_audio_feature)
+            dec_net, tokens[active], active_features, kv_cache, initial_token_length,
+            constant_audio_feature, feed_kv_cache=(i == resized_step))
         if args.debug:
             end = int(round(time.time() * 1000))
             estimation_time = (end - start)
@@ -635,14 +722,33 @@ def decode(enc_net, dec_net, mel, options):
         logits = logits[:, -1]
 
         # apply the logit filters, e.g. for suppressing or applying penalty to
+        active_tokens = tokens[active]
         for logit_filter in logit_filters:
-            logit_filter.apply(logits, tokens)
+            logit_filter.apply(logits, active_tokens)
 
         def rearrange_kv_cache(source_indices):
             kv_cache[...] = kv_cache[:, source_indices]
 
         # expand the tokens tensor with the selected next tokens
-        tokens, completed = decoder.update(tokens, logits, sum_logprobs, rearrange_kv_cache)
+        if drop_finished:
+            active_logprobs = sum_logprobs[active]
+            active_tokens, completed = decoder.update(
+                active_tokens, logits, active_logprobs, rearrange_kv_cache)
+            sum_logprobs[active] = active_logprobs
+
+            tokens = np.pad(tokens, [(0, 0), (0, 1)], constant_values=tokenizer.eot)
+            tokens[active] = active_tokens
+
+            finished = active_tokens[:, -1] == tokenizer.eot
+            if not completed and np.any(finished):
+                if i > resized_step:
+                    kv_cache = get_kv_cache(dec_net, kv_cache)
+                active = active[~finished]
+                active_features = active_features[~finished]
+                kv_cache = kv_cache[:, ~finished]
+                resized_step = i + 1
+        else:
+            tokens, completed = decoder.update(tokens, logits, sum_logprobs, rearrange_kv_cache)
 
         if completed or tokens.shape[-1] > n_ctx:
             break
@@ -705,7 +811,10 @@ def decode_with_fallback(enc_net, dec_net, segment, decode_options):
     temperatures = (
         [temperature] if isinstance(temperature, (int, float)) else temperature
     )
-    decode_result = None
+    decode_results = [None] * segment.shape[0]
+
+    # the windows to decode again with the next temperature
+    pending = np.arange(segment.shape[0])
 
     for t in temperatures:
         kwargs = {**decode_options}
@@ -719,37 +828,41 @@ def decode_with_fallback(enc_net, dec_net, segment, decode_options):
             kwargs.pop("best_of", None)
 
         options = {**kwargs, "temperature": t}
-        decode_result = decode(enc_net, dec_net, segment, options)[0]
-
-        needs_fallback = False
-        if (
-            compression_ratio_threshold is not None
-            and compression_ratio(decode_result.text) > compression_ratio_threshold
-        ):
-            needs_fallback = True  # too repetitive
-        if (
-            logprob_threshold is not None
-            and decode_result.avg_logprob < logprob_threshold
-        ):
-            needs_fallback = True  # average log probability is too low
-        if (
-            no_speech_threshold is not None
-            and decode_result.no_speech_prob > no_speech_threshold
-        ):
-            needs_fallback = False  # silence
-        if not needs_fallback:
+        results = decode(enc_net, dec_net, segment[pending], options)
+
+        needs_fallback = np.zeros(len(pending), dtype=bool)
+        for i, decode_result in enumerate(results):
+            decode_results[pending[i]] = decode_result
+            if (
+                compression_ratio_threshold is not None
+                and compression_ratio(decode_result.text) > compression_ratio_threshold
+            ):
+                needs_fallback[i] = True  # too repetitive
+            if (
+                logprob_threshold is not None
+                and decode_result.avg_logprob < logprob_threshold
+            ):
+                needs_fallback[i] = True  # average log probability is too low
+            if (
+                no_speech_threshold is not None
+                and decode_result.no_speech_prob > no_speech_threshold
+            ):
+                needs_fallback[i] = False  # silence
+
+        pending = pending[needs_fallback]
+        if len(pending) == 0:
             break
 
-    return [decode_result]
+        # reuse the encoder output for the fallback
+        segment = np.stack([r.audio_features for r in decode_results])
+
+    return decode_results
 
 
-def predict(wav, enc_net, dec_net, immediate=False, microphone=False):
+def get_decode_options():
     language = args.language
     temperature = args.temperature
     temperature_increment_on_fallback = args.temperature_increment_on_fallback
-    compression_ratio_threshold = args.compression_ratio_threshold
-    logprob_threshold = args.logprob_threshold
-    no_speech_threshold = args.no_speech_threshold
 
     if temperature_increment_on_fallback is not None:
         temperature = tuple(np.arange(temperature, 1.0 + 1e-6, temperature_increment_on_fallback))
@@ -761,39 +874,45 @@ def predict(wav, enc_net, dec_net, immediate=False, microphone=False):
         'temperature': temperature, 'best_of': args.best_of,
         'beam_size': args.beam_size, 'patience': args.patience,
         'length_penalty': args.length_penalty, 'suppress_tokens': args.suppress_tokens,
-        'compression_ratio_threshold': compression_ratio_threshold,
-        'logprob_threshold': logprob_threshold,
+        'compression_ratio_threshold': args.compression_ratio_threshold,
+        'logprob_threshold': args.logprob_threshold,
         "no_speech_threshold": args.no_speech_threshold,
         "suppress_blank": True,
         'prompt': [],
     }
+    return decode_options
 
-    mel = log_mel_spectrogram(wav, dims.n_mels, padding=N_SAMPLES)
-    content_frames = mel.shape[-1] - N_FRAMES
 
-    if language is None:
-        segment = pad_or_trim(mel, N_FRAMES)
-        _, probs = detect_language(enc_net, dec_net, segment)
-        decode_options["language"] = language = max(probs, key=probs.get)
-        logger.info(f"Detected language: {LANGUAGES[decode_options['language']].title()}")
+def is_no_speech(result):
+    no_speech_threshold = args.no_speech_threshold
+    logprob_threshold = args.logprob_threshold
+    if no_speech_threshold is None:
+        return False
 
-    mel = np.expand_dims(mel, axis=0)
-    task = decode_options.get("task", args.task)
-    tokenizer = get_tokenizer(
-        is_multilingual(),
-        num_languages=num_languages(),
-        language=language,
-        task=task
-    )
+    # no voice activity check
+    should_skip = result.no_speech_prob > no_speech_threshold
+    if logprob_threshold is not None \
+            and result.avg_logprob > logprob_threshold:
+        # don't skip if the logprob is high enough, despite the no_speech_prob
+        should_skip = False
 
-    seek = 0
+    return should_skip
+
+
+def get_segments(tokenizer, result, seek, segment_size, fixed_window=False):
+    """
+    Split the decoded tokens of the window at seek into segments by the timestamps,
+    and return them with the seek of the next window.
+    With fixed_window, the unfinished segment at the end of the window is kept
+    and the next window always starts at the end of this window.
+    """
     input_stride = N_FRAMES // dims.n_audio_ctx  # mel frames per output token: 2
     time_precision = (
             input_stride * HOP_LENGTH / SAMPLE_RATE
     )  # time per output token: 0.02 (seconds)
-    all_tokens = []
-    all_segments = []
-    prompt_reset_since = 0
+    time_offset = float(seek * HOP_LENGTH / SAMPLE_RATE)
+    segment_duration = segment_size * HOP_LENGTH / SAMPLE_RATE
+    tokens = np.array(result.tokens)
 
     def new_segment(
             *, start: float, end: float, tokens, result: DecodingResult
@@ -811,6 +930,126 @@ def predict(wav, enc_net, dec_net, immediate=False, microphone=False):
             "no_speech_prob": result.no_speech_prob,
         }
 
+    current_segments = []
+
+    timestamp_tokens = tokens >= tokenizer.timestamp_begin
+    single_timestamp_ending = timestamp_tokens[-2:].tolist() == [False, True]
+
+    consecutive = np.where(timestamp_tokens[:-1] & timestamp_tokens[1:])[0] + 1
+    if len(consecutive) > 0:
+        # if the output contains two consecutive timestamp tokens
+        slices = consecutive.tolist()
+        if single_timestamp_ending:
+            slices.append(len(tokens))
+
+        last_slice = 0
+        for current_slice in slices:
+            sliced_tokens = tokens[last_slice:current_slice]
+            start_timestamp_pos = (
+                    sliced_tokens[0].item() - tokenizer.timestamp_begin
+            )
+            end_timestamp_pos = (
+                    sliced_tokens[-1].item() - tokenizer.timestamp_begin
+            )
+            current_segments.append(
+                new_segment(
+                    start=time_offset + start_timestamp_pos * time_precision,
+                    end=time_offset + end_timestamp_pos * time_precision,
+                    tokens=sliced_tokens,
+                    result=result,
+                )
+            )
+            last_slice = current_slice
+
+        if single_timestamp_ending:
+            # single timestamp at the end means no speech after the last timestamp.
+            seek += segment_size
+        elif fixed_window:
+            # the window is not decoded again, so keep the unfinished segment
+            sliced_tokens = tokens[last_slice:]
+            if np.any(sliced_tokens < tokenizer.eot):
+                start_timestamp_pos = (
+                        sliced_tokens[0].item() - tokenizer.timestamp_begin
+                )
+                current_segments.append(
+                    new_segment(
+                        start=time_offset + max(start_timestamp_pos, 0) * time_precision,
+                        end=time_offset + segment_duration,
+                        tokens=sliced_tokens,
+                        result=result,
+                    )
+                )
+            seek += segment_size
+        else:
+            # otherwise, ignore the unfinished segment and seek to the last timestamp
+            last_timestamp_pos = (
+                    tokens[last_slice - 1].item() - tokenizer.timestamp_begin
+            )
+            seek += last_timestamp_pos * input_stride
+    else:
+        duration = segment_duration
+        timestamps = tokens[np.ravel(timestamp_tokens.nonzero())]
+        if len(timestamps) > 0 \
+                and timestamps[-1].item() != tokenizer.timestamp_begin:
+            # no consecutive timestamps but it has a timestamp; use the last one.
+            last_timestamp_pos = \
+                timestamps[-1].item() - tokenizer.timestamp_begin
+            duration = last_timestamp_pos * time_precision
+
+        current_segments.append(
+            new_segment(
+                start=time_offset,
+                end=time_offset + duration,
+                tokens=tokens,
+                result=result,
+            )
+        )
+        seek += segment_size
+
+    # if a segment is instantaneous or does not contain text, clear it
+    for segment in current_segments:
+        if segment["start"] == segment["end"] or segment["text"].strip() == "":
+            segment["text"] = ""
+            segment["tokens"] = []
+            segment["words"] = []
+
+    return current_segments, seek
+
+
+def predict(wav, enc_net, dec_net, immediate=False, microphone=False, vad_model=None):
+    decode_options = get_decode_options()
+    language = decode_options["language"]
+
+    speech_chunks = None
+    if vad_model is not None:
+        speech_chunks = detect_speech(wav, vad_model)
+        if len(speech_chunks) == 0:
+            return dict(text='', segments=[], language=language)
+        wav = collect_speech(wav, speech_chunks)
+
+    mel = log_mel_spectrogram(wav, dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-1] - N_FRAMES
+
+    if language is None:
+        segment = pad_or_trim(mel, N_FRAMES)
+        _, probs = detect_language(enc_net, dec_net, segment)
+        decode_options["language"] = language = max(probs, key=probs.get)
+        logger.info(f"Detected language: {LANGUAGES[decode_options['language']].title()}")
+
+    mel = np.expand_dims(mel, axis=0)
+    task = decode_options.get("task", args.task)
+    tokenizer = get_tokenizer(
+        is_multilingual(),
+        num_languages=num_languages(),
+        language=language,
+        task=task
+    )
+
+    seek = 0
+    all_tokens = []
+    all_segments = []
+    prompt_reset_since = 0
+
     try:
         import tqdm
         if microphone:
@@ -822,89 +1061,22 @@ def predict(wav, enc_net, dec_net, immediate=False, microphone=False):
 
     # show the progress bar when verbose is False (otherwise the transcribed text will be printed)
     while seek < content_frames:
-        time_offset = float(seek * HOP_LENGTH / SAMPLE_RATE)
         mel_segment = mel[:, :, seek: seek + N_FRAMES]
         segment_size = min(N_FRAMES, content_frames - seek)
-        segment_duration = segment_size * HOP_LENGTH / SAMPLE_RATE
         mel_segment = pad_or_trim(mel_segment, N_FRAMES)
 
         decode_options["prompt"] = all_tokens[prompt_reset_since:]
         result = decode_with_fallback(enc_net, dec_net, mel_segment, decode_options)
         result = result[0]
-        tokens = np.array(result.tokens)
-
-        if no_speech_threshold is not None:
-            # no voice activity check
-            should_skip = result.no_speech_prob > no_speech_threshold
-            if logprob_threshold is not None \
-                    and result.avg_logprob > logprob_threshold:
-                # don't skip if the logprob is high enough, despite the no_speech_prob
-                should_skip = False
-
-            if should_skip:
-                seek += segment_size  # fast-forward to the next segment boundary
-                continue
-
-        previous_seek = seek
-        current_segments = []
-
-        timestamp_tokens = tokens >= tokenizer.timestamp_begin
-        single_timestamp_ending = timestamp_tokens[-2:].tolist() == [False, True]
-
-        consecutive = np.where(timestamp_tokens[:-1] & timestamp_tokens[1:])[0] + 1
-        if len(consecutive) > 0:
-            # if the output contains two consecutive timestamp tokens
-            slices = consecutive.tolist()
-            if single_timestamp_ending:
-                slices.append(len(tokens))
-
-            last_slice = 0
-            for current_slice in slices:
-                sliced_tokens = tokens[last_slice:current_slice]
-                start_timestamp_pos = (
-                        sliced_tokens[0].item() - tokenizer.timestamp_begin
-                )
-                end_timestamp_pos = (
-                        sliced_tokens[-1].item() - tokenizer.timestamp_begin
-                )
-                current_segments.append(
-                    new_segment(
-                        start=time_offset + start_timestamp_pos * time_precision,
-                        end=time_offset + end_timestamp_pos * time_precision,
-                        tokens=sliced_tokens,
-                        result=result,
-                    )
-                )
-                last_slice = current_slice
 
-            if single_timestamp_ending:
-                # single timestamp at the end means no speech after the last timestamp.
-                seek += segment_size
-            else:
-                # otherwise, ignore the unfinished segment and seek to the last timestamp
-                last_timestamp_pos = (
-                        tokens[last_slice - 1].item() - tokenizer.timestamp_begin
-                )
-                seek += last_timestamp_pos * input_stride
-        else:
-            duration = segment_duration
-            timestamps = tokens[np.ravel(timestamp_tokens.nonzero())]
-            if len(timestamps) > 0 \
-                    and timestamps[-1].item() != tokenizer.timestamp_begin:
-                # no consecutive timestamps but it has a timestamp; use the last one.
-                last_timestamp_pos = \
-                    timestamps[-1].item() - tokenizer.timestamp_begin
-                duration = last_timestamp_pos * time_precision
+        if is_no_speech(result):
+            seek += segment_size  # fast-forward to the next segment boundary
+            continue
 
-            current_segments.append(
-                new_segment(
-                    start=time_offset,
-                    end=time_offset + duration,
-                    tokens=tokens,
-                    result=result,
-                )
-            )
-            seek += segment_size
+        previous_seek = seek
+        current_segments, seek = get_segments(tokenizer, result, seek, segment_size)
+        if speech_chunks is not None:
+            restore_timestamps(current_segments, speech_chunks)
 
         if immediate:
             for segment in current_segments:
@@ -912,13 +1084,6 @@ def predict(wav, enc_net, dec_net, immediate=False, microphone=False):
                 line = f"[{format_timestamp(start)} --> {format_timestamp(end)}] {text}"
                 print(line)
 
-        # if a segment is instantaneous or does not contain text, clear it
-        for i, segment in enumerate(current_segments):
-            if segment["start"] == segment["end"] or segment["text"].strip() == "":
-                segment["text"] = ""
-                segment["tokens"] = []
-                segment["words"] = []
-
         all_segments.extend([
             {"id": i, **segment} for i, segment in enumerate(
                 current_segments, start=len(all_segments)
@@ -944,7 +1109,123 @@ def predict(wav, enc_net, dec_net, immediate=False, microphone=False):
     return d
 
 
-def recognize_from_audio(enc_net, dec_net):
+def predict_batch(wavs, enc_net, dec_net, batch_size, vad_model=None):
+    """
+    Transcribe the audios by packing their 30-second windows into batches of batch_size.
+    Unlike predict, the windows are fixed at every 30 seconds and decoded independently,
+    without the previous text as the prompt.
+    """
+    decode_options = get_decode_options()
+
+    languages = []
+    all_segments = []
+    all_speech_chunks = []
+    pending = {}  # language -> [(audio index, seek, segment_size, mel_segment), ...]
+
+    def decode_windows(language):
+        windows = pending.pop(language)
+        mel_segments = np.stack([w[3] for w in windows])
+
+        options = {**decode_options, "language": language}
+        results = decode_with_fallback(enc_net, dec_net, mel_segments, options)
+
+        tokenizer = get_tokenizer(
+            is_multilingual(),
+            num_languages=num_languages(),
+            language=language,
+            task=args.task
+        )
+        for (idx, seek, segment_size, _), result in zip(windows, results):
+            if is_no_speech(result):
+                continue
+            current_segments, _ = get_segments(
+                tokenizer, result, seek, segment_size, fixed_window=True)
+            if all_speech_chunks[idx] is not None:
+                restore_timestamps(current_segments, all_speech_chunks[idx])
+            all_segments[idx].extend(current_segments)
+
+        logger.info(f"decoded {len(windows)} windows")
+
+    for idx, wav in enumerate(wavs):
+        speech_chunks = None
+        if vad_model is not None:
+            speech_chunks = detect_speech(wav, vad_model)
+            wav = collect_speech(wav, speech_chunks)
+        all_speech_chunks.append(speech_chunks)
+        all_segments.append([])
+
+        language = decode_options["language"]
+        if len(wav) == 0:
+            # no speech
+            languages.append(language or "en")
+            continue
+
+        mel = log_mel_spectrogram(wav, dims.n_mels, padding=N_SAMPLES)
+        content_frames = mel.shape[-1] - N_FRAMES
+
+        if language is None:
+            segment = pad_or_trim(mel, N_FRAMES)
+            _, probs = detect_language(enc_net, dec_net, segment)
+            language = max(probs, key=probs.get)
+            logger.info(f"Detected language: {LANGUAGES[language].title()}")
+        languages.append(language)
+
+        for seek in range(0, content_frames, N_FRAMES):
+            segment_size = min(N_FRAMES, content_frames - seek)
+            mel_segment = pad_or_trim(mel[:, seek: seek + N_FRAMES], N_FRAMES)
+
+            windows = pending.setdefault(language, [])
+            windows.append((idx, seek, segment_size, mel_segment))
+            if len(windows) >= batch_size:
+                decode_windows(language)
+
+    for language in list(pending.keys()):
+        decode_windows(language)
+
+    outputs = []
+    for language, segments in zip(languages, all_segments):
+        tokenizer = get_tokenizer(
+            is_multilingual(),
+            num_languages=num_languages(),
+            language=language,
+            task=args.task
+        )
+        all_tokens = [token for segment in segments for token in segment["tokens"]]
+        outputs.append(dict(
+            text=tokenizer.decode(all_tokens),
+            segments=[{"id": i, **segment} for i, segment in enumerate(segments)],
+            language=language
+        ))
+
+    return outputs
+
+
+def recognize_from_audio_batch(enc_net, dec_net, vad_model=None):
+    audio_paths = args.input if isinstance(args.input, list) else [args.input]
+
+    # load the audio when its windows are packed
+    def load_wavs():
+        for audio_path in audio_paths:
+            logger.info(audio_path)
+            yield load_audio(audio_path)
+
+    logger.info('Start inference...')
+    start = int(round(time.time() * 1000))
+    outputs = predict_batch(load_wavs(), enc_net, dec_net, args.batch_size, vad_model=vad_model)
+    end = int(round(time.time() * 1000))
+    if args.benchmark:
+        logger.info(f'\ttotal processing time {end - start} ms')
+
+    # output result
+    for audio_path, output in zip(audio_paths, outputs):
+        logger.info(audio_path)
+        for res in output['segments']:
+            logger.info(f"[{format_timestamp(res['start'])} --> {format_timestamp(res['end'])}] {res['text']}")
+
+    logger.info('Script finished successfully.')
+
+
+def recognize_from_audio(enc_net, dec_net, vad_model=None):
     immediate = True
 
     # input audio loop
@@ -960,12 +1241,13 @@ def recognize_from_audio(enc_net, dec_net):
             logger.info('BENCHMARK mode')
             total_time_estimation = 0
             start = int(round(time.time() * 1000))
-            output = predict(wav, enc_net, dec_net, immediate=immediate, microphone=False)
+            output = predict(
+                wav, enc_net, dec_net, immediate=immediate, microphone=False, vad_model=vad_model)
             end = int(round(time.time() * 1000))
             estimation_time = (end - start)
             logger.info(f'\ttotal processing time {estimation_time} ms')
         else:
-            output = predict(wav, enc_net, dec_net, immediate=immediate)
+            output = predict(wav, enc_net, dec_net, immediate=immediate, vad_model=vad_model)
 
         if not immediate:
             # output result
@@ -1058,6 +1340,9 @@ def main():
         else:
             check_and_download_file(WEIGHT_DEC_LARGE_V3_FIX_KV_CACHE_PB_PATH, REMOTE_PATH)
 
+    if args.vad:
+        check_and_download_models(WEIGHT_VAD_PATH, MODEL_VAD_PATH, REMOTE_VAD_PATH)
+
     mic_info = None
     if args.V:
         # in microphone input mode, start thread before load the model.
@@ -1096,11 +1381,29 @@ def main():
         else:
             dec_net = onnxruntime.InferenceSession(WEIGHT_DEC_PATH, providers=providers)
 
+    vad_model = None
+    if args.vad:
+        sys.path.append('../silero-vad')
+        from utils_vad import OnnxWrapper
+
+        if not args.onnx:
+            vad_env_id = args.env_id
+            if "FP16" in ailia.get_environment(args.env_id).props:
+                vad_env_id = 0  # Silero VAD does not work on FP16
+            vad_session = ailia.Net(MODEL_VAD_PATH, WEIGHT_VAD_PATH, env_id=vad_env_id)
+        else:
+            vad_session = onnxruntime.InferenceSession(WEIGHT_VAD_PATH, providers=providers)
+        vad_model = OnnxWrapper(WEIGHT_VAD_PATH)
+        vad_model.session = vad_session
+        vad_model.ailia = not args.onnx
+
     if args.V:
         # microphone input mode
         recognize_from_microphone(enc_net, dec_net, mic_info)
+    elif args.batch_size > 1:
+        recognize_from_audio_batch(enc_net, dec_net, vad_model=vad_model)
     else:
-        recognize_from_audio(enc_net, dec_net)
+        recognize_from_audio(enc_net, dec_net, vad_model=vad_model)
 
     if args.profile:
         if args.onnx:
@@ -1,5 +1,6 @@
 import sys
 import time
+from functools import partial
 
 import numpy as np
 import cv2
@@ -13,6 +14,7 @@ sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa
 from model_utils import check_and_download_models  # noqa
 from detector_utils import load_image  # noqa
+from diffusion_utils import guided_model_output  # noqa
 # logger
 from logging import getLogger  # noqa
 
@@ -277,12 +279,12 @@ def p_sample_ddim(
         unconditional_guidance_scale=1.,
         unconditional_conditioning=None,
         update_context=True):
-    if unconditional_guidance_scale == 1.:
-        model_output = apply_model(models, x, t, c, update_context)
-    else:
-        model_t = apply_model(models, x, t, c, update_context)
-        model_uncond = apply_model(models, x, t, unconditional_conditioning, update_context)
-        model_output = model_uncond + unconditional_guidance_scale * (model_t - model_uncond)
+    # uncond and cond run in one batch, which also keeps the context constant
+    # between the steps for FIX_CONSTANT_CONTEXT
+    model_output = guided_model_output(
+        partial(apply_model, models), x, t, c,
+        unconditional_conditioning, unconditional_guidance_scale,
+        update_context=update_context)
 
     e_t = model_output
 
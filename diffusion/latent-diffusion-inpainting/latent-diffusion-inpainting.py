@@ -13,6 +13,7 @@ sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa
 from model_utils import check_and_download_models  # noqa
 from detector_utils import load_image  # noqa
+from diffusion_utils import decode_tiled  # noqa
 # logger
 from logging import getLogger  # noqa
 
@@ -59,6 +60,14 @@ parser.add_argument(
     '--seed', type=int, default=128,
     help='random seed for input data and noise'
 )
+parser.add_argument(
+    '--vae_tile_size', type=int, default=0,
+    help='decode the latents by the tiles of this size in latent space (0: decode at once)'
+)
+parser.add_argument(
+    '--vae_tile_overlap', type=int, default=8,
+    help='overlap between the tiles in latent space'
+)
 args = update_parser(parser)
 
 np.random.seed(args.seed)
@@ -223,11 +232,22 @@ def decode_first_stage(models, z):
     z = z / scale_factor
 
     autoencoder = models['autoencoder']
-    if not args.onnx:
-        output = autoencoder.predict([z])
-    else:
-        output = autoencoder.run(None, {'z': z})
-    dec = output[0]
+
+    def decode(z):
+        if not args.onnx:
+            output = autoencoder.predict([z])
+        else:
+            output = autoencoder.run(None, {'z': z})
+        return output[0]
+
+    if args.vae_tile_size <= 0:
+        return decode(z)
+
+    # VQ-f4 autoencoder
+    dec = decode_tiled(
+        decode, z,
+        tile_size=args.vae_tile_size, overlap=args.vae_tile_overlap,
+        scale=4)
 
     return dec
 
@@ -12,11 +12,12 @@ from arg_utils import get_base_parser, update_parser, get_savepath  # noqa
 from image_utils import normalize_image  # noqa
 from model_utils import check_and_download_models  # noqa
 from detector_utils import load_image  # noqa
+from diffusion_utils import decode_tiled  # noqa
 # logger
 from logging import getLogger  # noqa
 
 from constants import alphas_cumprod
-from ddpm_utils import get_fold_unfold
+from ddpm_utils import get_fold_unfold, get_weighting
 
 logger = getLogger(__name__)
 
@@ -210,42 +211,27 @@ def p_sample_ddim(
 
 
 def decode_first_stage(models, z):
-    ks = (128, 128)
-    stride = (64, 64)
+    ks = 128
+    stride = 64
     uf = 4
 
-    bs, nc, h, w = z.shape
-
-    fold, unfold, weighting = get_fold_unfold(z, ks, stride, uf=uf)
-
-    z, o_shape, _ = unfold(z)  # (bn, nc * prod(**ks), L)
-
-    # Reshape to img shape
-    z = z.reshape((bs, -1, ks[0], ks[1], z.shape[-1]))  # (bn, nc, ks[0], ks[1], L )
     z = z.astype(np.float32)
 
     logger.info('first_stage_decode...')
 
     first_stage_decode = models['first_stage_decode']
-    outputs = []
-    for i in range(z.shape[-1]):
-        x = z[:, :, :, :, i]
+
+    def decode(x):
         if not args.onnx:
             output = first_stage_decode.predict([x])
         else:
             output = first_stage_decode.run(None, {'x': x})
-        outputs.append(output[0])
-
-    o = np.stack(outputs, axis=-1)  # # (bn, nc, ks[0], ks[1], L)
-    o = o * weighting
-
-    # Reverse reshape to img shape
-    o = o.reshape((o.shape[0], -1, o.shape[-1]))  # (bn, nc * ks[0] * ks[1], L)
-    # stitch crops together
-    decoded = fold(o, I_shape=(1, 3, h * uf, w * uf), O_shape=o_shape)
+        return output[0]
 
-    normalization = fold(weighting, I_shape=(1, 1, h * uf, w * uf), O_shape=o_shape)
-    decoded = decoded / normalization  # norm is shape (1, 1, h, w)
+    # decode the crops one row at a time, and stitch them together
+    decoded = decode_tiled(
+        decode, z, tile_size=ks, overlap=ks - stride, scale=uf,
+        weighting=lambda h, w: get_weighting(h, w, 1, 1).reshape(h, w))
 
     return decoded
 
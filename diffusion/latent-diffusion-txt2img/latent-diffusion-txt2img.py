@@ -1,6 +1,7 @@
 import os
 import sys
 import time
+from functools import partial
 
 import numpy as np
 import cv2
@@ -13,6 +14,7 @@ import ailia
 sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa
 from model_utils import check_and_download_models  # noqa
+from diffusion_utils import guided_model_output, decode_tiled  # noqa
 # logger
 from logging import getLogger  # noqa
 
@@ -89,6 +91,18 @@ parser.add_argument(
     action='store_true',
     help='execute onnxruntime version.'
 )
+parser.add_argument(
+    '--vae_tile_size', type=int, default=0,
+    help='decode the latents by the tiles of this size in latent space (0: decode at once)'
+)
+parser.add_argument(
+    '--vae_tile_overlap', type=int, default=8,
+    help='overlap between the tiles in latent space'
+)
+parser.add_argument(
+    '--vae_stream', metavar='FILE', type=str, default=None,
+    help='write the decoded rows to the .npy file instead of memory (needs --vae_tile_size)'
+)
 args = update_parser(parser, check_input_type=False)
 
 
@@ -222,14 +236,9 @@ def p_sample_ddim(
         temperature=1.,
         unconditional_guidance_scale=1.,
         unconditional_conditioning=None):
-    x_in = np.concatenate([x] * 2)
-    t_in = np.concatenate([t] * 2)
-    c_in = np.concatenate([unconditional_conditioning, c])
-
-    x_recon = apply_model(models, x_in, t_in, c_in)
-    e_t_uncond, e_t = np.split(x_recon, 2)
-
-    e_t = e_t_uncond + unconditional_guidance_scale * (e_t - e_t_uncond)
+    e_t = guided_model_output(
+        partial(apply_model, models), x, t, c,
+        unconditional_conditioning, unconditional_guidance_scale)
 
     alphas = ddim_alphas
     alphas_prev = ddim_alphas_prev
@@ -296,11 +305,21 @@ def decode_first_stage(models, z):
     z = z / scale_factor
 
     autoencoder = models['autoencoder']
-    if not args.onnx:
-        output = autoencoder.predict([z])
-    else:
-        output = autoencoder.run(None, {'input': z})
-    dec = output[0]
+
+    def decode(z):
+        if not args.onnx:
+            output = autoencoder.predict([z])
+        else:
+            output = autoencoder.run(None, {'input': z})
+        return output[0]
+
+    if args.vae_tile_size <= 0:
+        return decode(z)
+
+    dec = decode_tiled(
+        decode, z,
+        tile_size=args.vae_tile_size, overlap=args.vae_tile_overlap,
+        scale=8, out=args.vae_stream)
 
     return dec
 
@@ -322,10 +341,10 @@ def predict(
         unconditional_conditioning=uc)
 
     x_samples_ddim = decode_first_stage(models, samples)
-    x_samples_ddim = np.clip((x_samples_ddim + 1.0) / 2.0, a_min=0.0, a_max=1.0)
 
     x_samples = []
     for x_sample in x_samples_ddim:
+        x_sample = np.clip((x_sample + 1.0) / 2.0, a_min=0.0, a_max=1.0)
         x_sample = x_sample.transpose(1, 2, 0)  # CHW -> HWC
         x_sample = x_sample * 255
         img = x_sample.astype(np.uint8)
@@ -1,3 +1,4 @@
+import sys
 import warnings
 
 import numpy as np
@@ -5,8 +6,11 @@ from tqdm.auto import trange
 
 from constants import log_sigmas
 
+sys.path.append('../../util')
+from diffusion_utils import guided_model_output
+
 # be rewritten later
-apply_model = lambda models, x, t, cc: None
+apply_model = lambda models, x, t, cc, update_context=True: None
 
 
 def get_sigmas_karras(n, sigma_min, sigma_max, rho=7.):
@@ -41,41 +45,27 @@ def get_scalings(sigma):
     return c_out, c_in
 
 
-def get_eps(models, input, sigma, cond):
+def get_eps(models, input, sigma, cond, update_context=True):
     def append_dims(x, target_dims):
         """Appends dimensions to the end of a tensor until it has target_dims dimensions."""
         dims_to_append = target_dims - x.ndim
         return x[(...,) + (None,) * dims_to_append]
 
     c_out, c_in = [append_dims(x, input.ndim) for x in get_scalings(sigma)]
-    eps = apply_model(models, input * c_in, sigma_to_t(sigma), cond)
+    eps = apply_model(models, input * c_in, sigma_to_t(sigma), cond, update_context)
 
     return input + eps * c_out
 
 
 def CFGDenoiser(
-        models, x, sigma, uncond, cond, cond_scale):
-    batch_size = 1
-    tensor = np.expand_dims(cond, axis=0)
-
-    x_in = np.concatenate([x, x])
-    sigma_in = np.concatenate([sigma, sigma])
-
-    x_out = np.zeros_like(x_in)
-    batch_size = batch_size * 2
-    for batch_offset in range(0, tensor.shape[0], batch_size):
-        a = batch_offset
-        b = min(a + batch_size, tensor.shape[0])
-        c_crossattn = tensor[a:b]
-
-        x_out[a:b] = get_eps(models, x_in[a:b], sigma_in[a:b], cond=c_crossattn[0])
-
-    x_out[-uncond.shape[0]:] = get_eps(
-        models, x_in[-uncond.shape[0]:], sigma_in[-uncond.shape[0]:], cond=uncond)
+        models, x, sigma, uncond, cond, cond_scale, update_context=True):
+    # uncond and cond are denoised in one batch
+    def denoise(x, sigma, cond, **kwargs):
+        return get_eps(models, x, sigma, cond, **kwargs)
 
-    denoised_uncond = x_out[-uncond.shape[0]:]
-    denoised = np.copy(denoised_uncond)
-    denoised[0] += (x_out[0] - denoised_uncond[0]) * cond_scale
+    denoised = guided_model_output(
+        denoise, x, sigma, cond, uncond, cond_scale,
+        update_context=update_context)
 
     return denoised
 
@@ -113,7 +103,8 @@ def sample_dpmpp_2m(models, x, sigmas, extra_args=None):
 
         old_denoised = None
         for i in trange(len(sigmas) - 1):
-            denoised = CFGDenoiser(models, x, sigmas[i] * s_in, **extra_args)
+            denoised = CFGDenoiser(
+                models, x, sigmas[i] * s_in, **extra_args, update_context=(i == 0))
 
             t, t_next = t_fn(sigmas[i]), t_fn(sigmas[i + 1])
             h = t_next - t
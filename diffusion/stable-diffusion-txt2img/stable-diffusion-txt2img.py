@@ -14,6 +14,7 @@ import ailia
 sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa
 from model_utils import check_and_download_models  # noqa
+from diffusion_utils import guided_model_output, decode_tiled, TextEmbeddingCache  # noqa
 # logger
 from logging import getLogger  # noqa
 
@@ -81,6 +82,14 @@ parser.add_argument(
     default="",
     help="the negative prompt"
 )
+parser.add_argument(
+    "--prompt_file", metavar="FILE", type=str, default=None,
+    help="render each prompt of the text file (one prompt per line) instead of --input"
+)
+parser.add_argument(
+    "--embedding_cache_dir", metavar="DIR", type=str, default=None,
+    help="directory to cache the text embeddings of the prompts across runs"
+)
 parser.add_argument(
     "--n_iter", type=int, default=1,
     help="sample this often",
@@ -148,6 +157,18 @@ parser.add_argument(
     action='store_true',
     help='execute legacy multi model version.'
 )
+parser.add_argument(
+    '--vae_tile_size', type=int, default=0,
+    help='decode the latents by the tiles of this size in latent space (0: decode at once)'
+)
+parser.add_argument(
+    '--vae_tile_overlap', type=int, default=8,
+    help='overlap between the tiles in latent space'
+)
+parser.add_argument(
+    '--vae_stream', metavar='FILE', type=str, default=None,
+    help='write the decoded rows to the .npy file instead of memory (needs --vae_tile_size)'
+)
 args = update_parser(parser, check_input_type=False)
 
 # ======================
@@ -300,13 +321,9 @@ def p_sample_plms(
     b, *_ = x.shape
 
     def get_model_output(x, t):
-        x_in = np.concatenate([x] * 2)
-        t_in = np.concatenate([t] * 2)
-        c_in = np.concatenate([unconditional_conditioning, c])
-        x_recon = apply_model(models, x_in, t_in, c_in, update_context)
-        e_t_uncond, e_t = np.split(x_recon, 2)
-
-        e_t = e_t_uncond + cfg_scale * (e_t - e_t_uncond)
+        e_t = guided_model_output(
+            partial(apply_model, models), x, t, c, unconditional_conditioning, cfg_scale,
+            update_context=update_context)
         return e_t
 
     def get_x_prev_and_pred_x0(e_t, index):
@@ -408,14 +425,9 @@ def p_sample_ddim(
         unconditional_conditioning=None,
         cfg_scale=1.,
         **kwargs):
-    x_in = np.concatenate([x] * 2)
-    t_in = np.concatenate([t] * 2)
-    c_in = np.concatenate([unconditional_conditioning, c])
-
-    x_recon = apply_model(models, x_in, t_in, c_in, update_context)
-    e_t_uncond, e_t = np.split(x_recon, 2)
-
-    e_t = e_t_uncond + cfg_scale * (e_t - e_t_uncond)
+    e_t = guided_model_output(
+        partial(apply_model, models), x, t, c, unconditional_conditioning, cfg_scale,
+        update_context=update_context)
 
     alphas = ddim_alphas
     alphas_prev = ddim_alphas_prev
@@ -517,13 +529,23 @@ def decode_first_stage(models, z):
     z = z.astype(np.float32)
 
     autoencoder = models['autoencoder']
-    if not args.onnx:
-        output = autoencoder.predict([z])
-    else:
-        if "float16" in autoencoder.get_inputs()[0].type:
-            z = z.astype(np.float16)
-        output = autoencoder.run(None, {'input': z})
-    dec = output[0]
+
+    def decode(z):
+        if not args.onnx:
+            output = autoencoder.predict([z])
+        else:
+            if "float16" in autoencoder.get_inputs()[0].type:
+                z = z.astype(np.float16)
+            output = autoencoder.run(None, {'input': z})
+        return output[0]
+
+    if args.vae_tile_size <= 0:
+        return decode(z)
+
+    dec = decode_tiled(
+        decode, z,
+        tile_size=args.vae_tile_size, overlap=args.vae_tile_overlap,
+        scale=args.f, out=args.vae_stream)
 
     return dec
 
@@ -566,10 +588,9 @@ def predict(
         estimation_time = (end - start)
         logger.info(f'\tailia processing estimation time {estimation_time} ms')
 
-    x_samples = np.clip((x_samples + 1.0) / 2.0, a_min=0.0, a_max=1.0)
-
     results = []
     for x_sample in x_samples:
+        x_sample = np.clip((x_sample + 1.0) / 2.0, a_min=0.0, a_max=1.0)
         x_sample = x_sample.transpose(1, 2, 0)  # CHW -> HWC
         x_sample = x_sample * 255
         img = x_sample.astype(np.uint8)
@@ -579,58 +600,87 @@ def predict(
     return results
 
 
+def get_prompts():
+    if args.prompt_file is None:
+        prompt = args.input if isinstance(args.input, str) else args.input[0]
+        return [prompt]
+
+    with open(args.prompt_file, encoding='utf-8') as f:
+        prompts = [line.strip() for line in f]
+    return [prompt for prompt in prompts if prompt]
+
+
 def recognize_from_text(models):
     n_iter = 1 if args.benchmark else args.n_iter
     n_samples = args.n_samples
     scale = args.scale
 
-    cond_stage_model = FrozenCLIPEmbedder(onnx = models["clip"])
+    # the text encoder is loaded only if the prompt is not cached
+    cond_stage_model = None
+
+    def encode(texts):
+        nonlocal cond_stage_model
+        if cond_stage_model is None:
+            cond_stage_model = FrozenCLIPEmbedder(onnx=models["clip"])
+        return cond_stage_model.encode(texts)
 
-    prompt = args.input if isinstance(args.input, str) else args.input[0]
+    embedding_cache = TextEmbeddingCache(
+        "ViT-L14-onnx" if models["clip"] is not None else "openai/clip-vit-large-patch14",
+        max_length=77, cache_dir=args.embedding_cache_dir)
+
+    prompts = get_prompts()
     n_prompt = args.n_prompt
-    logger.info("prompt: %s" % prompt)
     if n_prompt:
         logger.info("negative prompt: %s" % n_prompt)
 
-    sample_path = os.path.join('outputs', prompt.replace(" ", "-"))
-    os.makedirs(sample_path, exist_ok=True)
-    base_count = len(os.listdir(sample_path))
+    savepath = get_savepath(args.savepath, "", ext='.png')
 
     logger.info('Start inference...')
     if args.benchmark:
         logger.info('BENCHMARK mode')
         start = int(round(time.time() * 1000))
 
-    c = cond_stage_model.encode([prompt] * n_samples)
-    uc = None
-    if scale != 1.0:
-        uc = cond_stage_model.encode([n_prompt] * n_samples)
+    for prompt_idx, prompt in enumerate(prompts):
+        logger.info("prompt: %s" % prompt)
+
+        sample_path = os.path.join('outputs', prompt.replace(" ", "-"))
+        os.makedirs(sample_path, exist_ok=True)
+        base_count = len(os.listdir(sample_path))
+
+        c = embedding_cache.encode([prompt] * n_samples, encode)
+        uc = None
+        if scale != 1.0:
+            uc = embedding_cache.encode([n_prompt] * n_samples, encode)
 
-    all_samples = []
-    for i in range(n_iter):
-        logger.info("iteration: %s" % (i + 1))
-        x_samples = predict(models, c, uc)
+        all_samples = []
+        for i in range(n_iter):
+            logger.info("iteration: %s" % (i + 1))
+            x_samples = predict(models, c, uc)
 
-        for img in x_samples:
-            sample_file = os.path.join(sample_path, f"{base_count:04}.png")
-            cv2.imwrite(sample_file, img)
-            base_count += 1
+            for img in x_samples:
+                sample_file = os.path.join(sample_path, f"{base_count:04}.png")
+                cv2.imwrite(sample_file, img)
+                base_count += 1
 
-        x_samples = np.concatenate(x_samples, axis=1)
-        all_samples.append(x_samples)
+            x_samples = np.concatenate(x_samples, axis=1)
+            all_samples.append(x_samples)
 
-    grid_img = np.concatenate(all_samples, axis=0)
+        grid_img = np.concatenate(all_samples, axis=0)
+
+        # plot result
+        if len(prompts) > 1:
+            base, ext = os.path.splitext(savepath)
+            grid_path = f"{base}_{prompt_idx:04}{ext}"
+        else:
+            grid_path = savepath
+        logger.info(f'saved at : {grid_path}')
+        cv2.imwrite(grid_path, grid_img)
 
     if args.benchmark:
         end = int(round(time.time() * 1000))
         estimation_time = (end - start)
         logger.info(f'\ttotal time estimation {estimation_time} ms')
 
-    # plot result
-    savepath = get_savepath(args.savepath, "", ext='.png')
-    logger.info(f'saved at : {savepath}')
-    cv2.imwrite(savepath, grid_img)
-
     logger.info('Script finished successfully.')
 
 
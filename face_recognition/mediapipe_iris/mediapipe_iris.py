@@ -13,6 +13,7 @@ from logging import getLogger  # noqa: E402
 
 from image_utils import imread, load_image  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
+from net_pool_utils import NetPool  # noqa: E402
 from arg_utils import get_base_parser, get_savepath, update_parser  # noqa: E402
 from webcamera_utils import get_capture, get_writer  # noqa: E402
 
@@ -27,6 +28,11 @@ SAVE_IMAGE_PATH = 'output.png'
 IMAGE_HEIGHT = 128
 IMAGE_WIDTH = 128
 
+# the number of the faces (and the eyes) is rounded up to 1, 2, 4,
+# or the multiple of 4, so that the frames share the networks of the landmark models
+# without padding a single face
+BATCH_BUCKETS = (1, 2, 4)
+
 
 # ======================
 # Argument Parser Config
@@ -117,16 +123,24 @@ def draw_eye_iris(
 # ======================
 # Main functions
 # ======================
+def predict_batch(net, imgs):
+    outputs = net.predict([imgs])
+    # drop the padding of the batch
+    return [o[:len(imgs)] for o in outputs]
+
+
 def recognize_from_image():
     # net initialize
     detector = ailia.Net(
         DETECTION_MODEL_PATH, DETECTION_WEIGHT_PATH, env_id=args.env_id
     )
-    estimator = ailia.Net(
-        LANDMARK_MODEL_PATH, LANDMARK_WEIGHT_PATH, env_id=args.env_id
+    estimator = NetPool(
+        LANDMARK_MODEL_PATH, LANDMARK_WEIGHT_PATH,
+        buckets=(BATCH_BUCKETS, 1, 1, 1), env_id=args.env_id
     )
-    estimator2 = ailia.Net(
-        LANDMARK2_MODEL_PATH, LANDMARK2_WEIGHT_PATH, env_id=args.env_id
+    estimator2 = NetPool(
+        LANDMARK2_MODEL_PATH, LANDMARK2_WEIGHT_PATH,
+        buckets=(BATCH_BUCKETS, 1, 1, 1), env_id=args.env_id
     )
 
     # prepare input data
@@ -154,13 +168,11 @@ def recognize_from_image():
                     imgs, affines, box = iut.estimator_preprocess(
                         src_img[:, :, ::-1], detections, scale, pad
                     )
-                    estimator.set_input_shape(imgs.shape)
-                    landmarks, confidences = estimator.predict([imgs])
+                    landmarks, confidences = predict_batch(estimator, imgs)
 
                     # Iris landmark estimation
                     imgs2, origins = iut.iris_preprocess(imgs, landmarks)
-                    estimator2.set_input_shape(imgs2.shape)
-                    eyes, iris = estimator2.predict([imgs2])
+                    eyes, iris = predict_batch(estimator2, imgs2)
 
                     eyes, iris = iut.iris_postprocess(
                         eyes, iris, origins, affines
@@ -184,13 +196,11 @@ def recognize_from_image():
                 imgs, affines, box = iut.estimator_preprocess(
                     src_img[:, :, ::-1], detections, scale, pad
                 )
-                estimator.set_input_shape(imgs.shape)
-                landmarks, confidences = estimator.predict([imgs])
+                landmarks, confidences = predict_batch(estimator, imgs)
 
                 # Iris landmark estimation
                 imgs2, origins = iut.iris_preprocess(imgs, landmarks)
-                estimator2.set_input_shape(imgs2.shape)
-                eyes, iris = estimator2.predict([imgs2])
+                eyes, iris = predict_batch(estimator2, imgs2)
 
                 eyes, iris = iut.iris_postprocess(eyes, iris, origins, affines)
                 for i in range(len(eyes)):
@@ -209,11 +219,13 @@ def recognize_from_video():
     detector = ailia.Net(
         DETECTION_MODEL_PATH, DETECTION_WEIGHT_PATH, env_id=args.env_id
     )
-    estimator = ailia.Net(
-        LANDMARK_MODEL_PATH, LANDMARK_WEIGHT_PATH, env_id=args.env_id
+    estimator = NetPool(
+        LANDMARK_MODEL_PATH, LANDMARK_WEIGHT_PATH,
+        buckets=(BATCH_BUCKETS, 1, 1, 1), env_id=args.env_id
     )
-    estimator2 = ailia.Net(
-        LANDMARK2_MODEL_PATH, LANDMARK2_WEIGHT_PATH, env_id=args.env_id
+    estimator2 = NetPool(
+        LANDMARK2_MODEL_PATH, LANDMARK2_WEIGHT_PATH,
+        buckets=(BATCH_BUCKETS, 1, 1, 1), env_id=args.env_id
     )
 
     capture = get_capture(args.video)
@@ -249,33 +261,11 @@ def recognize_from_video():
             imgs, affines, box = iut.estimator_preprocess(
                 frame[:, :, ::-1], detections, scale, pad
             )
-
-            dynamic_shape = False
-
-            if dynamic_shape:
-                estimator.set_input_shape(imgs.shape)
-                landmarks, confidences = estimator.predict([imgs])
-            else:
-                landmarks = np.zeros((imgs.shape[0], 1404))
-                confidences = np.zeros((imgs.shape[0], 1))
-                for i in range(imgs.shape[0]):
-                    landmarks[i, :], confidences[i, :] = estimator.predict(
-                        [imgs[i:i+1, :, :, :]]
-                    )
+            landmarks, confidences = predict_batch(estimator, imgs)
 
             # Iris landmark estimation
             imgs2, origins = iut.iris_preprocess(imgs, landmarks)
-
-            if dynamic_shape:
-                estimator2.set_input_shape(imgs2.shape)
-                eyes, iris = estimator2.predict([imgs2])
-            else:
-                eyes = np.zeros((imgs2.shape[0], 213))
-                iris = np.zeros((imgs2.shape[0], 15))
-                for i in range(imgs2.shape[0]):
-                    eyes[i, :], iris[i, :] = estimator2.predict(
-                        [imgs2[i:i+1, :, :, :]]
-                    )
+            eyes, iris = predict_batch(estimator2, imgs2)
 
             eyes, iris = iut.iris_postprocess(eyes, iris, origins, affines)
             for i in range(len(eyes)):
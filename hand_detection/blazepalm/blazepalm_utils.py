@@ -1,7 +1,12 @@
+import sys
+
 import cv2
 import numpy as np
 from scipy.special import expit
 
+sys.path.append('../../util')
+import mediapipe_utils  # noqa: E402
+
 num_coords = 18
 min_score_thresh = 0.75
 min_suppression_threshold = 0.3
@@ -55,25 +60,9 @@ def decode_boxes(raw_boxes, anchors, resolution):
     h_scale = resolution
     w_scale = resolution
 
-    boxes = np.zeros_like(raw_boxes)
-
-    x_center = raw_boxes[..., 0] / x_scale * anchors[:, 2] + anchors[:, 0]
-    y_center = raw_boxes[..., 1] / y_scale * anchors[:, 3] + anchors[:, 1]
-
-    w = raw_boxes[..., 2] / w_scale * anchors[:, 2]
-    h = raw_boxes[..., 3] / h_scale * anchors[:, 3]
-
-    boxes[..., 0] = y_center - h / 2.  # ymin
-    boxes[..., 1] = x_center - w / 2.  # xmin
-    boxes[..., 2] = y_center + h / 2.  # ymax
-    boxes[..., 3] = x_center + w / 2.  # xmax
-
-    for k in range(num_keypoints):
-        offset = 4 + k*2
-        keypoint_x = raw_boxes[..., offset    ] / x_scale * anchors[:, 2] + anchors[:, 0]
-        keypoint_y = raw_boxes[..., offset + 1] / y_scale * anchors[:, 3] + anchors[:, 1]
-        boxes[..., offset    ] = keypoint_x
-        boxes[..., offset + 1] = keypoint_y
+    boxes = mediapipe_utils.decode_boxes(
+        raw_boxes, anchors, x_scale, y_scale, w_scale, h_scale,
+        num_keypoints=num_keypoints, box_format='yxyx')
 
     return boxes
 
@@ -115,69 +104,6 @@ def raw_output_to_detections(raw_box, raw_score, anchors, resolution):
     return output_detections
 
 
-def intersect(box_a, box_b):
-    """ We resize both tensors to [A,B,2] without new malloc:
-    [A,2] -> [A,1,2] -> [A,B,2]
-    [B,2] -> [1,B,2] -> [A,B,2]
-    Then we compute the area of intersect between box_a and box_b.
-    Args:
-      box_a: (tensor) bounding boxes, Shape: [A,4].
-      box_b: (tensor) bounding boxes, Shape: [B,4].
-    Return:
-      (tensor) intersection area, Shape: [A,B].
-    """
-    A = box_a.shape[0]
-    B = box_b.shape[0]
-    max_xy = np.minimum(
-        np.repeat(np.expand_dims(box_a[:, 2:], axis=1), B, axis=1),
-        np.repeat(np.expand_dims(box_b[:, 2:], axis=0), A, axis=0),
-    )
-    min_xy = np.maximum(
-        np.repeat(np.expand_dims(box_a[:, :2], axis=1), B, axis=1),
-        np.repeat(np.expand_dims(box_b[:, :2], axis=0), A, axis=0),
-    )
-    inter = np.clip((max_xy - min_xy), 0, None)
-    return inter[:, :, 0] * inter[:, :, 1]
-
-
-def jaccard(box_a, box_b):
-    """Compute the jaccard overlap of two sets of boxes.  The jaccard overlap
-    is simply the intersection over union of two boxes.  Here we operate on
-    ground truth boxes and default boxes.
-    E.g.:
-        A ∩ B / A ∪ B = A ∩ B / (area(A) + area(B) - A ∩ B)
-    Args:
-        box_a: (tensor) Ground truth bounding boxes, Shape: [num_objects,4]
-        box_b: (tensor) Prior boxes from priorbox layers, Shape: [num_priors,4]
-    Return:
-        jaccard overlap: (tensor) Shape: [box_a.size(0), box_b.size(0)]
-    """
-    inter = intersect(box_a, box_b)
-    area_a = np.repeat(
-        np.expand_dims(
-            (box_a[:, 2]-box_a[:, 0]) * (box_a[:, 3]-box_a[:, 1]),
-            axis=1
-        ),
-        inter.shape[1],
-        axis=1
-    )  # [A,B]
-    area_b = np.repeat(
-        np.expand_dims(
-            (box_b[:, 2]-box_b[:, 0]) * (box_b[:, 3]-box_b[:, 1]),
-            axis=0
-        ),
-        inter.shape[0],
-        axis=0
-    )  # [A,B]
-    union = area_a + area_b - inter
-    return inter / union  # [A,B]
-
-
-def overlap_similarity(box, other_boxes):
-    """Computes the IOU between a bounding box and set of other boxes."""
-    return jaccard(np.expand_dims(box, axis=0), other_boxes).squeeze(0)
-
-
 def weighted_non_max_suppression(detections):
     """The alternative NMS method as mentioned in the BlazeFace paper:
 
@@ -200,42 +126,13 @@ def weighted_non_max_suppression(detections):
     if len(detections) == 0:
         return []
 
-    output_detections = []
-
-    # Sort the detections from highest to lowest score.
-    # argsort() returns ascending order, therefore read the array from end
-    remaining = np.argsort(detections[:, num_coords])[::-1]
-
-    while len(remaining) > 0:
-        detection = detections[remaining[0]]
-
-        # Compute the overlap between the first box and the other
-        # remaining boxes. (Note that the other_boxes also include
-        # the first_box.)
-        first_box = detection[:4]
-        other_boxes = detections[remaining, :4]
-        ious = overlap_similarity(first_box, other_boxes)
-
-        # If two detections don't overlap enough, they are considered
-        # to be from different faces.
-        mask = ious > min_suppression_threshold
-        overlapping = remaining[mask]
-        remaining = remaining[~mask]
-
-        # Take an average of the coordinates from the overlapping
-        # detections, weighted by their confidence scores.
-        weighted_detection = detection.copy()
-        if len(overlapping) > 1:
-            coordinates = detections[overlapping, :num_coords]
-            scores = detections[overlapping, num_coords:num_coords+1]
-            total_score = scores.sum()
-            weighted = (coordinates * scores).sum(axis=0) / total_score
-            weighted_detection[:num_coords] = weighted
-            weighted_detection[num_coords] = total_score / len(overlapping)
-
-        output_detections.append(weighted_detection)
+    # Take an average of the coordinates from the overlapping
+    # detections, weighted by their confidence scores.
+    coordinates, scores = mediapipe_utils.weighted_nms(
+        detections[:, :num_coords], detections[:, num_coords], min_suppression_threshold)
+    output_detections = np.concatenate((coordinates, scores[:, None]), axis=-1)
 
-    return output_detections
+    return list(output_detections)
 
 
 def denormalize_detections(detections, scale, pad, resolution):
@@ -274,7 +171,7 @@ def postprocess(preds_ailia, anchor_path='anchors.npy', resolution=256):
     raw_box = preds_ailia[0]  # (1, 896, 18)
     raw_score = preds_ailia[1]  # (1, 896, 1)
 
-    anchors = np.load(anchor_path).astype("float32")
+    anchors = mediapipe_utils.load_anchors(anchor_path)
 
     # Postprocess the raw predictions:
     detections = raw_output_to_detections(raw_box, raw_score, anchors, resolution)
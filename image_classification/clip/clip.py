@@ -12,7 +12,8 @@ sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
 from detector_utils import load_image  # noqa: E402C
-from classifier_utils import plot_results, print_results  # noqa: E402
+from classifier_utils import plot_results, zero_shot_topk, print_topk_results  # noqa: E402
+from feature_store_utils import cached_features  # noqa: E402
 from math_utils import softmax  # noqa: E402C
 import webcamera_utils  # noqa: E402
 # logger
@@ -67,6 +68,14 @@ parser.add_argument(
     '-m', '--model_type', default='ViTB32', choices=('ViTB32', 'ViTL14', 'RN50'),
     help='model type'
 )
+parser.add_argument(
+    '--text_feature_cache', default=None, metavar='DIR', type=str,
+    help='directory to save the text features of the labels, which are memory-mapped in the next runs'
+)
+parser.add_argument(
+    '--top_k', type=int, default=3,
+    help='number of the labels shown for each image'
+)
 parser.add_argument(
     '--onnx',
     action='store_true',
@@ -135,7 +144,7 @@ def preprocess(img):
     return img
 
 
-def predict(net, img, text_feature):
+def predict_image_feature(net, img):
     img = preprocess(img)
 
     # feedforward
@@ -148,6 +157,12 @@ def predict(net, img, text_feature):
 
     image_feature = image_feature / np.linalg.norm(image_feature, ord=2, axis=-1, keepdims=True)
 
+    return image_feature
+
+
+def predict(net, img, text_feature):
+    image_feature = predict_image_feature(net, img)
+
     logit_scale = 100
     logits_per_image = (image_feature * logit_scale).dot(text_feature.T)
 
@@ -179,7 +194,7 @@ def predict_text_feature(net, text):
     return text_feature
 
 
-def recognize_from_image(net_image, net_text):
+def get_text_inputs():
     text_inputs = args.text_inputs
     desc_file = args.desc_file
     if desc_file:
@@ -188,9 +203,27 @@ def recognize_from_image(net_image, net_text):
     elif text_inputs is None:
         text_inputs = [f"a {c}" for c in ("human", "dog", "cat")]
 
-    text_feature = predict_text_feature(net_text, text_inputs)
+    return text_inputs
+
+
+def load_text_feature(net_text, text_inputs):
+    if args.text_feature_cache is None:
+        return predict_text_feature(net_text, text_inputs)
+
+    header = {"model": "clip-" + args.model_type, "texts": text_inputs}
+    text_feature = cached_features(
+        args.text_feature_cache, header,
+        lambda: predict_text_feature(net_text, text_inputs))
+
+    return text_feature
+
+
+def recognize_from_image(net_image, net_text):
+    text_inputs = get_text_inputs()
+    text_feature = load_text_feature(net_text, text_inputs)
 
     # input image loop
+    image_features = []
     for image_path in args.input:
         logger.info(image_path)
 
@@ -205,7 +238,7 @@ def recognize_from_image(net_image, net_text):
             total_time_estimation = 0
             for i in range(args.benchmark_count):
                 start = int(round(time.time() * 1000))
-                pred = predict(net_image, img, text_feature)
+                image_feature = predict_image_feature(net_image, img)
                 end = int(round(time.time() * 1000))
                 estimation_time = (end - start)
 
@@ -216,25 +249,26 @@ def recognize_from_image(net_image, net_text):
 
             logger.info(f'\taverage time estimation {total_time_estimation / (args.benchmark_count - 1)} ms')
         else:
-            pred = predict(net_image, img, text_feature)
+            image_feature = predict_image_feature(net_image, img)
+
+        image_features.append(image_feature)
 
-        # show results
-        pred = np.expand_dims(pred, axis=0)
-        print_results(pred, text_inputs)
+    # score all the images by one matrix product
+    image_features = np.concatenate(image_features)
+    top_indices, top_probs = zero_shot_topk(
+        image_features, text_feature, top_k=args.top_k)
+
+    # show results
+    for image_path, indices, probs in zip(args.input, top_indices, top_probs):
+        logger.info(image_path)
+        print_topk_results(indices, probs, text_inputs)
 
     logger.info('Script finished successfully.')
 
 
 def recognize_from_video(net_image, net_text):
-    text_inputs = args.text_inputs
-    desc_file = args.desc_file
-    if desc_file:
-        with open(desc_file) as f:
-            text_inputs = [x.strip() for x in f.readlines() if x.strip()]
-    elif text_inputs is None:
-        text_inputs = [f"a {c}" for c in ("human", "dog", "cat")]
-
-    text_feature = predict_text_feature(net_text, text_inputs)
+    text_inputs = get_text_inputs()
+    text_feature = load_text_feature(net_text, text_inputs)
 
     capture = webcamera_utils.get_capture(args.video)
     # create video writer if savepath is specified as video format
@@ -257,7 +291,7 @@ def recognize_from_video(net_image, net_text):
 
         pred = predict(net_image, img, text_feature)
 
-        plot_results(frame, np.expand_dims(pred, axis=0), text_inputs)
+        plot_results(frame, np.expand_dims(pred, axis=0), text_inputs, top_k=args.top_k)
 
         cv2.imshow('frame', frame)
         frame_shown = True
@@ -14,7 +14,8 @@ sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa
 from model_utils import check_and_download_models  # noqa
 from detector_utils import load_image  # noqa
-from classifier_utils import plot_results, print_results  # noqa
+from classifier_utils import plot_results, zero_shot_topk, print_topk_results  # noqa
+from feature_store_utils import cached_features  # noqa
 from math_utils import softmax  # noqa
 import webcamera_utils  # noqa
 # logger
@@ -57,6 +58,18 @@ parser.add_argument(
     '-m', '--model_type', default='clip', choices=('clip', 'cloob'),
     help='model type'
 )
+parser.add_argument(
+    '--desc_file', default=None, metavar='DESC_FILE', type=str,
+    help='description file (one label per line)'
+)
+parser.add_argument(
+    '--text_feature_cache', default=None, metavar='DIR', type=str,
+    help='directory to save the text features of the labels, which are memory-mapped in the next runs'
+)
+parser.add_argument(
+    '--top_k', type=int, default=3,
+    help='number of the labels shown for each image'
+)
 parser.add_argument(
     '--onnx',
     action='store_true',
@@ -103,13 +116,20 @@ def get_text_features(models, text):
 
     # feedforward
     net = models['text']
-    if not args.onnx:
-        output = net.predict([input_ids, attention_mask])
-    else:
-        output = net.run(None, {
-            'input_ids': input_ids, 'attention_mask': attention_mask
-        })
-    text_features = output[0]
+    text_features = []
+    batch_size_limit = 16
+    for i in range(0, len(input_ids), batch_size_limit):
+        input_ids_batch = input_ids[i:i + batch_size_limit]
+        attention_mask_batch = attention_mask[i:i + batch_size_limit]
+        if not args.onnx:
+            output = net.predict([input_ids_batch, attention_mask_batch])
+        else:
+            output = net.run(None, {
+                'input_ids': input_ids_batch, 'attention_mask': attention_mask_batch
+            })
+        text_features.append(output[0])
+
+    text_features = np.concatenate(text_features)
 
     return text_features
 
@@ -146,7 +166,7 @@ def preprocess(img):
     return img
 
 
-def predict(net, img, text_feature):
+def predict_image_features(net, img):
     img = preprocess(img)
 
     # feedforward
@@ -156,6 +176,12 @@ def predict(net, img, text_feature):
         output = net.run(None, {'image': img})
     image_features = output[0]
 
+    return image_features
+
+
+def predict(net, img, text_feature):
+    image_features = predict_image_features(net, img)
+
     logit_scale = 100
     logits_per_image = (image_features * logit_scale).dot(text_feature.T)
 
@@ -164,16 +190,37 @@ def predict(net, img, text_feature):
     return text_probs[0]
 
 
-def recognize_from_image(models):
+def get_text_inputs():
     text_inputs = args.text_inputs
-    if text_inputs is None:
+    if args.desc_file:
+        with open(args.desc_file, encoding='utf-8') as f:
+            text_inputs = [x.strip() for x in f.readlines() if x.strip()]
+    elif text_inputs is None:
         text_inputs = ["犬", "猫", "象"]
 
-    text_features = get_text_features(models, text_inputs)
+    return text_inputs
+
+
+def load_text_features(models, text_inputs):
+    if args.text_feature_cache is None:
+        return get_text_features(models, text_inputs)
+
+    header = {"model": "japanese-clip-" + args.model_type, "texts": text_inputs}
+    text_features = cached_features(
+        args.text_feature_cache, header,
+        lambda: get_text_features(models, text_inputs))
+
+    return text_features
+
+
+def recognize_from_image(models):
+    text_inputs = get_text_inputs()
+    text_features = load_text_features(models, text_inputs)
 
     net_image = models['image']
 
     # input image loop
+    image_features = []
     for image_path in args.input:
         logger.info(image_path)
 
@@ -188,7 +235,7 @@ def recognize_from_image(models):
             total_time_estimation = 0
             for i in range(args.benchmark_count):
                 start = int(round(time.time() * 1000))
-                pred = predict(net_image, img, text_features)
+                image_feature = predict_image_features(net_image, img)
                 end = int(round(time.time() * 1000))
                 estimation_time = (end - start)
 
@@ -199,21 +246,26 @@ def recognize_from_image(models):
 
             logger.info(f'\taverage time estimation {total_time_estimation / (args.benchmark_count - 1)} ms')
         else:
-            pred = predict(net_image, img, text_features)
+            image_feature = predict_image_features(net_image, img)
+
+        image_features.append(image_feature)
 
-        # show results
-        pred = np.expand_dims(pred, axis=0)
-        print_results(pred, text_inputs)
+    # score all the images by one matrix product
+    image_features = np.concatenate(image_features)
+    top_indices, top_probs = zero_shot_topk(
+        image_features, text_features, top_k=args.top_k)
+
+    # show results
+    for image_path, indices, probs in zip(args.input, top_indices, top_probs):
+        logger.info(image_path)
+        print_topk_results(indices, probs, text_inputs)
 
     logger.info('Script finished successfully.')
 
 
 def recognize_from_video(models):
-    text_inputs = args.text_inputs
-    if text_inputs is None:
-        text_inputs = ["犬", "猫", "象"]
-
-    text_features = get_text_features(models, text_inputs)
+    text_inputs = get_text_inputs()
+    text_features = load_text_features(models, text_inputs)
 
     capture = webcamera_utils.get_capture(args.video)
     # create video writer if savepath is specified as video format
@@ -238,7 +290,7 @@ def recognize_from_video(models):
 
         pred = predict(net_image, img, text_features)
 
-        plot_results(frame, np.expand_dims(pred, axis=0), text_inputs)
+        plot_results(frame, np.expand_dims(pred, axis=0), text_inputs, top_k=args.top_k)
 
         cv2.imshow('frame', frame)
         frame_shown = True
@@ -1,6 +1,7 @@
 import sys
 import os
 import time
+import hashlib
 from copy import deepcopy
 from collections import OrderedDict
 from logging import getLogger
@@ -19,6 +20,7 @@ from model_utils import urlretrieve, progress_print, check_and_download_models
 from image_utils import normalize_image  # noqa
 from detector_utils import load_image  # noqa
 from webcamera_utils import get_capture, get_writer  # noqa
+from nms_utils import nms  # noqa
 
 logger = getLogger(__name__)
 
@@ -84,6 +86,30 @@ parser.add_argument(
     '--gui', action='store_true',
     help='Open mouse click GUI.'
 )
+parser.add_argument(
+    '--embedding_cache_dir', metavar='DIR', type=str, default=None,
+    help='directory to cache the image embeddings across runs'
+)
+parser.add_argument(
+    '--auto', action='store_true',
+    help='Generate the masks of the whole image from a grid of points.'
+)
+parser.add_argument(
+    '--points_per_side', type=int, default=32,
+    help='The number of points sampled along one side of the image (auto mode).'
+)
+parser.add_argument(
+    '--points_per_batch', type=int, default=16,
+    help='The number of points run by sam_net in one batch (auto mode).'
+)
+parser.add_argument(
+    '--pred_iou_thresh', type=float, default=0.88,
+    help='The threshold of the predicted mask quality (auto mode).'
+)
+parser.add_argument(
+    '--stability_score_thresh', type=float, default=0.95,
+    help='The threshold of the mask stability score (auto mode).'
+)
 args = update_parser(parser)
 
 
@@ -153,6 +179,55 @@ def show_box(box, img):
     return img
 
 
+def show_anns(masks, img):
+    np.random.seed(0)
+    img = img.astype(np.float32)
+
+    # draw the large masks first
+    areas = masks.reshape(len(masks), -1).sum(axis=1)
+    for i in np.argsort(-areas):
+        mask = masks[i][:, :, None]
+        color = np.random.randint(0, 256, 3).reshape(1, 1, -1)
+        img = img * ~mask + (img * 0.4 + color * 0.6) * mask
+
+    return img.astype(np.uint8)
+
+
+def build_point_grid(n_per_side, im_h, im_w):
+    """
+    Generates a 2D grid of points evenly spaced in the image.
+    """
+    offset = 1 / (2 * n_per_side)
+    points_one_side = np.linspace(offset, 1 - offset, n_per_side)
+    points_x = np.tile(points_one_side[None, :], (n_per_side, 1))
+    points_y = np.tile(points_one_side[:, None], (1, n_per_side))
+    points = np.stack([points_x, points_y], axis=-1).reshape(-1, 2)
+    points = points * np.array([im_w, im_h])
+
+    return points
+
+
+def calculate_stability_score(masks, mask_threshold, threshold_offset):
+    """
+    Computes the IoU between the binary masks obtained by thresholding
+    the predicted mask logits at high and low values.
+    """
+    intersections = np.sum(masks > (mask_threshold + threshold_offset), axis=(-1, -2))
+    unions = np.sum(masks > (mask_threshold - threshold_offset), axis=(-1, -2))
+
+    return intersections / np.maximum(unions, 1)
+
+
+def mask_to_box(masks):
+    boxes = np.zeros((len(masks), 4))
+    for i, mask in enumerate(masks):
+        ys, xs = np.nonzero(mask)
+        if len(xs) > 0:
+            boxes[i] = (xs.min(), ys.min(), xs.max(), ys.max())
+
+    return boxes
+
+
 # ======================
 # Main functions
 # ======================
@@ -262,8 +337,227 @@ def predict_sam_net(models, image_embedding, im_h, im_w, pos_points, neg_points=
     return masks, scores
 
 
-def recognize_from_image(models, pos_points, neg_points):
-    global img_path, img_enc_output
+def predict_sam_net_batch(models, image_embedding, im_h, im_w, coords, labels):
+    """
+    Run the batch of the prompts through sam_net in one call.
+
+    Parameters
+    ----------
+    coords: numpy.ndarray
+        (B, N, 2) point coordinates in the image.
+    labels: numpy.ndarray
+        (B, N) point labels.
+
+    Returns
+    -------
+    masks: numpy.ndarray
+        (B, 4, im_h, im_w) mask logits.
+    iou_predictions: numpy.ndarray
+        (B, 4) predicted mask quality.
+    """
+    coord = apply_coords(coords, im_h, im_w).astype(np.float32)
+    label = labels.astype(np.float32)
+
+    mask_input = np.zeros((1, 1, 256, 256), dtype=np.float32)
+    has_mask_input = np.zeros(1, dtype=np.float32)
+
+    input = OrderedDict([
+        ("image_embeddings", image_embedding),
+        ("point_coords", coord),
+        ("point_labels", label),
+        ("mask_input", mask_input),
+        ("has_mask_input", has_mask_input),
+        ("orig_im_size", np.array((im_h, im_w), dtype=np.float32))
+    ])
+
+    sam_net = models["sam_net"]
+    if not args.onnx:
+        output = sam_net.predict(list(input.values()))
+    else:
+        output = sam_net.run(None, input)
+
+    masks, iou_predictions, low_res_logits = output
+
+    return masks, iou_predictions
+
+
+class SamSession:
+    """
+    Prompting session of an image.
+    The image embedding of the ViT encoder is computed once by set_image,
+    and the prompts only run the light sam_net.
+    If cache_dir is specified, the image embeddings are saved to the directory
+    as "<sha256 of the image and the model type>.npy", and reused in the next runs.
+    """
+
+    def __init__(self, models, model_type, cache_dir=None):
+        self.models = models
+        self.model_type = model_type
+        self.cache_dir = cache_dir
+        self.image_key = None
+        self.image_embedding = None
+        self.im_h = self.im_w = None
+        # whether sam_net accepts the batch of the prompts
+        self.batch_prompts = True
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, img):
+        h = hashlib.sha256()
+        h.update(self.model_type.encode('utf-8'))
+        h.update(str(img.shape).encode('utf-8'))
+        h.update(np.ascontiguousarray(img).tobytes())
+        return h.hexdigest()
+
+    def set_image(self, img):
+        key = self.key(img)
+        if key == self.image_key:
+            return
+
+        path = None
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + '.npy')
+
+        if path is not None and os.path.isfile(path):
+            logger.info('Image embedding is loaded from the cache.')
+            image_embedding = np.load(path)
+            im_h, im_w = img.shape[:2]
+        else:
+            image_embedding, im_h, im_w = predict_img_enc(self.models, img)
+            if path is not None:
+                # write to the temporary file, so that the incomplete file is not read
+                tmp_path = path + '.tmp.npy'
+                np.save(tmp_path, image_embedding)
+                os.replace(tmp_path, path)
+
+        self.image_key = key
+        self.image_embedding = image_embedding
+        self.im_h, self.im_w = im_h, im_w
+
+    def predict(self, pos_points, neg_points=None, box=None):
+        return predict_sam_net(
+            self.models, self.image_embedding, self.im_h, self.im_w,
+            pos_points, neg_points, box)
+
+    def _batch_errors(self):
+        # errors of the runtime for the input shape which sam_net does not accept
+        if args.onnx:
+            from onnxruntime.capi.onnxruntime_pybind11_state import InvalidArgument
+            return (InvalidArgument,)
+        names = (
+            'AiliaInvalidArgumentException',
+            'AiliaInvalidLayerException',
+            'AiliaUnsettledShapeException',
+        )
+        return tuple(getattr(ailia, name) for name in names if hasattr(ailia, name))
+
+    def predict_batch(self, coords, labels):
+        """
+        Predict the masks of the batch of the prompts.
+        If sam_net is exported with the fixed batch size,
+        the prompts are run one by one.
+
+        Parameters
+        ----------
+        coords: numpy.ndarray
+            (B, N, 2) point coordinates in the image.
+        labels: numpy.ndarray
+            (B, N) point labels.
+
+        Returns
+        -------
+        masks: numpy.ndarray
+            (B, 4, im_h, im_w) mask logits.
+        iou_predictions: numpy.ndarray
+            (B, 4) predicted mask quality.
+        """
+        if self.batch_prompts and 1 < len(coords):
+            try:
+                output = predict_sam_net_batch(
+                    self.models, self.image_embedding, self.im_h, self.im_w, coords, labels)
+                if len(output[0]) == len(coords):
+                    return output
+            except self._batch_errors() as e:
+                logger.debug(e)
+            logger.warning('sam_net does not accept the batch of the prompts. So run them one by one.')
+            self.batch_prompts = False
+
+        outputs = [
+            predict_sam_net_batch(
+                self.models, self.image_embedding, self.im_h, self.im_w,
+                coords[i:i + 1], labels[i:i + 1])
+            for i in range(len(coords))
+        ]
+        masks = np.concatenate([o[0] for o in outputs])
+        iou_predictions = np.concatenate([o[1] for o in outputs])
+
+        return masks, iou_predictions
+
+
+def generate_masks(session, points_per_side, points_per_batch):
+    """
+    Generate the masks of the whole image, prompting sam_net with a grid of points.
+    """
+    im_h, im_w = session.im_h, session.im_w
+    points = build_point_grid(points_per_side, im_h, im_w)
+
+    masks = []
+    scores = []
+    for i in range(0, len(points), points_per_batch):
+        coords = points[i:i + points_per_batch, None, :]
+        # add the padding point, as there is no box
+        coords = np.concatenate([coords, np.zeros_like(coords)], axis=1)
+        labels = np.array([[1, -1]] * len(coords))
+
+        mask_logits, iou_preds = session.predict_batch(coords, labels)
+
+        # use the multimask outputs (the first one is the single mask output)
+        mask_logits = mask_logits[:, 1:].reshape(-1, im_h, im_w)
+        iou_preds = iou_preds[:, 1:].reshape(-1)
+
+        keep = iou_preds > args.pred_iou_thresh
+        mask_logits = mask_logits[keep]
+        iou_preds = iou_preds[keep]
+
+        stability_score = calculate_stability_score(mask_logits, 0.0, 1.0)
+        keep = stability_score >= args.stability_score_thresh
+        masks.append(mask_logits[keep] > 0)
+        scores.append(iou_preds[keep])
+
+    masks = np.concatenate(masks)
+    scores = np.concatenate(scores)
+
+    # remove the duplicate masks
+    keep = nms(mask_to_box(masks), scores, iou_thres=0.7)
+
+    return masks[keep], scores[keep]
+
+
+def recognize_auto(session):
+    for image_path in args.input:
+        logger.info(image_path)
+
+        # prepare input data
+        img = load_image(image_path)
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        session.set_image(img)
+
+        # inference
+        logger.info('Start inference...')
+        masks, scores = generate_masks(session, args.points_per_side, args.points_per_batch)
+        logger.info(f'{len(masks)} masks are generated.')
+
+        res_img = show_anns(masks, img)
+
+        # plot result
+        savepath = get_savepath(args.savepath, image_path, ext='.png')
+        logger.info(f'saved at : {savepath}')
+        cv2.imwrite(savepath, res_img)
+
+
+def recognize_from_image(session, pos_points, neg_points):
+    global img_path
     box = args.box
 
     if pos_points is None:
@@ -289,22 +583,21 @@ def recognize_from_image(models, pos_points, neg_points):
         # prepare input data
         img = load_image(image_path)
         img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-        img_enc_output = predict_img_enc(models, img)
+        session.set_image(img)
 
         # inference
         logger.info('Start inference...')
-        recognize(image_path, img, models, img_enc_output, pos_points, neg_points, box)
+        recognize(image_path, img, session, pos_points, neg_points, box)
 
 
-def recognize(image_path, img, models, img_enc_output, pos_points, neg_points=None, box=None):
-    image_embedding, im_h, im_w = img_enc_output
+def recognize(image_path, img, session, pos_points, neg_points=None, box=None):
     sel_idx = args.idx
     if args.benchmark:
             logger.info('BENCHMARK mode')
             total_time_estimation = 0
             for i in range(args.benchmark_count):
                 start = int(round(time.time() * 1000))
-                output = predict_sam_net(models, image_embedding, im_h, im_w, pos_points, neg_points, box)
+                output = session.predict(pos_points, neg_points, box)
                 end = int(round(time.time() * 1000))
                 estimation_time = (end - start)
 
@@ -315,7 +608,7 @@ def recognize(image_path, img, models, img_enc_output, pos_points, neg_points=No
 
             logger.info(f'\taverage time estimation {total_time_estimation / (args.benchmark_count - 1)} ms')
     else:
-        output = predict_sam_net(models, image_embedding, im_h, im_w, pos_points, neg_points, box)
+        output = session.predict(pos_points, neg_points, box)
 
     masks, scores = output
     logger.info(f'scores : {", ".join(["(%d) %.2f" % (i, s * 100) for i, s in enumerate(scores)])}')
@@ -351,11 +644,11 @@ def recognize(image_path, img, models, img_enc_output, pos_points, neg_points=No
 
 
 def predict_on_click(event,x,y,flags,param):
-    global area_img, img, img_path, models, img_enc_output
+    global area_img, img, img_path, session
     if event == cv2.EVENT_LBUTTONDOWN:
         img = cv2.imread(img_path)
         pos_points = [(x - 1, y - 1)]
-        recognize(img_path, img, models, img_enc_output, pos_points, args.neg, args.box)
+        recognize(img_path, img, session, pos_points, args.neg, args.box)
         for idy, yx in enumerate(area_img):
             for idx, xx in enumerate(yx):
                 if (xx == np.array([255, 144, 30])).all():
@@ -365,6 +658,7 @@ def predict_on_click(event,x,y,flags,param):
 def show_GUI(imgPath):
     global img, img_path
     img = cv2.imread(imgPath)
+    session.set_image(img)
     #画像のウインドウに名前をつけ、コールバック関数をセット
     cv2.namedWindow('Mouse click GUI')
     cv2.setMouseCallback('Mouse click GUI', predict_on_click)
@@ -378,7 +672,7 @@ def show_GUI(imgPath):
 
 
 def main():
-    global img_path, models
+    global img_path, session
     model_type = args.model_type
     dic_model = {
         'sam_h': (
@@ -434,7 +728,11 @@ def main():
         sam_net=sam_net,
         img_enc=img_enc,
     )
-    recognize_from_image(models, args.pos, args.neg)
+    session = SamSession(models, model_type, cache_dir=args.embedding_cache_dir)
+    if args.auto:
+        recognize_auto(session)
+    else:
+        recognize_from_image(session, args.pos, args.neg)
     if args.gui:
         for image_path in args.input:
             img_path = copy.deepcopy(image_path)
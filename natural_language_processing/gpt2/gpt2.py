@@ -1,3 +1,4 @@
+import os
 import time
 import sys
 from transformers import AutoTokenizer
@@ -33,6 +34,12 @@ parser.add_argument(
     action='store_true',
     help='By default, the ailia SDK is used, but with this option, you can switch to using ONNX Runtime'
 )
+parser.add_argument(
+    '--kv_cache',
+    action='store_true',
+    help=('use the model with past key/values, which feeds only the new token on each step. '
+          'The model is exported by optimum and runs on ONNX Runtime (see README).')
+)
 args = update_parser(parser, check_input_type=False)
 
 
@@ -45,6 +52,15 @@ WEIGHT_PATH = "gpt2-medium.opt.onnx"
 MODEL_PATH = "gpt2-medium.opt.onnx.prototxt"
 REMOTE_PATH = "https://storage.googleapis.com/ailia-models/gpt2/"
 
+# the model with past key/values is not published, it is exported locally by optimum
+WEIGHT_WITH_PAST_PATH = "gpt2-medium-with-past.onnx"
+
+if args.kv_cache:
+    WEIGHT_PATH = WEIGHT_WITH_PAST_PATH
+    if not args.onnx:
+        logger.info("--kv_cache runs on ONNX Runtime")
+        args.onnx = True
+
 
 # ======================
 # Main function
@@ -59,16 +75,23 @@ def main():
     tokenizer = AutoTokenizer.from_pretrained("gpt2-medium")
     logger.info("Input : "+args.input)
 
+    def generate(outlength):
+        if args.kv_cache:
+            return generate_text_with_past(tokenizer, ailia_model, args.input, outlength)
+        return generate_text(tokenizer, ailia_model, args.input, outlength, args.onnx)
+
     # inference
     if args.benchmark:
         logger.info('BENCHMARK mode')
+        outlength = int(args.outlength)
         for i in range(5):
             start = int(round(time.time() * 1000))
-            output = generate_text(tokenizer, ailia_model, args.input, int(args.outlength), args.onnx)
+            output, num_tokens = generate(outlength)
             end = int(round(time.time() * 1000))
-            logger.info("\tailia processing time {} ms".format(end - start))
+            logger.info("\tailia processing time {} ms ({:.2f} tokens/sec)".format(
+                end - start, num_tokens * 1000 / max(end - start, 1)))
     else:
-        output = generate_text(tokenizer, ailia_model, args.input, int(args.outlength), args.onnx)
+        output, _ = generate(int(args.outlength))
 
     logger.info("output : "+output)
     logger.info('Script finished successfully.')
@@ -76,5 +99,11 @@ def main():
 
 if __name__ == "__main__":
     # model files check and download
-    check_and_download_models(WEIGHT_PATH, MODEL_PATH, REMOTE_PATH)
+    if args.kv_cache:
+        if not os.path.exists(WEIGHT_WITH_PAST_PATH):
+            raise FileNotFoundError(
+                f"{WEIGHT_WITH_PAST_PATH} is not found. Export it by optimum-cli, "
+                f"and rename the exported model.onnx to {WEIGHT_WITH_PAST_PATH} (see README).")
+    else:
+        check_and_download_models(WEIGHT_PATH, MODEL_PATH, REMOTE_PATH)
     main()
@@ -1,6 +1,13 @@
+import re
+
 import numpy as np
 
 
+def select_token(logits, K):
+    predictions = np.argpartition(-logits, K)[:K]
+    return predictions[0]
+
+
 def generate_text(tokenizer, ailia_model, span, outputlength, onnx_runtime=False):
     model_input = tokenizer.encode_plus(span)
     model_input = {name : np.atleast_2d(value) for name, value in model_input.items()}
@@ -14,12 +21,13 @@ def generate_text(tokenizer, ailia_model, span, outputlength, onnx_runtime=False
       onnx_result = ailia_model.run(model_input)
 
     out_str = span
+    num_tokens = 0
     for i in range(outputlength):
       K=outputlength
-      predictions = np.argpartition(-onnx_result[0][0, -1], K)[:K]
-      index = predictions[0]
+      index = select_token(onnx_result[0][0, -1], K)
       token = tokenizer.convert_ids_to_tokens([index])[0]
       out_str += token.replace('Ġ',' ')
+      num_tokens += 1
       trim = 0
       input = np.append(model_input['input_ids'][:,trim:], index)
       model_input['input_ids'] = np.expand_dims(input, 0)
@@ -33,4 +41,63 @@ def generate_text(tokenizer, ailia_model, span, outputlength, onnx_runtime=False
       if token == "<unk>":
         break
 
-    return out_str
\ No newline at end of file
+    return out_str, num_tokens
+
+
+def get_past_shape(session):
+    """
+    The number of the layers, the number of the heads and the dimension of the heads
+    of the past key/values inputs of the ONNX Runtime session.
+    """
+    shapes = {
+        x.name: x.shape for x in session.get_inputs()
+        if re.match(r'past_key_values\.\d+\.key$', x.name)
+    }
+    if not shapes:
+        raise ValueError("the model has no past_key_values inputs, export it with text-generation-with-past")
+    _, n_head, _, head_dim = shapes['past_key_values.0.key']
+    if not isinstance(n_head, int) or not isinstance(head_dim, int):
+        raise ValueError("the number of the heads and the dimension of the heads must be fixed in the model")
+    return len(shapes), n_head, head_dim
+
+
+def generate_text_with_past(tokenizer, session, span, outputlength):
+    # feed only the new token and the key/values of the past tokens,
+    # instead of the whole sequence on every step (ONNX Runtime only)
+    input_names = [x.name for x in session.get_inputs()]
+    n_layer, n_head, head_dim = get_past_shape(session)
+
+    input_ids = np.array(tokenizer.encode(span), dtype='int64')[None]
+    # the first step has no past tokens, so the key/values are zero-length,
+    # same as optimum feeds the exported model on ONNX Runtime
+    past_key_values = [np.zeros((1, n_head, 0, head_dim), dtype=np.float32)] * (n_layer * 2)
+
+    out_str = span
+    num_tokens = 0
+    past_length = 0
+    for i in range(outputlength):
+      length = input_ids.shape[1]
+      model_input = {
+        'input_ids': input_ids,
+        'attention_mask': np.ones((1, past_length + length), dtype='int64'),
+        'position_ids': np.arange(past_length, past_length + length, dtype='int64')[None],
+      }
+      for j in range(n_layer):
+        model_input['past_key_values.%d.key' % j] = past_key_values[j * 2]
+        model_input['past_key_values.%d.value' % j] = past_key_values[j * 2 + 1]
+      model_input = {k: v for k, v in model_input.items() if k in input_names}
+
+      logits, *past_key_values = session.run(None, model_input)
+      past_length += length
+
+      K=outputlength
+      index = select_token(logits[0, -1], K)
+      token = tokenizer.convert_ids_to_tokens([index])[0]
+      out_str += token.replace('Ġ',' ')
+      num_tokens += 1
+      input_ids = np.array([[index]], dtype='int64')
+
+      if token == "<unk>":
+        break
+
+    return out_str, num_tokens
@@ -1,5 +1,6 @@
 import sys
 import time
+import hashlib
 from logging import getLogger
 
 import numpy as np
@@ -13,6 +14,7 @@ sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser
 from model_utils import check_and_download_models
 from detector_utils import load_image
+from feature_store_utils import cached_features
 
 logger = getLogger(__name__)
 
@@ -47,6 +49,10 @@ parser.add_argument(
     '-m', '--model_type', default='ViTB32', choices=('ViTB32', 'ViTL14'),
     help='model type'
 )
+parser.add_argument(
+    '--feature_cache', default=None, metavar='DIR', type=str,
+    help='directory to save the CLIP image features of the input images, which are memory-mapped in the next runs'
+)
 parser.add_argument(
     '--onnx',
     action='store_true',
@@ -102,7 +108,7 @@ def preprocess(img):
     return img
 
 
-def predict(net_nsfw, net_image, img):
+def predict_image_feature(net_image, img):
     img = preprocess(img)
 
     # encode image
@@ -114,6 +120,10 @@ def predict(net_nsfw, net_image, img):
 
     emb = np.asarray(normalized(image_feature))
 
+    return emb
+
+
+def predict_nsfw(net_nsfw, emb):
     # feedforward
     emb = emb.astype(np.float64)
     if not args.onnx:
@@ -125,6 +135,38 @@ def predict(net_nsfw, net_image, img):
     return nsfw_value
 
 
+def predict(net_nsfw, net_image, img):
+    emb = predict_image_feature(net_image, img)
+    nsfw_value = predict_nsfw(net_nsfw, emb)
+
+    return nsfw_value
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_image_features(net_image, image_paths):
+    def compute():
+        embs = []
+        for image_path in image_paths:
+            logger.info(image_path)
+            img = load_image(image_path)
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            embs.append(predict_image_feature(net_image, img))
+        return np.concatenate(embs)
+
+    header = {
+        "model": "clip-" + args.model_type,
+        "images": [file_hash(image_path) for image_path in image_paths],
+    }
+    return cached_features(args.feature_cache, header, compute)
+
+
 def recognize_from_image(net_nsfw, net_image):
     # input image loop
     for image_path in args.input:
@@ -159,6 +201,19 @@ def recognize_from_image(net_nsfw, net_image):
     logger.info('Script finished successfully.')
 
 
+def recognize_from_feature_cache(net_nsfw, net_image):
+    logger.info('Start inference...')
+    embs = load_image_features(net_image, args.input)
+
+    for image_path, emb in zip(args.input, embs):
+        nsfw_value = predict_nsfw(net_nsfw, emb[None])
+
+        logger.info(image_path)
+        logger.info(" NSFW: %.3f" % (nsfw_value[0] * 100))
+
+    logger.info('Script finished successfully.')
+
+
 def main():
     dic_model = {
         'ViTB32': (
@@ -185,7 +240,10 @@ def main():
         net_nsfw = onnxruntime.InferenceSession(nsfw_weigth)
         net_image = onnxruntime.InferenceSession(clip_weigth)
 
-    recognize_from_image(net_nsfw, net_image)
+    if args.feature_cache is not None and not args.benchmark:
+        recognize_from_feature_cache(net_nsfw, net_image)
+    else:
+        recognize_from_image(net_nsfw, net_image)
 
 
 if __name__ == '__main__':
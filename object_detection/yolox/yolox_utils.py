@@ -6,6 +6,10 @@ import ailia
 
 import cv2
 
+import sys
+sys.path.append('../../util')
+from nms_utils import nms as _nms
+
 def preproc(img, input_size, swap=(2, 0, 1)):
     if len(img.shape) == 3:
         padded_img = np.ones((input_size[0], input_size[1], img.shape[2]), dtype=np.uint8) * 114
@@ -27,32 +31,8 @@ def preproc(img, input_size, swap=(2, 0, 1)):
 
 def nms(boxes, scores, nms_thr):
     """Single class NMS implemented in Numpy."""
-    x1 = boxes[:, 0]
-    y1 = boxes[:, 1]
-    x2 = boxes[:, 2]
-    y2 = boxes[:, 3]
-
-    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    order = scores.argsort()[::-1]
-
-    keep = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
-
-        w = np.maximum(0.0, xx2 - xx1 + 1)
-        h = np.maximum(0.0, yy2 - yy1 + 1)
-        inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
-
-        inds = np.where(ovr <= nms_thr)[0]
-        order = order[inds + 1]
-
-    return keep
+    keep = _nms(boxes, scores, nms_thr, offset=1)
+    return list(keep)
 
 
 def multiclass_nms(boxes, scores, nms_thr, score_thr, class_agnostic=True):
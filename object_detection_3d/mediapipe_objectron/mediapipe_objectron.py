@@ -159,29 +159,18 @@ def postprocess(boxes, predictions):
     anchors = ssd_anchors()
     boxes = decode_boxes(boxes, anchors)
 
-    detection_boxes = []
-    detection_scores = []
-    detection_classes = []
-    for i, box in enumerate(boxes):
-        class_id = -1
-        max_score = -1e+12
-        # Find the top score for box i.
-        for score_idx in range(num_classes):
-            if score_idx in ignore_classes:
-                continue
-            score = predictions[i, score_idx]
-            if sigmoid_score:
-                score = 1.0 / (1.0 + np.exp(-score))
-            if max_score < score:
-                max_score = score
-                class_id = score_idx
-
-        if max_score < min_score_thresh:
-            continue
-
-        detection_boxes.append(box)
-        detection_scores.append(max_score)
-        detection_classes.append(class_id)
+    # Find the top score of the boxes.
+    class_scores = predictions[:, :num_classes].copy()
+    class_scores[:, list(ignore_classes)] = -np.inf
+    class_ids = np.argmax(class_scores, axis=1)
+    max_scores = class_scores[np.arange(len(class_scores)), class_ids]
+    if sigmoid_score:
+        max_scores = 1.0 / (1.0 + np.exp(-max_scores))
+
+    idx = max_scores >= min_score_thresh
+    detection_boxes = boxes[idx]
+    detection_scores = max_scores[idx]
+    detection_classes = class_ids[idx]
 
     scores, boxes, classes = non_max_suppression(
         detection_scores, detection_boxes, detection_classes)
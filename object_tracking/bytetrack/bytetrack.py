@@ -13,6 +13,7 @@ from arg_utils import get_base_parser, update_parser
 from model_utils import check_and_download_models  # noqa: E402
 from image_utils import normalize_image  # noqa: E402C
 from webcamera_utils import get_capture, get_writer  # noqa: E402
+from mot_utils import MOTResultWriter  # noqa: E402
 # logger
 from logging import getLogger  # noqa: E402
 
@@ -82,6 +83,15 @@ parser.add_argument(
     action='store_true',
     help='Display preview in GUI.'
 )
+parser.add_argument(
+    '--result_path', type=str, default=None,
+    help='Save tracking results to this path in MOT format.'
+)
+parser.add_argument(
+    '--binary_result',
+    action='store_true',
+    help='Save tracking results as binary records instead of text.'
+)
 # tracking args
 parser.add_argument("--track_thresh", type=float, default=0.5, help="tracking confidence threshold")
 parser.add_argument("--track_buffer", type=int, default=30, help="the frames for keep lost tracks")
@@ -278,6 +288,14 @@ def recognize_from_video(net):
         match_thresh=args.match_thresh, frame_rate=30,
         mot20=mot20)
 
+    # create result writer, results are appended frame by frame
+    if args.result_path is not None:
+        result_writer = MOTResultWriter(
+            args.result_path, 'binary' if args.binary_result else 'mot_score')
+    else:
+        result_writer = None
+
+    frame_idx = 1
     frame_shown = False
     while True:
         ret, frame = capture.read()
@@ -303,6 +321,10 @@ def recognize_from_video(net):
                 online_ids.append(tid)
                 online_scores.append(t.score)
 
+        if result_writer is not None:
+            result_writer.write(frame_idx, online_tlwhs, online_ids, online_scores)
+        frame_idx += 1
+
         res_img = frame_vis_generator(frame, online_tlwhs, online_ids)
 
         # show
@@ -320,6 +342,9 @@ def recognize_from_video(net):
     cv2.destroyAllWindows()
     if writer is not None:
         writer.release()
+    if result_writer is not None:
+        result_writer.close()
+        logger.info(f'saved at : {args.result_path}')
 
     logger.info('Script finished successfully.')
 
@@ -16,6 +16,7 @@ from image_utils import normalize_image  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
 from detector_utils import load_image  # noqa: E402
 import webcamera_utils  # noqa: E402
+from mot_utils import MOTResultWriter  # noqa: E402
 
 # logger
 from logging import getLogger   # noqa: E402
@@ -78,6 +79,11 @@ parser.add_argument(
     action='store_true',
     help='Display preview in GUI.'
 )
+parser.add_argument(
+    '--binary_result',
+    action='store_true',
+    help='Save tracking results as binary records (.bin) instead of text.'
+)
 args = update_parser(parser)
 
 
@@ -106,7 +112,6 @@ def init_detector(env_id):
 # Main functions
 # ======================
 def recognize_from_video():
-    results = []
     idx_frame = 0
 
     # net initialize
@@ -137,6 +142,13 @@ def recognize_from_video():
     else:
         writer = None
 
+    # create result writer, results are appended frame by frame
+    result_path = args.savepath.split('.')[0] if args.savepath is not None else 'result'
+    if args.binary_result:
+        result_writer = MOTResultWriter(result_path + '.bin', 'binary')
+    else:
+        result_writer = MOTResultWriter(result_path + '.txt', 'mot')
+
     logger.info('Start Inference...')
     frame_shown = False
     while(True):
@@ -178,12 +190,7 @@ def recognize_from_video():
                 for img in img_crops
             ], axis=0).transpose(0, 3, 1, 2)
 
-            # TODO better to pass a batch at once
-            # features = extractor.predict(img_batch)
-            features = []
-            for img in img_batch:
-                features.append(extractor.predict(img[np.newaxis, :, :, :])[0])
-            features = np.array(features)
+            features = extract_features(extractor, img_batch)
         else:
             features = np.array([])
 
@@ -226,7 +233,7 @@ def recognize_from_video():
             for bb_xyxy in bbox_xyxy:
                 bbox_tlwh.append(xyxy_to_tlwh(bb_xyxy))
 
-            results.append((idx_frame - 1, bbox_tlwh, identities))
+            result_writer.write(idx_frame - 1, bbox_tlwh, identities)
 
         if args.gui or args.video:
             cv2.imshow('frame', frame)
@@ -240,15 +247,11 @@ def recognize_from_video():
         if writer is not None:
             writer.write(frame)
 
-        if args.savepath is not None:
-            write_results(args.savepath.split('.')[0] + '.txt', results, 'mot')
-        else:
-            write_results('result.txt', results, 'mot')
-
     capture.release()
     cv2.destroyAllWindows()
     if writer is not None:
         writer.release()
+    result_writer.close()
 
     logger.info(f'Save results to {args.savepath}')
     logger.info('Script finished successfully.')
@@ -238,6 +238,33 @@ def draw_boxes(img, bbox, identities=None, offset=(0, 0)):
     return img
 
 
+def extract_features(extractor, img_batch, bucket_sizes=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Extract re-ID features of all crops with a few batched inference calls.
+    The batch is padded up to the nearest bucket size,
+    so that the input shape changes only between a few buckets.
+    """
+    n = img_batch.shape[0]
+    max_size = bucket_sizes[-1]
+
+    features = []
+    for i in range(0, n, max_size):
+        batch = img_batch[i:i + max_size]
+        size = next(b for b in bucket_sizes if b >= batch.shape[0])
+        if size > batch.shape[0]:
+            pad = np.zeros(
+                (size - batch.shape[0],) + batch.shape[1:], dtype=batch.dtype
+            )
+            batch = np.concatenate([batch, pad], axis=0)
+
+        if tuple(extractor.get_input_shape()) != batch.shape:
+            extractor.set_input_shape(batch.shape)
+        output = extractor.predict(batch)
+        features.append(output[:min(max_size, n - i)])
+
+    return np.concatenate(features, axis=0)
+
+
 def write_results(filename, results, data_type):
     if data_type == 'mot':
         save_format = '{frame},{id},{x1},{y1},{w},{h},-1,-1,-1,-1\n'
@@ -13,6 +13,7 @@ from image_utils import normalize_image  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
 from detector_utils import load_image  # noqa: E402
 import webcamera_utils  # noqa: E402
+from mot_utils import MOTResultWriter  # noqa: E402
 
 # import deepsort modules
 sys.path.append('../deepsort')
@@ -82,6 +83,11 @@ parser.add_argument(
     '-nd', '--no_detector', action='store_true',
     help='Do not use detector in pairimage mode.'
 )
+parser.add_argument(
+    '--binary_result',
+    action='store_true',
+    help='Save tracking results as binary records (.bin) instead of text.'
+)
 args = update_parser(parser)
 
 
@@ -108,7 +114,6 @@ def euclidean_distance(x1, x2):
 # ======================
 
 def recognize_from_video(detector, extractor):
-    results = []
     idx_frame = 0
 
     # tracker class instance
@@ -134,6 +139,13 @@ def recognize_from_video(detector, extractor):
     else:
         writer = None
 
+    # create result writer, results are appended frame by frame
+    result_path = args.savepath.split('.')[0] if args.savepath is not None else 'result'
+    if args.binary_result:
+        result_writer = MOTResultWriter(result_path + '.bin', 'binary')
+    else:
+        result_writer = MOTResultWriter(result_path + '.txt', 'mot')
+
     logger.info('Start Inference...')
     while (True):
         idx_frame += 1
@@ -175,12 +187,7 @@ def recognize_from_video(detector, extractor):
                 for img in img_crops
             ], axis=0).transpose(0, 3, 1, 2)
 
-            # TODO better to pass a batch at once
-            # features = extractor.predict(img_batch)
-            features = []
-            for img in img_batch:
-                features.append(extractor.predict(img[np.newaxis, :, :, :])[0])
-            features = np.array(features)
+            features = extract_features(extractor, img_batch)
         else:
             features = np.array([])
 
@@ -223,22 +230,18 @@ def recognize_from_video(detector, extractor):
             for bb_xyxy in bbox_xyxy:
                 bbox_tlwh.append(xyxy_to_tlwh(bb_xyxy))
 
-            results.append((idx_frame - 1, bbox_tlwh, identities))
+            result_writer.write(idx_frame - 1, bbox_tlwh, identities)
 
         cv2.imshow('frame', frame)
 
         if writer is not None:
             writer.write(frame)
 
-        if args.savepath is not None:
-            write_results(args.savepath.split('.')[0] + '.txt', results, 'mot')
-        else:
-            write_results('result.txt', results, 'mot')
-
     capture.release()
     cv2.destroyAllWindows()
     if writer is not None:
         writer.release()
+    result_writer.close()
 
     logger.info(f'Save results to {args.savepath}')
     logger.info('Script finished successfully.')
@@ -16,6 +16,7 @@ from arg_utils import get_base_parser, update_parser, get_savepath  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
 from image_utils import normalize_image  # noqa
 from webcamera_utils import get_capture, get_writer  # noqa: E402
+from mot_utils import MOTResultWriter  # noqa: E402
 
 from ecc import ECC
 from deep_sort import nn_matching
@@ -94,6 +95,11 @@ parser.add_argument(
     action='store_true',
     help='Display preview in GUI.'
 )
+parser.add_argument(
+    '--binary_result',
+    action='store_true',
+    help='Save tracking results as binary records (.bin) instead of text.'
+)
 # tracking args
 parser.add_argument('--min-box-area', type=float, default=10, help='filter out tiny boxes')
 args = update_parser(parser)
@@ -277,6 +283,17 @@ def recognize_from_video(mod):
     tracker = mod["tracker"]
     linker = mod["linker"]
 
+    # create result writer
+    savepath = get_savepath(
+        args.savepath if args.savepath else SAVE_TEXT_PATH,
+        "video-%s" % args.video if args.video else args.input[0],
+        ext='.bin' if args.binary_result else '.txt')
+    result_writer = MOTResultWriter(
+        savepath, 'binary' if args.binary_result else 'mot_score')
+
+    # AFLink and GSI need the whole track,
+    # otherwise the results are appended frame by frame
+    post_process = args.AFLink or args.GSI
     track = []
 
     frame_idx = 1
@@ -306,13 +323,14 @@ def recognize_from_video(mod):
         tracker.update(detections)
         online_tlwhs = []
         online_ids = []
+        frame_track = []
         for t in tracker.tracks:
             tlwh = t.to_tlwh()
             tid = t.track_id
             if not t.is_confirmed() or t.time_since_update > 1:
                 rectangle(frame, tlwh[0], tlwh[1], tlwh[2], tlwh[3])
                 continue
-            track.append([frame_idx, tid, tlwh[0], tlwh[1], tlwh[2], tlwh[3], 1, -1, -1, -1])
+            frame_track.append([frame_idx, tid, tlwh[0], tlwh[1], tlwh[2], tlwh[3], 1, -1, -1, -1])
 
             if t.time_since_update > 0:
                 continue
@@ -321,6 +339,11 @@ def recognize_from_video(mod):
                 online_tlwhs.append(tlwh)
                 online_ids.append(tid)
 
+        if post_process:
+            track.extend(frame_track)
+        else:
+            result_writer.write_rows(frame_track)
+
         frame_idx += 1
 
         res_img = frame_vis_generator(frame, online_tlwhs, online_ids)
@@ -341,27 +364,27 @@ def recognize_from_video(mod):
     if writer is not None:
         writer.release()
 
-    if 0 < len(track):
-        track = np.array(track)
-    else:
-        track = np.zeros((0, 10))
+    if post_process:
+        if 0 < len(track):
+            track = np.array(track)
+        else:
+            track = np.zeros((0, 10))
 
-    if args.AFLink and 0 < len(track):
-        track = linker.link(track)
+        if args.AFLink and 0 < len(track):
+            track = linker.link(track)
 
-    if args.GSI and 0 < len(track):
-        track = GSInterpolation(
-            track,
-            interval=20,
-            tau=10
-        )
+        if args.GSI and 0 < len(track):
+            track = GSInterpolation(
+                track,
+                interval=20,
+                tau=10
+            )
+
+        result_writer.write_rows(track)
 
     # save result
-    savepath = get_savepath(
-        args.savepath if args.savepath else SAVE_TEXT_PATH,
-        "video-%s" % args.video if args.video else args.input[0], ext='.txt')
+    result_writer.close()
     logger.info(f'saved at : {savepath}')
-    np.savetxt(savepath, track, fmt='%d,%d,%.2f,%.2f,%.2f,%.2f,%.2f,%d,%d,%d')
 
     logger.info('Script finished successfully.')
 
@@ -0,0 +1,206 @@
+"""
+Check util/nms_utils.py against the previous per-pair implementations
+on random boxes, and the yolox and retinaface nms which call the shared nms().
+
+ex.
+    $ python3 check_nms_utils.py
+    $ python3 check_nms_utils.py --trials 1000 --seed 1
+"""
+
+import os
+import sys
+import argparse
+import importlib
+from collections import namedtuple
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'util'))
+import nms_utils  # noqa: E402
+
+# logger
+from logging import getLogger, basicConfig, INFO  # noqa: E402
+logger = getLogger(__name__)
+
+Detection = namedtuple('Detection', ['category', 'prob', 'x', 'y', 'w', 'h'])
+
+
+# ======================
+# Previous implementations
+# ======================
+
+def legacy_nms_between_categories(detections, w, h, categories=None, iou_threshold=0.25):
+    det = []
+    keep = []
+    for idx in range(len(detections)):
+        obj = detections[idx]
+        is_keep = True
+        for idx2 in range(len(det)):
+            if not keep[idx2]:
+                continue
+            box_a = [w * det[idx2].x, h * det[idx2].y, w * (det[idx2].x + det[idx2].w), h * (det[idx2].y + det[idx2].h)]
+            box_b = [w * obj.x, h * obj.y, w * (obj.x + obj.w), h * (obj.y + obj.h)]
+            iou = nms_utils.bb_intersection_over_union(box_a, box_b)
+            if iou >= iou_threshold and (
+                    categories == None or ((det[idx2].category in categories) and (obj.category in categories))):
+                if det[idx2].prob <= obj.prob:
+                    keep[idx2] = False
+                else:
+                    is_keep = False
+        det.append(obj)
+        keep.append(is_keep)
+
+    return [detections[idx] for idx in range(len(detections)) if keep[idx]]
+
+
+def legacy_nms_boxes(boxes, scores, iou_thres):
+    keep = []
+    for i, box_a in enumerate(boxes):
+        is_keep = True
+        for j in range(i):
+            if not keep[j]:
+                continue
+            box_b = boxes[j]
+            iou = nms_utils.bb_intersection_over_union(box_a, box_b)
+            if iou >= iou_thres:
+                if scores[i] > scores[j]:
+                    keep[j] = False
+                else:
+                    is_keep = False
+                    break
+
+        keep.append(is_keep)
+
+    return np.array(keep).nonzero()[0]
+
+
+def legacy_packed_nms(boxes, scores, iou_thres):
+    packed_idx = []
+    remained = np.argsort(-scores)
+    while 0 < len(remained):
+        idx = remained
+        i = idx[0]
+        candidates = [i]
+        remained = []
+        for j in idx[1:]:
+            similarity = nms_utils.bb_intersection_over_union(boxes[i], boxes[j])
+            if similarity > iou_thres:
+                candidates.append(j)
+            else:
+                remained.append(j)
+
+        packed_idx.append(candidates)
+
+    return packed_idx
+
+
+def legacy_cpu_nms(boxes, scores, thresh):
+    # the nms of yolox and py_cpu_nms of retinaface
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+
+        w = np.maximum(0.0, xx2 - xx1 + 1)
+        h = np.maximum(0.0, yy2 - yy1 + 1)
+        inter = w * h
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+
+        inds = np.where(ovr <= thresh)[0]
+        order = order[inds + 1]
+
+    return keep
+
+
+# ======================
+# Checks
+# ======================
+
+def random_boxes(rng, n, size=100):
+    # boxes clustered around a few centers, so that many of them overlap
+    centers = rng.uniform(0, size, (max(n // 5, 1), 2))
+    xy = centers[rng.integers(0, len(centers), n)] + rng.normal(0, size * 0.05, (n, 2))
+    wh = rng.uniform(size * 0.05, size * 0.3, (n, 2))
+    boxes = np.concatenate([xy, xy + wh], axis=1).round()
+    scores = rng.random(n)
+    return boxes, scores
+
+
+def import_model_utils(path, name):
+    # import the utils of the model as its script does, None if its dependency is not installed
+    sys.path.append(os.path.join(ROOT, path))
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        logger.info(f'{name} is not checked ({e})')
+        return None
+
+
+def check(trials, seed):
+    rng = np.random.default_rng(seed)
+    yolox_utils = import_model_utils('object_detection/yolox', 'yolox_utils')
+    retinaface_utils = import_model_utils('face_detection/retinaface', 'retinaface_utils')
+
+    for trial in range(trials):
+        n = int(rng.integers(0, 60))
+        boxes, scores = random_boxes(rng, n)
+        iou_thres = float(rng.uniform(0.1, 0.9))
+
+        expected = legacy_nms_boxes(boxes, scores, iou_thres)
+        actual = nms_utils.nms_boxes(boxes, scores, iou_thres)
+        assert np.array_equal(expected, actual), ('nms_boxes', trial)
+
+        if 0 < n:
+            expected = legacy_packed_nms(boxes, scores, iou_thres)
+            actual = nms_utils.packed_nms(boxes, scores, iou_thres)
+            assert [list(c) for c in expected] == [list(c) for c in actual], ('packed_nms', trial)
+
+        w, h = 640, 480
+        categories = rng.integers(0, 3, n)
+        detections = [
+            Detection(int(c), float(s), b[0] / w, b[1] / h, (b[2] - b[0]) / w, (b[3] - b[1]) / h)
+            for b, s, c in zip(boxes, scores, categories)
+        ]
+        for target in (None, [0, 1]):
+            expected = legacy_nms_between_categories(detections, w, h, target, iou_thres)
+            actual = nms_utils.nms_between_categories(detections, w, h, target, iou_thres)
+            assert expected == actual, ('nms_between_categories', trial)
+
+        expected = legacy_cpu_nms(boxes, scores, iou_thres)
+        actual = nms_utils.nms(boxes, scores, iou_thres, offset=1)
+        assert list(expected) == list(actual), ('nms', trial)
+        if yolox_utils is not None:
+            assert list(expected) == list(yolox_utils.nms(boxes, scores, iou_thres)), ('yolox nms', trial)
+        if retinaface_utils is not None:
+            dets = np.concatenate([boxes, scores[:, None]], axis=1)
+            actual = retinaface_utils.py_cpu_nms(dets, iou_thres)
+            assert list(expected) == list(actual), ('retinaface py_cpu_nms', trial)
+
+    logger.info(f'{trials} trials are matched')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check util/nms_utils.py against the previous implementations.')
+    parser.add_argument('--trials', type=int, default=200, help='the number of the random trials.')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the random boxes.')
+    args = parser.parse_args()
+
+    check(args.trials, args.seed)
+
+
+if __name__ == '__main__':
+    basicConfig(level=INFO)
+    main()
@@ -0,0 +1,77 @@
+"""
+Write the manifest of {url: sha256} of the model files,
+which is used by util/model_utils.py to verify the downloaded files.
+
+The SHA-256 is taken from the cache of AILIA_MODELS_CACHE (--from-cache),
+which lists the files downloaded by the model scripts with the cache enabled,
+or computed by downloading the urls given as the arguments.
+The entries are merged into the existing manifest.
+Until a manifest is written, the downloads are verified only with their size
+and the MD5 given by Google Cloud Storage.
+
+ex.
+    $ python3 write_model_manifest.py https://storage.googleapis.com/ailia-models/mobilenetv2/mobilenetv2_1.4.onnx
+    $ AILIA_MODELS_CACHE=~/.cache/ailia-models python3 write_model_manifest.py --from-cache
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../util'))
+import model_utils  # noqa: E402
+
+# logger
+from logging import getLogger, basicConfig, INFO  # noqa: E402
+logger = getLogger(__name__)
+
+
+def hash_of_url(url):
+    # download without the manifest, which may have the old hash of the url
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, os.path.basename(url))
+        digest, _ = model_utils._fetch(url, path)
+        return digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the manifest of the model files.')
+    parser.add_argument('urls', nargs='*', help='the urls of the files to download and hash.')
+    parser.add_argument(
+        '-o', '--output', default=model_utils.DEFAULT_MANIFEST_PATH,
+        help='the path of the manifest.')
+    parser.add_argument(
+        '--from-cache', action='store_true',
+        help='add the files in AILIA_MODELS_CACHE.')
+    args = parser.parse_args()
+
+    manifest = {}
+    if os.path.isfile(args.output):
+        with open(args.output, 'r') as f:
+            manifest = json.load(f)
+
+    urls = list(args.urls)
+    if args.from_cache:
+        if not model_utils.CACHE_DIR:
+            parser.error('--from-cache requires AILIA_MODELS_CACHE')
+        cached = model_utils.cached_files()
+        manifest.update(cached)
+        urls = [url for url in urls if url not in cached]
+
+    for url in urls:
+        logger.info(f'Hashing {url}')
+        manifest[url] = hash_of_url(url)
+
+    temp_path = args.output + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(temp_path, args.output)
+    logger.info(f'{len(manifest)} files are written to {args.output}')
+
+
+if __name__ == '__main__':
+    basicConfig(level=INFO)
+    main()
@@ -2,6 +2,7 @@ import sys
 import time
 
 import cv2
+import numpy as np
 
 import ailia
 import craft_pytorch_utils
@@ -10,6 +11,7 @@ import craft_pytorch_utils
 sys.path.append('../../util')
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
+from net_pool_utils import NetPool  # noqa: E402
 import webcamera_utils  # noqa: E402
 
 # logger
@@ -30,6 +32,10 @@ SAVE_IMAGE_PATH = 'imgs_results/res_00_00.jpg'
 THRESHOLD = 0.2
 IOU = 0.2
 
+# the input size is rounded up to the multiple of this,
+# so that the images of the similar size share the same network
+SIZE_BUCKET = 128
+
 
 # ======================
 # Arguemnt Parser Config
@@ -50,10 +56,28 @@ args = update_parser(parser)
 # ======================
 # Main functions
 # ======================
+def create_net():
+    mem_mode = ailia.get_memory_mode(reduce_constant=True, reduce_interstage=True)
+    # pad with the black pixels, same as the canvas of resize_aspect_ratio
+    pad_value = craft_pytorch_utils.normalize_mean_variance(np.zeros((1, 1, 3)))
+    pad_value = pad_value.transpose(2, 0, 1)[np.newaxis]
+    net = NetPool(
+        MODEL_PATH, WEIGHT_PATH, buckets=(1, 1, SIZE_BUCKET, SIZE_BUCKET),
+        pad_value=pad_value, env_id=args.env_id, memory_mode=mem_mode)
+    return net
+
+
+def predict(net, x):
+    h, w = x.shape[2:]
+    y, _ = net.predict({'input.1': x})
+    # crop the heatmap of the padded input
+    y = y[:, :h // 2, :w // 2]
+    return y
+
+
 def recognize_from_image():
     # net initialize
-    mem_mode = ailia.get_memory_mode(reduce_constant=True, reduce_interstage=True)
-    net = ailia.Net(MODEL_PATH, WEIGHT_PATH, env_id=args.env_id, memory_mode=mem_mode)
+    net = create_net()
 
     # input image loop
     for image_path in args.input:
@@ -62,7 +86,6 @@ def recognize_from_image():
         image = craft_pytorch_utils.load_image(image_path)
         logger.debug(f'input image shape: {image.shape}')
         x, ratio_w, ratio_h = craft_pytorch_utils.pre_process(image)
-        net.set_input_shape((1, 3, x.shape[2], x.shape[3]))
 
         # inference
         logger.info('Start inference...')
@@ -70,11 +93,11 @@ def recognize_from_image():
             logger.info('BENCHMARK mode')
             for i in range(5):
                 start = int(round(time.time() * 1000))
-                y, _ = net.predict({'input.1': x})
+                y = predict(net, x)
                 end = int(round(time.time() * 1000))
                 logger.info(f'\tailia processing time {end - start} ms')
         else:
-            y, _ = net.predict({'input.1': x})
+            y = predict(net, x)
 
         json_path = '%s.json' % args.savepath.rsplit('.', 1)[0] if args.write_json else None
         img = craft_pytorch_utils.post_process(y, image, ratio_w, ratio_h, json_path)
@@ -87,8 +110,7 @@ def recognize_from_image():
 
 def recognize_from_video():
     # net initialize
-    mem_mode = ailia.get_memory_mode(reduce_constant=True, reduce_interstage=True)
-    net = ailia.Net(MODEL_PATH, WEIGHT_PATH, env_id=args.env_id, memory_mode=mem_mode)
+    net = create_net()
 
     capture = webcamera_utils.get_capture(args.video)
 
@@ -110,8 +132,7 @@ def recognize_from_video():
             break
 
         x, ratio_w, ratio_h = craft_pytorch_utils.pre_process(image)
-        net.set_input_shape((1, 3, x.shape[2], x.shape[3]))
-        y, _ = net.predict({'input.1': x})
+        y = predict(net, x)
         img = craft_pytorch_utils.post_process(y, image, ratio_w, ratio_h)
         img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
         cv2.imshow('frame', img)
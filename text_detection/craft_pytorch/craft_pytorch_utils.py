@@ -140,23 +140,20 @@ def get_det_boxes_core(
         text_score_comb.astype(np.uint8), connectivity=4
     )
 
+    # size and thresholding filters of all the labels at once
+    fg = labels > 0
+    max_text = np.zeros(nLabels, dtype=textmap.dtype)
+    np.maximum.at(max_text, labels[fg], textmap[fg])
+    keep = (stats[:, cv2.CC_STAT_AREA] >= 10) & (max_text >= text_threshold)
+    keep[0] = False
+
+    # link area, which is removed from the segmentation map
+    link_area = np.logical_and(link_score == 1, text_score == 0)
+
     det = []
     mapper = []
-    for k in range(1, nLabels):
-        # size filtering
+    for k in np.flatnonzero(keep):
         size = stats[k, cv2.CC_STAT_AREA]
-        if size < 10:
-            continue
-
-        # thresholding
-        if np.max(textmap[labels == k]) < text_threshold:
-            continue
-
-        # make segmentation map
-        segmap = np.zeros(textmap.shape, dtype=np.uint8)
-        segmap[labels == k] = 255
-        # remove link area
-        segmap[np.logical_and(link_score == 1, text_score == 0)] = 0
         x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
         w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
         niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
@@ -171,14 +168,19 @@ def get_det_boxes_core(
             ex = img_w
         if ey >= img_h:
             ey = img_h
+
+        # make segmentation map of the region, which covers the dilated label
+        segmap = np.zeros((ey - sy, ex - sx), dtype=np.uint8)
+        segmap[labels[sy:ey, sx:ex] == k] = 255
+        # remove link area
+        segmap[link_area[sy:ey, sx:ex]] = 0
         kernel = cv2.getStructuringElement(
             cv2.MORPH_RECT, (1 + niter, 1 + niter))
-        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+        segmap = cv2.dilate(segmap, kernel)
 
         # make box
-        np_contours = np.roll(
-            np.array(np.where(segmap != 0)), 1, axis=0
-        ).transpose().reshape(-1, 2)
+        ys, xs = np.where(segmap != 0)
+        np_contours = np.stack([xs + sx, ys + sy], axis=1)
         rectangle = cv2.minAreaRect(np_contours)
         box = cv2.boxPoints(rectangle)
 
@@ -196,7 +198,7 @@ def get_det_boxes_core(
         box = np.array(box)
 
         det.append(box)
-        mapper.append(k)
+        mapper.append(int(k))
 
     return det, labels, mapper
 
@@ -236,17 +238,13 @@ def get_poly_core(boxes, labels, mapper, linkmap):
         word_label[word_label > 0] = 1
 
         """ Polygon generation """
-        # find top/bottom contours
-        cp = []
-        max_len = -1
-        for i in range(w):
-            region = np.where(word_label[:, i] != 0)[0]
-            if len(region) < 2:
-                continue
-            cp.append((i, region[0], region[-1]))
-            length = region[-1] - region[0] + 1
-            if length > max_len:
-                max_len = length
+        # find top/bottom contours of all the columns at once
+        region = word_label != 0
+        cols = np.flatnonzero(np.count_nonzero(region, axis=0) >= 2)
+        top = np.argmax(region[:, cols], axis=0)
+        bottom = region.shape[0] - 1 - np.argmax(region[::-1, cols], axis=0)
+        cp = list(zip(cols.tolist(), top.tolist(), bottom.tolist()))
+        max_len = np.max(bottom - top + 1) if len(cols) > 0 else -1
 
         # pass if max_len is similar to h
         if h * max_len_ratio < max_len:
@@ -13,13 +13,14 @@ from logging import getLogger  # noqa: E402
 import webcamera_utils  # noqa: E402
 from image_utils import imread  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
+from net_pool_utils import NetPool, power_of_two_sizes  # noqa: E402
 from arg_utils import get_base_parser, get_savepath, update_parser  # noqa: E402
 
-logger = getLogger(__name__)
-
 # for EasyOCR
 from easyocr_utils import *
 
+logger = getLogger(__name__)
+
 # ======================
 # PARAMETERS
 # ======================
@@ -47,6 +48,9 @@ SAVE_IMAGE_OR_VIDEO_PATH = 'output.png'
 IMAGE_WIDTH = 640
 IMAGE_HEIGHT = 339
 
+# the batch of the lines is padded to the power of two up to batch_size
+RECOGNIZER_BUCKETS = (power_of_two_sizes(batch_size), 1, 1, 1)
+
 
 
 # ======================
@@ -155,37 +159,37 @@ if __name__ == '__main__':
     # set model
     detector = ailia.Net(DETECTOR_MODEL_PATH, DETECTOR_WEIGHT_PATH, env_id=args.env_id)
     if args.language == 'chinese':
-        recognizer = ailia.Net(RECOGNIZER_CHINESE_MODEL_PATH, RECOGNIZER_CHINESE_WEIGHT_PATH, env_id=args.env_id)
+        recognizer = NetPool(RECOGNIZER_CHINESE_MODEL_PATH, RECOGNIZER_CHINESE_WEIGHT_PATH, buckets=RECOGNIZER_BUCKETS, max_size=len(RECOGNIZER_BUCKETS[0]), env_id=args.env_id)
         lang_list = ['ch_sim','en']
         character = recognition_models['zh_sim_g2']['characters']
         symbol = recognition_models['zh_sim_g2']['symbols']
 
     elif args.language == 'japanese':
-        recognizer = ailia.Net(RECOGNIZER_JAPANESE_MODEL_PATH, RECOGNIZER_JAPANESE_WEIGHT_PATH, env_id=args.env_id)
+        recognizer = NetPool(RECOGNIZER_JAPANESE_MODEL_PATH, RECOGNIZER_JAPANESE_WEIGHT_PATH, buckets=RECOGNIZER_BUCKETS, max_size=len(RECOGNIZER_BUCKETS[0]), env_id=args.env_id)
         lang_list = ['ja','en']
         character = recognition_models['japanese_g2']['characters']
         symbol = recognition_models['japanese_g2']['symbols']
 
     elif args.language == 'english':
-        recognizer = ailia.Net(RECOGNIZER_ENGLISH_MODEL_PATH, RECOGNIZER_ENGLISH_WEIGHT_PATH, env_id=args.env_id)
+        recognizer = NetPool(RECOGNIZER_ENGLISH_MODEL_PATH, RECOGNIZER_ENGLISH_WEIGHT_PATH, buckets=RECOGNIZER_BUCKETS, max_size=len(RECOGNIZER_BUCKETS[0]), env_id=args.env_id)
         lang_list = ['en']
         character = recognition_models['english_g2']['characters']
         symbol = recognition_models['english_g2']['symbols']
 
     elif args.language == 'french':
-        recognizer = ailia.Net(RECOGNIZER_FRENCH_MODEL_PATH, RECOGNIZER_FRENCH_WEIGHT_PATH, env_id=args.env_id)
+        recognizer = NetPool(RECOGNIZER_FRENCH_MODEL_PATH, RECOGNIZER_FRENCH_WEIGHT_PATH, buckets=RECOGNIZER_BUCKETS, max_size=len(RECOGNIZER_BUCKETS[0]), env_id=args.env_id)
         lang_list = ['fr', 'en']
         character = recognition_models['latin_g2']['characters']
         symbol = recognition_models['latin_g2']['symbols']
 
     elif args.language == 'korean':
-        recognizer = ailia.Net(RECOGNIZER_KOREAN_MODEL_PATH, RECOGNIZER_KOREAN_WEIGHT_PATH, env_id=args.env_id)
+        recognizer = NetPool(RECOGNIZER_KOREAN_MODEL_PATH, RECOGNIZER_KOREAN_WEIGHT_PATH, buckets=RECOGNIZER_BUCKETS, max_size=len(RECOGNIZER_BUCKETS[0]), env_id=args.env_id)
         lang_list = ['ko', 'en']
         character = recognition_models['korean_g2']['characters']
         symbol = recognition_models['korean_g2']['symbols']
 
     elif args.language == 'thai':
-        recognizer = ailia.Net(RECOGNIZER_THAI_MODEL_PATH, RECOGNIZER_THAI_WEIGHT_PATH, env_id=args.env_id)
+        recognizer = NetPool(RECOGNIZER_THAI_MODEL_PATH, RECOGNIZER_THAI_WEIGHT_PATH, buckets=RECOGNIZER_BUCKETS, max_size=len(RECOGNIZER_BUCKETS[0]), env_id=args.env_id)
         lang_list = ['th']
         character = recognition_models['thai_g1']['characters']
         symbol = recognition_models['thai_g1']['symbols']
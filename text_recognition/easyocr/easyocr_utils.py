@@ -5,11 +5,16 @@ import random
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
+import ailia
 
 from scipy.special import softmax
 
 from craft_utils import getDetBoxes, adjustResultCoordinates
 from config.model import recognition_models
+from net_pool_utils import NetPool
+
+from logging import getLogger
+logger = getLogger(__name__)
 
 
 # ======================
@@ -33,7 +38,7 @@ add_margin = 0.1 #add_margin = 0.5
 
 # for recognition
 imgH = 64
-batch_size = 1
+batch_size = 16
 contrast_ths = 0.1
 adjust_contrast = 0.5
 filter_ths = 0.003
@@ -289,6 +294,7 @@ class CTCLabelConverter(object):
             self.dict[char] = i + 1
 
         self.character = ['[blank]'] + dict_character  # dummy '[blank]' token for CTCLoss (index 0)
+        self.character_array = np.array(self.character)
 
         self.separator_list = separator_list
         separator_char = []
@@ -317,20 +323,23 @@ class CTCLabelConverter(object):
 
     def decode_greedy(self, text_index, length):
         """ convert text-index into text-label. """
-        texts = []
-        index = 0
-        for l in length:
-            t = text_index[index:index + l]
-            # Returns a boolean array where true is when the value is not repeated
-            a = np.insert(~((t[1:]==t[:-1])),0,True)
-            # Returns a boolean array where true is when the value is not in the ignore_idx list
-            b = ~np.isin(t,np.array(self.ignore_idx))
-            # Combine the two boolean array
-            c = a & b
-            # Gets the corresponding character according to the saved indexes
-            text = ''.join(np.array(self.character)[t[c.nonzero()]])
-            texts.append(text)
-            index += l
+        text_index = np.asarray(text_index).reshape(-1)
+        ends = np.cumsum(length).astype(int)
+        starts = ends - np.asarray(length, dtype=int)
+
+        # Returns a boolean array where true is when the value is not repeated in each text
+        a = np.ones(len(text_index), dtype=bool)
+        a[1:] = text_index[1:] != text_index[:-1]
+        a[starts[starts < len(text_index)]] = True
+        # Returns a boolean array where true is when the value is not in the ignore_idx list
+        b = ~np.isin(text_index, np.array(self.ignore_idx))
+        # Combine the two boolean array
+        c = a & b
+
+        # Gets the corresponding characters of all the texts at once, and split them
+        chars = self.character_array[text_index[c]]
+        csum = np.concatenate([[0], np.cumsum(c)])
+        texts = [''.join(chars[i:j]) for i, j in zip(csum[starts], csum[ends])]
         return texts
 
 
@@ -511,97 +520,142 @@ def get_image_list(horizontal_list, free_list, img, model_height = 64, sort_outp
     return image_list, max_width
 
 
-def recognize(language, net, converter, img_list, batch_max_length, ignore_idx):
-    result = []
-    for t, image_tensors in enumerate(img_list):
-        batch_size = image_tensors.shape[0]
-        image = image_tensors
-        tmp = image.squeeze()
-
-        #
-        # Set appropriate constant width because current onnx exporter does not support operator adaptive pooling with dynamic axis.
-        #
-        # ONNX export of operator adaptive pooling, since output_size is not constant..
-        # Please feel free to request support or submit a pull request on PyTorch GitHub.
-        #
-        if language == 'chinese':
-            tmp = cv2.resize(tmp, (128, 64))
-        elif language == 'japanese':
-            tmp = cv2.resize(tmp, (422, 64))
-        elif language == 'english':
-            tmp = cv2.resize(tmp, (680, 64))
-        elif language == 'french':
-            tmp = cv2.resize(tmp, (268, 64))
-        elif language == 'korean':
-            tmp = cv2.resize(tmp, (150, 64))
-        elif language == 'thai':
-            tmp = cv2.resize(tmp, (192, 64))
+# Set appropriate constant width because current onnx exporter does not support operator adaptive pooling with dynamic axis.
+#
+# ONNX export of operator adaptive pooling, since output_size is not constant..
+# Please feel free to request support or submit a pull request on PyTorch GitHub.
+#
+recognizer_width = {
+    'chinese': 128,
+    'japanese': 422,
+    'english': 680,
+    'french': 268,
+    'korean': 150,
+    'thai': 192,
+}
+
+# errors of ailia for the input shape which the recognizer does not accept
+batch_errors = tuple(
+    getattr(ailia, name) for name in (
+        'AiliaInvalidArgumentException',
+        'AiliaInvalidLayerException',
+        'AiliaUnsettledShapeException',
+    ) if hasattr(ailia, name)
+)
+
+
+def recognizer_forward(net, images):
+    """
+    Run the recognizer for the lines in the batches of batch_size.
+    If the recognizer is exported with the fixed batch size,
+    the lines are run one by one, which is kept in net.batch_lines.
+    """
+    if getattr(net, 'batch_lines', True) and 1 < len(images):
+        try:
+            preds = []
+            for i in range(0, len(images), batch_size):
+                batch = images[i:i + batch_size]
+                # drop the padding of the batch of the pool
+                preds.append(net.predict(batch)[:len(batch)])
+            preds = np.concatenate(preds)
+            if len(preds) == len(images):
+                return preds
+        except batch_errors as e:
+            logger.debug(e)
+        logger.warning('The recognizer does not accept the batch of the lines. So run them one by one.')
+        net.batch_lines = False
+
+    preds = []
+    for i in range(len(images)):
+        image = images[i:i + 1]
+        if isinstance(net, NetPool):
+            preds.append(net.get(image.shape).predict(image))
         else:
-            exit()
-
-        image = tmp[np.newaxis, np.newaxis, :, :]
+            preds.append(net.predict(image))
+    return np.concatenate(preds)
 
-        preds = net.predict(image)
 
-        # Select max probabilty (greedy decoding) then decode index to character
-        preds_size = [preds.shape[1]] * batch_size
-
-        ######## filter ignore_char, rebalance
-        preds_prob = softmax(preds, axis=2)
-        preds_prob[:,:,ignore_idx] = 0.
-        pred_norm = preds_prob.sum(axis=2)
-        preds_prob = preds_prob/np.expand_dims(pred_norm, axis=-1)
-
-        # Select max probabilty (greedy decoding) then decode index to character
-        preds_index = np.argmax(preds_prob, axis=2)
-        preds_index = np.squeeze(preds_index)
-        preds_str = converter.decode_greedy(preds_index, preds_size)
-
-        values = preds_prob.max(axis=2)
-        indices = preds_prob.argmax(axis=2)
-        preds_max_prob = []
-        for v,i in zip(values, indices):
-            max_probs = v[i!=0]
-            if len(max_probs)>0:
-                preds_max_prob.append(max_probs)
-            else:
-                preds_max_prob.append(np.array([0]))
-
-        for pred, pred_max_prob in zip(preds_str, preds_max_prob):
-            confidence_score = custom_mean(pred_max_prob)
-            result.append([pred, confidence_score])
+def recognize(language, net, converter, img_list, batch_max_length, ignore_idx):
+    if language not in recognizer_width:
+        exit()
+    if len(img_list) == 0:
+        return []
+
+    # resize all the lines to the width of the model, and recognize them in the batches
+    width = recognizer_width[language]
+    image = np.stack([
+        cv2.resize(image_tensors.squeeze(), (width, 64)) for image_tensors in img_list
+    ])
+    image = image[:, np.newaxis, :, :]
+
+    preds = recognizer_forward(net, image)
+
+    # Select max probabilty (greedy decoding) then decode index to character
+    preds_size = [preds.shape[1]] * preds.shape[0]
+
+    ######## filter ignore_char, rebalance
+    preds_prob = softmax(preds, axis=2)
+    preds_prob[:,:,ignore_idx] = 0.
+    pred_norm = preds_prob.sum(axis=2)
+    preds_prob = preds_prob/np.expand_dims(pred_norm, axis=-1)
+
+    # Select max probabilty (greedy decoding) then decode index to character
+    preds_index = np.argmax(preds_prob, axis=2)
+    preds_str = converter.decode_greedy(preds_index, preds_size)
+
+    # confidence score is custom_mean of the max probabilities of the non-blank steps
+    values = np.take_along_axis(preds_prob, preds_index[:, :, np.newaxis], axis=2)[:, :, 0]
+    not_blank = preds_index != 0
+    num = np.count_nonzero(not_blank, axis=1)
+    prod = np.where(not_blank, values, 1).prod(axis=1)
+    confidence_scores = np.where(0 < num, prod ** (2.0 / np.sqrt(np.maximum(num, 1))), 0)
+
+    result = [[pred, score] for pred, score in zip(preds_str, confidence_scores)]
 
     return result
 
 
 def get_text(language, character, imgH, imgW, recognizer, converter, image_list, ignore_char = ''):
-    batch_max_length = int(imgW/10)
+    lines = [(box, img, imgW) for box, img in image_list]
+    return get_text_lines(language, character, imgH, recognizer, converter, lines, ignore_char)
+
+
+def get_text_lines(language, character, imgH, recognizer, converter, lines, ignore_char = ''):
+    """
+    Recognize the lines of the page at once.
+    The contrast adjusted lines to retry the low confident ones are
+    recognized in the same batches as the lines.
 
+    lines: list of (box, img, imgW) of each line.
+    """
     ignore_idx = []
     for char in ignore_char:
         try: ignore_idx.append(character.index(char)+1)
         except: pass
 
-    coord = [item[0] for item in image_list]
-    img_list = [item[1] for item in image_list]
-    input_list = [preprocess(img, imgH, imgW, keep_ratio_with_pad=True) for img in img_list]
+    coord = [item[0] for item in lines]
+    img_list = [item[1] for item in lines]
+    input_list = [preprocess(img, imgH, imgW, keep_ratio_with_pad=True) for _, img, imgW in lines]
 
-    # predict first round
-    result1 = recognize(language, recognizer, converter, input_list, batch_max_length, ignore_idx)
+    # the lines whose contrast is adjusted for the second round.
+    # the other lines are same in the second round.
+    adjusted_idx = [i for i, img in enumerate(img_list) if contrast_grey(img)[0] < adjust_contrast]
+    input_list2 = [
+        preprocess(img_list[i], imgH, lines[i][2], keep_ratio_with_pad=True, adjust_contrast=adjust_contrast)
+        for i in adjusted_idx
+    ]
 
-    # predict second round
-    low_confident_idx = [i for i,item in enumerate(result1) if (item[1] < contrast_ths)]
-    if len(low_confident_idx) > 0:
-        img_list2 = [img_list[i] for i in low_confident_idx]
-        input_list2 = [preprocess(img, imgH, imgW, keep_ratio_with_pad=True, adjust_contrast=adjust_contrast) for img in img_list2]
-
-        result2 = recognize(language, recognizer, converter, input_list2, batch_max_length, ignore_idx)
+    # predict first and second round at once
+    batch_max_length = int(max([imgW for _, _, imgW in lines], default=0)/10)
+    result_all = recognize(language, recognizer, converter, input_list + input_list2, batch_max_length, ignore_idx)
+    result1 = result_all[:len(input_list)]
+    result2 = dict(zip(adjusted_idx, result_all[len(input_list):]))
 
     result = []
     for i, zipped in enumerate(zip(coord, result1)):
         box, pred1 = zipped
-        if i in low_confident_idx:
-            pred2 = result2[low_confident_idx.index(i)]
+        if pred1[1] < contrast_ths and i in result2:
+            pred2 = result2[i]
             if pred1[1]>pred2[1]:
                 result.append( (box, pred1[0], pred1[1]) )
             else:
@@ -627,21 +681,20 @@ def recognizer_predict(language, lang_list, character, symbol, net, image_grey,
         horizontal_list = [[0, x_max, 0, y_max]]
         free_list = []
 
-    result = []
+    # crop all the lines of the page, and recognize them at once
+    lines = []
     for bbox in horizontal_list:
         h_list = [bbox]
         f_list = []
         image_list, max_width = get_image_list(h_list, f_list, image_grey)
-        result0 = get_text(language, character, imgH, int(max_width), net, converter, image_list,\
-                      ignore_char)
-        result += result0
+        lines += [(box, img, int(max_width)) for box, img in image_list]
     for bbox in free_list:
         h_list = []
         f_list = [bbox]
         image_list, max_width = get_image_list(h_list, f_list, image_grey)
-        result0 = get_text(language, character, imgH, int(max_width), net, converter, image_list,\
-                      ignore_char)
-        result += result0
+        lines += [(box, img, int(max_width)) for box, img in image_list]
+
+    result = get_text_lines(language, character, imgH, net, converter, lines, ignore_char)
 
     return result
 
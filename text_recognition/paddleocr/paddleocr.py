@@ -6,6 +6,8 @@ import math
 import sys
 import time
 import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 # logger
 from logging import getLogger
 
@@ -21,6 +23,7 @@ sys.path.append('../../util')
 import webcamera_utils  # noqa: E402
 from image_utils import imread  # noqa: E402
 from model_utils import check_and_download_models  # noqa: E402
+from net_pool_utils import NetPool  # noqa: E402
 from arg_utils import get_base_parser, update_parser, get_savepath  # noqa: E402
 
 logger = getLogger(__name__)
@@ -67,7 +70,11 @@ DICT_PATH_REC_KOR_MBL = './dict/kor_eng_num_sym_org.txt'
 IMAGE_OR_VIDEO_PATH = 'input.jpg'
 SAVE_IMAGE_OR_VIDEO_PATH = 'output.png'
 
-REOPEN_REQUIRE_IF_SHAPE_CHANED = True # Require for ailia SDK <= 1.2.16
+# input shapes are rounded up to the multiples of these,
+# so that the inputs of the similar size share the same network
+DET_SIZE_BUCKET = 128
+CLS_BATCH_BUCKET = 8
+REC_WIDTH_BUCKET = 64
 
 # ======================
 # Arguemnt Parser Config
@@ -114,6 +121,11 @@ parser.add_argument(
     action='store_true',
     help='Flag to output results to file.'
 )
+parser.add_argument(
+    '--pages_per_batch', type=int, default=4,
+    help=('The text lines of this number of the input images are recognized together. '
+          'The detection of the next images runs while recognizing them.')
+)
 args = update_parser(parser)
 
 det_model = args.det_model
@@ -763,9 +775,10 @@ class TextDetector(object):
 
         self.preprocess_op = create_operators(pre_process_list)
         self.postprocess_op = build_post_process(postprocess_params)
-        self.net = ailia.Net(self.config['det_model_path'] + '.prototxt',
-                             self.config['det_model_path'], env_id=self.env_id)
-        self.called = False
+        self.net = NetPool(self.config['det_model_path'] + '.prototxt',
+                           self.config['det_model_path'],
+                           buckets=(1, 1, DET_SIZE_BUCKET, DET_SIZE_BUCKET),
+                           env_id=self.env_id)
 
     def order_points_clockwise(self, pts):
         """
@@ -822,12 +835,10 @@ class TextDetector(object):
         img = img.copy()
         starttime = time.time()
 
-        # net initialize, Text Detection
-        if self.called and self.net.get_input_shape() != img.shape and REOPEN_REQUIRE_IF_SHAPE_CHANED:
-            self.net = ailia.Net(self.config['det_model_path'] + '.prototxt',
-                                 self.config['det_model_path'], env_id=self.env_id)
+        # Text Detection
         outputs = self.net.predict(img)
-        self.called = True
+        # crop the map of the padded input
+        outputs = outputs[:, :, :img.shape[2], :img.shape[3]]
 
         preds = {'maps': outputs}
 
@@ -853,9 +864,10 @@ class TextClassifier(object):
             "label_list": OCR_CFG['label_list'],
         }
         self.postprocess_op = build_post_process(postprocess_params)
-        self.net = ailia.Net(self.cfg['cls_model_path'] + '.prototxt',
-                             self.cfg['cls_model_path'], env_id=self.env_id)
-        self.called = False
+        self.net = NetPool(self.cfg['cls_model_path'] + '.prototxt',
+                           self.cfg['cls_model_path'],
+                           buckets=(CLS_BATCH_BUCKET, 1, 1, 1),
+                           env_id=self.env_id)
 
     def resize_norm_img(self, img):
         imgC, imgH, imgW = self.cls_image_shape
@@ -908,13 +920,9 @@ class TextClassifier(object):
             norm_img_batch = norm_img_batch.copy()
             starttime = time.time()
 
-            # net initialize, Detection Boxes Rectify
-            if self.called and self.net.get_input_shape() != norm_img_batch.shape and REOPEN_REQUIRE_IF_SHAPE_CHANED:
-                self.net = ailia.Net(self.cfg['cls_model_path'] + '.prototxt',
-                                     self.cfg['cls_model_path'], env_id=self.env_id)
-            self.net.set_input_shape(norm_img_batch.shape)
+            # Detection Boxes Rectify
             prob_out = self.net.predict(norm_img_batch)
-            self.called = True
+            prob_out = prob_out[:len(norm_img_batch)]
 
             cls_result = self.postprocess_op(prob_out)
             elapse += time.time() - starttime
@@ -948,9 +956,10 @@ class TextRecognizer(object):
             "use_space_char": OCR_CFG['use_space_char']
         }
         self.postprocess_op = build_post_process(postprocess_params)
-        self.net = ailia.Net(self.config['rec_model_path'] + '.prototxt',
-                             self.config['rec_model_path'], env_id=self.env_id)
-        self.called = False
+        self.net = NetPool(self.config['rec_model_path'] + '.prototxt',
+                           self.config['rec_model_path'],
+                           buckets=(self.rec_batch_num, 1, 1, REC_WIDTH_BUCKET),
+                           max_size=8, env_id=self.env_id)
 
     def resize_norm_img(self, img, max_wh_ratio):
         imgC, imgH, imgW = self.rec_image_shape
@@ -1007,12 +1016,10 @@ class TextRecognizer(object):
             norm_img_batch = norm_img_batch.copy()
             starttime = time.time()
 
-            # net initialize, Text Recognition
-            if self.called and self.net.get_input_shape() != norm_img_batch.shape and REOPEN_REQUIRE_IF_SHAPE_CHANED:
-                self.net = ailia.Net(self.config['rec_model_path'] + '.prototxt',
-                                     self.config['rec_model_path'], env_id=self.env_id)
+            # Text Recognition
+            # the padded width is decoded as the blank, same as the padding of the batch
             preds = self.net.predict(norm_img_batch)
-            self.called = True
+            preds = preds[:len(norm_img_batch)]
 
             rec_result = self.postprocess_op(preds)
             for rno in range(len(rec_result)):
@@ -1065,14 +1072,12 @@ class TextSystem(object):
             dst_img = np.rot90(dst_img)
         return dst_img
 
-    def __call__(self, img):
-        ori_im = img.copy()
+    def detect(self, img):
         dt_boxes, elapse = self.text_detector(img)
         logger.info("dt_boxes num : {}, elapse : {}".format(
             len(dt_boxes), elapse))
         if dt_boxes is None:
-            return None, None
-        img_crop_list = []
+            return None
 
         dt_boxes = sorted_boxes(dt_boxes)
 
@@ -1094,10 +1099,9 @@ class TextSystem(object):
             dt_boxes[:, 1, :] -= padding_vec
             dt_boxes[:, 3, :] += padding_vec
 
-        for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
-            img_crop = self.get_rotate_crop_image(ori_im, tmp_box)
-            img_crop_list.append(img_crop)
+        return dt_boxes
+
+    def recognize(self, img_crop_list):
         if self.use_angle_cls:
             img_crop_list, angle_list, elapse = self.text_classifier(
                 img_crop_list)
@@ -1107,6 +1111,10 @@ class TextSystem(object):
         rec_res, elapse = self.text_recognizer(img_crop_list)
         logger.info("rec_res num  : {}, elapse : {}".format(
             len(rec_res), elapse))
+
+        return rec_res
+
+    def filter_results(self, dt_boxes, rec_res):
         filter_boxes, filter_rec_res = [], []
         for box, rec_reuslt in zip(dt_boxes, rec_res):
             text, score = rec_reuslt
@@ -1116,6 +1124,89 @@ class TextSystem(object):
 
         return filter_boxes, filter_rec_res
 
+    def __call__(self, img):
+        ori_im = img.copy()
+        dt_boxes = self.detect(img)
+        if dt_boxes is None:
+            return None, None
+
+        img_crop_list = []
+        for bno in range(len(dt_boxes)):
+            tmp_box = copy.deepcopy(dt_boxes[bno])
+            img_crop = self.get_rotate_crop_image(ori_im, tmp_box)
+            img_crop_list.append(img_crop)
+
+        rec_res = self.recognize(img_crop_list)
+
+        return self.filter_results(dt_boxes, rec_res)
+
+    def _detect_and_crop(self, img, crop_executor):
+        dt_boxes = self.detect(img)
+        if dt_boxes is None:
+            return None, []
+
+        futures = [
+            crop_executor.submit(self.get_rotate_crop_image, img, copy.deepcopy(box))
+            for box in dt_boxes
+        ]
+        return dt_boxes, futures
+
+    def ocr_pages(self, imgs, pages_per_batch=4, num_workers=4):
+        """
+        OCR of many images (ex. the pages of the scanned document).
+        The detection runs in the background thread ahead of the recognition,
+        so that the next pages are detected while recognizing the current ones.
+        The text lines are cropped in the thread pool, and the lines of
+        pages_per_batch pages are recognized together in the width sorted batches.
+
+        Parameters
+        ----------
+        imgs: iterable of numpy.ndarray
+            The BGR images, which are read as they are needed.
+        pages_per_batch: int
+            The number of the pages whose text lines are recognized together.
+        num_workers: int
+            The number of the threads to crop the text lines.
+
+        Yields
+        ------
+        dt_boxes, rec_res:
+            The results of each image in order, same as __call__.
+        """
+        imgs = iter(imgs)
+        pages_per_batch = max(pages_per_batch, 1)
+
+        # the detector is used only by its thread, and the other models by the caller
+        with ThreadPoolExecutor(max_workers=1) as det_executor, \
+                ThreadPoolExecutor(max_workers=num_workers) as crop_executor:
+            def submit_next():
+                for img in imgs:
+                    pages.append(det_executor.submit(self._detect_and_crop, img, crop_executor))
+                    break
+
+            pages = deque()
+            for _ in range(pages_per_batch):
+                submit_next()
+
+            while pages:
+                batch = []
+                while pages and len(batch) < pages_per_batch:
+                    batch.append(pages.popleft().result())
+                    # keep the detector busy while recognizing the batch
+                    submit_next()
+
+                img_crop_list = [f.result() for _, futures in batch for f in futures]
+                rec_res = self.recognize(img_crop_list) if img_crop_list else []
+
+                i = 0
+                for dt_boxes, futures in batch:
+                    if dt_boxes is None:
+                        yield None, None
+                        continue
+                    n = len(futures)
+                    yield self.filter_results(dt_boxes, rec_res[i:i + n])
+                    i += n
+
 
 def sorted_boxes(dt_boxes):
     """
@@ -1225,12 +1316,18 @@ def adjust_half_and_full(txts):
 
 
 def recognize_from_image(config, text_sys):
-    for img_path in args.input:
-        # read image
-        img = imread(img_path)
-
-        # exec ocr
-        dt_boxes, rec_res = text_sys(img)
+    # the images are read as the pages are processed
+    read_imgs = deque()
+
+    def read_images():
+        for img_path in args.input:
+            img = imread(img_path)
+            read_imgs.append(img)
+            yield img
+
+    results = text_sys.ocr_pages(read_images(), pages_per_batch=args.pages_per_batch)
+    for img_path, (dt_boxes, rec_res) in zip(args.input, results):
+        img = read_imgs.popleft()
 
         image = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
         boxes = dt_boxes
@@ -111,6 +111,11 @@ def get_base_parser(
         default=5, type=int,
         help='set iteration count of benchmark'
     )
+    parser.add_argument(
+        '--threaded_io', action='store_true',
+        help=('decode and encode the video in background threads '
+              'to overlap them with the inference (video mode)')
+    )
     return parser
 
 
@@ -133,6 +138,10 @@ def update_parser(parser, check_input_type=True, large_model=False):
     if args.debug:
         logger.setLevel(DEBUG)
 
+    if getattr(args, 'threaded_io', False):
+        import webcamera_utils
+        webcamera_utils.set_threaded_io(True)
+
     # -------------------------------------------------------------------------
     # 1. check env_id count
     if AILIA_EXIST:
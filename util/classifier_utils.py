@@ -31,13 +31,70 @@ def print_results(classifier, labels, top_k=MAX_CLASS_COUNT):
     top_scores, scores = get_top_scores(classifier, top_k)
     top_k = min(len(top_scores),top_k)
 
+    top_scores = top_scores[:top_k]
+    print_topk_results(top_scores, [scores[i] for i in top_scores], labels)
+
+
+def zero_shot_topk(
+        image_features, text_features, top_k=MAX_CLASS_COUNT,
+        logit_scale=100, chunk_size=256):
+    """
+    Top-k labels of the images by the softmax over the similarities
+    between the image features and the text features of the labels.
+    The scores of chunk_size images are computed by one matrix product.
+
+    Parameters
+    ----------
+    image_features: numpy.ndarray
+        (N, D) image features.
+    text_features: numpy.ndarray
+        (L, D) text features of the labels (can be memory-mapped).
+    top_k: int
+        The number of the labels for each image.
+    logit_scale: float
+        The scale of the similarities.
+    chunk_size: int
+        The number of images scored at once.
+
+    Returns
+    -------
+    top_indices: numpy.ndarray
+        (N, top_k) label indices sorted by descending probability.
+    top_probs: numpy.ndarray
+        (N, top_k) probabilities.
+    """
+    n = len(image_features)
+    top_k = min(top_k, len(text_features))
+    top_indices = np.zeros((n, top_k), dtype=np.int64)
+    top_probs = np.zeros((n, top_k), dtype=np.float32)
+
+    for i in range(0, n, chunk_size):
+        logits = (image_features[i:i + chunk_size] * logit_scale).dot(text_features.T)
+        logits = logits - np.max(logits, axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs = probs / np.sum(probs, axis=1, keepdims=True)
+
+        idx = np.argpartition(-probs, top_k - 1, axis=1)[:, :top_k]
+        p = np.take_along_axis(probs, idx, axis=1)
+        order = np.argsort(-p, axis=1, kind='stable')
+        top_indices[i:i + chunk_size] = np.take_along_axis(idx, order, axis=1)
+        top_probs[i:i + chunk_size] = np.take_along_axis(p, order, axis=1)
+
+    return top_indices, top_probs
+
+
+def print_topk_results(top_indices, top_probs, labels):
+    """
+    Print the top-k labels and their probabilities,
+    ex. the result of zero_shot_topk for one image.
+    """
     print('==============================================================')
-    print(f'class_count={top_k}')
-    for idx in range(top_k):
+    print(f'class_count={len(top_indices)}')
+    for idx, (i, prob) in enumerate(zip(top_indices, top_probs)):
         print(f'+ idx={idx}')
-        print(f'  category={top_scores[idx]}['
-              f'{labels[top_scores[idx]]} ]')
-        print(f'  prob={scores[top_scores[idx]]}')
+        print(f'  category={i}['
+              f'{labels[i]} ]')
+        print(f'  prob={prob}')
 
 
 def hsv_to_rgb(h, s, v):
@@ -56,15 +113,9 @@ def plot_results(input_image, classifier, labels, top_k=MAX_CLASS_COUNT, logging
     top_k = min(len(top_scores),top_k)
 
     if logging:
-        print('==============================================================')
-        print(f'class_count={top_k}')
+        print_topk_results(
+            top_scores[:top_k], [scores[i] for i in top_scores[:top_k]], labels)
     for idx in range(top_k):
-        if logging:
-            print(f'+ idx={idx}')
-            print(f'  category={top_scores[idx]}['
-                f'{labels[top_scores[idx]]} ]')
-            print(f'  prob={scores[top_scores[idx]]}')
-        
         text = f'category={top_scores[idx]}[{labels[top_scores[idx]]} ] prob={scores[top_scores[idx]]}'
 
         color = hsv_to_rgb(256 * top_scores[idx] / (len(labels)+1), 128, 255)
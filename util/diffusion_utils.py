@@ -0,0 +1,287 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+
+# logger
+from logging import getLogger
+logger = getLogger(__name__)
+
+
+def concat_conditioning(uncond, cond):
+    """
+    Concatenate the unconditional and conditional conditioning along the batch axis.
+
+    Parameters
+    ----------
+    uncond, cond: numpy.ndarray or dict
+        The context array, or a dict of lists of arrays
+        ex. {"c_concat": [hint], "c_crossattn": [context]} of ControlNet.
+
+    Returns
+    -------
+    c_in: numpy.ndarray or dict
+        The conditioning of the batch [uncond, cond].
+    """
+    if isinstance(cond, dict):
+        return {
+            k: [np.concatenate([u, c]) for u, c in zip(uncond[k], cond[k])]
+            for k in cond
+        }
+    return np.concatenate([uncond, cond])
+
+
+def guided_model_output(apply_model, x, t, cond, uncond, cfg_scale, **kwargs):
+    """
+    Model output with classifier-free guidance.
+    The unconditional and conditional inputs are stacked into one batch of 2N,
+    so that the model runs once per step.
+
+    Parameters
+    ----------
+    apply_model: function
+        apply_model(x, t, cond, **kwargs) returns the model output of the batch.
+    x: numpy.ndarray
+        (N, C, H, W) latents.
+    t: numpy.ndarray
+        (N,) timesteps (or sigmas).
+    cond, uncond: numpy.ndarray or dict
+        The conditioning, see concat_conditioning.
+        If uncond is None or cfg_scale is 1, the model runs only with cond.
+    cfg_scale: float
+        Classifier-free guidance scale.
+
+    Returns
+    -------
+    out: numpy.ndarray
+        uncond_out + cfg_scale * (cond_out - uncond_out)
+    """
+    if uncond is None or cfg_scale == 1.:
+        return apply_model(x, t, cond, **kwargs)
+
+    x_in = np.concatenate([x] * 2)
+    t_in = np.concatenate([t] * 2)
+    c_in = concat_conditioning(uncond, cond)
+
+    out = apply_model(x_in, t_in, c_in, **kwargs)
+    out_uncond, out_cond = np.split(out, 2)
+
+    return out_uncond + cfg_scale * (out_cond - out_uncond)
+
+
+def _tile_starts(size, tile, stride):
+    if size <= tile:
+        return [0]
+    starts = list(range(0, size - tile + 1, stride))
+    if starts[-1] + tile < size:
+        starts.append(size - tile)
+    return starts
+
+
+def blend_weighting(h, w, overlap):
+    """
+    Weights of the decoded tile, which linearly ramp up over the overlap at the borders.
+
+    Parameters
+    ----------
+    h, w: int
+        The tile size in pixel space.
+    overlap: int
+        The overlap between the tiles in pixel space.
+
+    Returns
+    -------
+    weighting: numpy.ndarray
+        (h, w) weights, which are greater than 0.
+    """
+
+    def ramp(n):
+        r = np.ones(n, dtype=np.float32)
+        ov = min(overlap, n // 2)
+        if ov > 0:
+            x = (np.arange(ov, dtype=np.float32) + 0.5) / ov
+            r[:ov] = x
+            r[n - ov:] = x[::-1]
+        return r
+
+    return np.outer(ramp(h), ramp(w))
+
+
+def decode_tiled(
+        decode_fn, z, tile_size=64, overlap=16, scale=8,
+        weighting=None, out=None):
+    """
+    Decode the latents tile by tile, and blend the overlapping tiles.
+    The tiles are decoded one row band at a time, and the rows of the image
+    are written to out as soon as no more tiles overlap them,
+    so that only two row bands are kept besides out.
+
+    Parameters
+    ----------
+    decode_fn: function
+        decode_fn(z_tile) returns the (N, C, h * scale, w * scale) decoded image of the (N, c, h, w) latents.
+    z: numpy.ndarray
+        (N, c, H, W) latents.
+    tile_size: int
+        The tile size in latent space.
+    overlap: int
+        The overlap between the tiles in latent space.
+    scale: int
+        The upsampling factor of the decoder.
+    weighting: function
+        weighting(h, w) returns the (h, w) weights of the decoded tile.
+        Default is blend_weighting with the overlap in pixel space.
+    out: numpy.ndarray or string
+        The (N, C, H * scale, W * scale) array to write the decoded image.
+        If string, the image is streamed to the .npy file of the path (numpy.memmap).
+        If None, the array is allocated.
+
+    Returns
+    -------
+    out: numpy.ndarray
+        (N, C, H * scale, W * scale) decoded image.
+    """
+    n, _, h, w = z.shape
+    th = min(tile_size, h)
+    tw = min(tile_size, w)
+    stride = max(tile_size - overlap, 1)
+    ys = _tile_starts(h, th, stride)
+    xs = _tile_starts(w, tw, stride)
+
+    if weighting is None:
+        weighting = partial(blend_weighting, overlap=overlap * scale)
+    weight = weighting(th * scale, tw * scale).astype(np.float32)
+
+    band_h = th * scale
+    pend_y = pend_acc = pend_w = None
+    for y in ys:
+        acc = None
+        acc_w = np.zeros((band_h, w * scale), dtype=np.float32)
+        for x in xs:
+            dec = decode_fn(z[:, :, y:y + th, x:x + tw])
+            if acc is None:
+                acc = np.zeros((n, dec.shape[1], band_h, w * scale), dtype=np.float32)
+            x0, x1 = x * scale, (x + tw) * scale
+            acc[:, :, :, x0:x1] += dec * weight
+            acc_w[:, x0:x1] += weight
+
+        if out is None or isinstance(out, str):
+            shape = (n, acc.shape[1], h * scale, w * scale)
+            if out is None:
+                out = np.zeros(shape, dtype=np.float32)
+            else:
+                out = np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=shape)
+
+        y = y * scale
+        if pend_acc is not None:
+            # rows above the band are complete
+            k = y - pend_y
+            out[:, :, pend_y:y] = pend_acc[:, :, :k] / pend_w[:k]
+            acc[:, :, :band_h - k] += pend_acc[:, :, k:]
+            acc_w[:band_h - k] += pend_w[k:]
+        pend_y, pend_acc, pend_w = y, acc, acc_w
+
+    out[:, :, pend_y:pend_y + band_h] = pend_acc / pend_w
+    if isinstance(out, np.memmap):
+        out.flush()
+
+    return out
+
+
+class TextEmbeddingCache:
+    """
+    LRU cache of the text embeddings (ex. CLIP hidden states of the prompts),
+    keyed by the content (model, prompt, max_length).
+    The embeddings are also saved to cache_dir as "<sha256 of the key>.npy",
+    so that they are reused in the next runs.
+
+    Parameters
+    ----------
+    model: string
+        The name of the text encoder, which is a part of the key.
+    max_length: int
+        The max token length of the text encoder, which is a part of the key.
+    cache_dir: string
+        The directory to save the embeddings. If None, only cached in memory.
+    max_size: int
+        Max number of the embeddings kept in memory.
+    """
+
+    def __init__(self, model, max_length=77, cache_dir=None, max_size=256):
+        self.model = model
+        self.max_length = max_length
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.cache = OrderedDict()
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, text):
+        key = json.dumps([self.model, text, self.max_length], ensure_ascii=False)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get(self, text):
+        key = self.key(text)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + '.npy')
+            if os.path.isfile(path):
+                embedding = np.load(path)
+                self._put(key, embedding)
+                return embedding
+
+        return None
+
+    def put(self, text, embedding):
+        key = self.key(text)
+        self._put(key, embedding)
+
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + '.npy')
+            # write to the temporary file, so that the incomplete file is not read
+            tmp_path = path + '.tmp.npy'
+            np.save(tmp_path, embedding)
+            os.replace(tmp_path, path)
+
+    def _put(self, key, embedding):
+        self.cache[key] = embedding
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def encode(self, texts, encode_fn):
+        """
+        Get the embeddings of the texts.
+        Only the texts which are not cached are encoded by encode_fn in one batch.
+
+        Parameters
+        ----------
+        texts: list of string
+        encode_fn: function
+            encode_fn(texts) returns the (len(texts), ...) embeddings.
+
+        Returns
+        -------
+        embeddings: numpy.ndarray
+            (len(texts), ...) embeddings.
+        """
+        embeddings = {}
+        for text in texts:
+            if text not in embeddings:
+                embeddings[text] = self.get(text)
+
+        missing = [text for text, emb in embeddings.items() if emb is None]
+        if missing:
+            logger.debug('encode %d texts (%d cached)' % (len(missing), len(embeddings) - len(missing)))
+            for text, emb in zip(missing, encode_fn(missing)):
+                embeddings[text] = emb
+                self.put(text, emb)
+
+        return np.stack([embeddings[text] for text in texts])
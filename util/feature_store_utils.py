@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+# logger
+from logging import getLogger
+logger = getLogger(__name__)
+
+FEATURE_STORE_FORMAT = 'ailia-feature-store'
+FEATURE_STORE_VERSION = 1
+HEADER_FILE = 'header.json'
+
+# stores opened in this process, keyed by absolute path
+_opened_stores = {}
+
+
+def is_feature_store(path):
+    """
+    Check if the given path is a directory saved by save_feature_store.
+    """
+    return os.path.isfile(os.path.join(path, HEADER_FILE))
+
+
+def save_feature_store(path, header, arrays):
+    """
+    Save the trained feature arrays and their header to the directory.
+
+    Parameters
+    ----------
+    path: string
+        The directory to save. It is created if it does not exist.
+    header: dict
+        JSON serializable information of the trained features.
+        ex. {"model": "padim", "arch": "resnet18", "feat_names": [...],
+             "crop_size": 224, "idx": [...]}
+    arrays: dict
+        The arrays to save, keyed by name.
+        Each array is saved as "<name>.npy" which can be memory-mapped.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    info = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(path, name + '.npy'), array)
+        info[name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    header = dict(header)
+    header['format'] = FEATURE_STORE_FORMAT
+    header['version'] = FEATURE_STORE_VERSION
+    header['arrays'] = info
+
+    # header is written at last, so incomplete store is not recognized
+    with open(os.path.join(path, HEADER_FILE), 'w') as f:
+        json.dump(header, f, indent=2)
+
+    _opened_stores.pop(os.path.abspath(path), None)
+
+
+def load_feature_store(path, mmap=True):
+    """
+    Open the directory saved by save_feature_store.
+    The arrays are memory-mapped and the store is opened only once per process.
+
+    Parameters
+    ----------
+    path: string
+        The directory of the feature store.
+    mmap: bool
+        Memory-map the arrays instead of reading them into memory.
+
+    Returns
+    -------
+    header: dict
+    arrays: dict
+        The arrays keyed by name.
+    """
+    key = os.path.abspath(path)
+    header_path = os.path.join(path, HEADER_FILE)
+    mtime = os.path.getmtime(header_path)
+    if key in _opened_stores:
+        store_mtime, store_mmap, header, arrays = _opened_stores[key]
+        if store_mtime == mtime and store_mmap == mmap:
+            return header, arrays
+
+    with open(header_path) as f:
+        header = json.load(f)
+
+    if header.get('format') != FEATURE_STORE_FORMAT:
+        raise ValueError('%s is not a feature store' % path)
+    if header.get('version', 0) > FEATURE_STORE_VERSION:
+        raise ValueError(
+            'feature store version %s is not supported (supported: <= %d)'
+            % (header.get('version'), FEATURE_STORE_VERSION))
+
+    mmap_mode = 'r' if mmap else None
+    arrays = {}
+    for name, info in header['arrays'].items():
+        array = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        if list(array.shape) != info['shape'] or array.dtype.str != info['dtype']:
+            raise ValueError('%s in %s does not match the header' % (name, path))
+        arrays[name] = array
+
+    _opened_stores[key] = (mtime, mmap, header, arrays)
+
+    return header, arrays
+
+
+def check_header(header, **expected):
+    """
+    Check that the header was saved with the expected settings.
+
+    Raises ValueError with the mismatched keys, ex.
+    check_header(header, model='padim', arch='resnet18', crop_size=224)
+    """
+    mismatch = []
+    for k, v in expected.items():
+        if v is None:
+            continue
+        saved = header.get(k)
+        if isinstance(v, tuple):
+            v = list(v)
+        if saved != v:
+            mismatch.append('%s (saved: %s, expected: %s)' % (k, saved, v))
+
+    if mismatch:
+        raise ValueError('feature store mismatch: ' + ', '.join(mismatch))
+
+
+def cached_features(cache_dir, header, compute_fn, name='features'):
+    """
+    Load the features from the feature store keyed by the header,
+    or compute them and save them to the store, so that the next runs
+    memory-map them instead of computing.
+
+    Parameters
+    ----------
+    cache_dir: string
+        The directory of the feature stores.
+        Each store is saved in "<cache_dir>/<sha256 of the header>".
+    header: dict
+        JSON serializable information of the features, which is the key.
+        ex. {"model": "clip-ViTB32", "texts": [...]}
+    compute_fn: function
+        compute_fn() returns the features.
+    name: string
+        The name of the features array in the store.
+
+    Returns
+    -------
+    features: numpy.ndarray
+        The memory-mapped features.
+    """
+    key = json.dumps(header, sort_keys=True, ensure_ascii=False)
+    key = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    path = os.path.join(cache_dir, key)
+
+    if is_feature_store(path):
+        saved_header, arrays = load_feature_store(path)
+        check_header(saved_header, **header)
+        logger.info('%s is loaded from %s' % (name, path))
+        return arrays[name]
+
+    features = compute_fn()
+    save_feature_store(path, header, {name: features})
+    _, arrays = load_feature_store(path)
+
+    return arrays[name]
@@ -1,2 +1,3 @@
 from .grid_sample import grid_sample
 from .im2col import im2col, col2im
+from .embedding_concat import embedding_concat
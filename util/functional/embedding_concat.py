@@ -0,0 +1,41 @@
+import numpy as np
+
+
+def embedding_concat(x, y):
+    """
+    Concatenate the feature maps of two layers at the resolution of x,
+    as done by PaDiM and PatchCore.
+    y is repeated at every position of the s x s block of x (s = H1 // H2),
+    which is space-to-depth of x, concatenation, and depth-to-space.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        (B, C1, H1, W1) feature maps.
+    y: numpy.ndarray
+        (B, C2, H2, W2) feature maps, H1 and W1 are multiples of H2 and W2.
+
+    Returns
+    -------
+    z: numpy.ndarray
+        (B, C1 + C2, H1, W1) feature maps.
+    """
+    B, C1, H1, W1 = x.shape
+    _, C2, H2, W2 = y.shape
+
+    if not H1 == W1:
+        raise ValueError("Invalid shape")
+
+    s = H1 // H2
+
+    # space to depth: (B, C1, H2, s, W2, s) -> (B, C1, s, s, H2, W2)
+    x = x.reshape(B, C1, H2, s, W2, s).transpose(0, 1, 3, 5, 2, 4)
+
+    # concatenate y to every offset of the block
+    y = np.broadcast_to(y[:, :, None, None, :, :], (B, C2, s, s, H2, W2))
+    z = np.concatenate((x, y), axis=1)
+
+    # depth to space: (B, C1 + C2, s, s, H2, W2) -> (B, C1 + C2, H1, W1)
+    z = z.transpose(0, 1, 4, 2, 5, 3).reshape(B, C1 + C2, H1, W1)
+
+    return z
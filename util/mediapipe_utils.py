@@ -0,0 +1,275 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from nms_utils import box_iou
+
+
+def _calc_scale(min_scale, max_scale, stride_index, num_strides):
+    if num_strides == 1:
+        return (min_scale + max_scale) * 0.5
+    else:
+        return min_scale + (max_scale - min_scale) * 1.0 * stride_index / (num_strides - 1.0)
+
+
+@lru_cache(maxsize=None)
+def _ssd_anchors(
+        num_layers, strides, input_size_height, input_size_width,
+        min_scale, max_scale, aspect_ratios, anchor_offset_x, anchor_offset_y,
+        reduce_boxes_in_lowest_layer, interpolated_scale_aspect_ratio,
+        fixed_anchor_size):
+    anchors = []
+
+    layer_id = 0
+    while layer_id < num_layers:
+        _aspect_ratios = []
+        _scales = []
+
+        last_same_stride_layer = layer_id
+        while last_same_stride_layer < len(strides) \
+                and strides[last_same_stride_layer] == strides[layer_id]:
+            scale = _calc_scale(min_scale, max_scale, last_same_stride_layer, len(strides))
+
+            if last_same_stride_layer == 0 and reduce_boxes_in_lowest_layer:
+                # For first layer, it can be specified to use predefined anchors.
+                _aspect_ratios.extend([1.0, 2.0, 0.5])
+                _scales.extend([0.1, scale, scale])
+            else:
+                for aspect_ratio in aspect_ratios:
+                    _aspect_ratios.append(aspect_ratio)
+                    _scales.append(scale)
+                if 0.0 < interpolated_scale_aspect_ratio:
+                    if last_same_stride_layer == len(strides) - 1:
+                        scale_next = 1.0
+                    else:
+                        scale_next = _calc_scale(
+                            min_scale, max_scale, last_same_stride_layer + 1, len(strides))
+                    _scales.append((scale * scale_next) ** 0.5)
+                    _aspect_ratios.append(interpolated_scale_aspect_ratio)
+
+            last_same_stride_layer += 1
+
+        ratio_sqrts = np.sqrt(np.array(_aspect_ratios))
+        anchor_height = np.array(_scales) / ratio_sqrts
+        anchor_width = np.array(_scales) * ratio_sqrts
+        if fixed_anchor_size:
+            anchor_height = np.ones_like(anchor_height)
+            anchor_width = np.ones_like(anchor_width)
+
+        stride = strides[layer_id]
+        feature_map_height = int(np.ceil(1.0 * input_size_height / stride))
+        feature_map_width = int(np.ceil(1.0 * input_size_width / stride))
+
+        # (feature_map_height, feature_map_width, anchors per cell, (x_center, y_center, w, h))
+        layer = np.zeros((feature_map_height, feature_map_width, len(anchor_height), 4))
+        x = np.arange(feature_map_width)
+        y = np.arange(feature_map_height)
+        layer[..., 0] = ((x + anchor_offset_x) * 1.0 / feature_map_width)[None, :, None]
+        layer[..., 1] = ((y + anchor_offset_y) * 1.0 / feature_map_height)[:, None, None]
+        layer[..., 2] = anchor_width
+        layer[..., 3] = anchor_height
+        anchors.append(layer.reshape(-1, 4))
+
+        layer_id = last_same_stride_layer
+
+    anchors = np.concatenate(anchors)
+    anchors.flags.writeable = False
+
+    return anchors
+
+
+def ssd_anchors(
+        num_layers, strides, input_size_height, input_size_width,
+        min_scale, max_scale, aspect_ratios=(1.0,),
+        anchor_offset_x=0.5, anchor_offset_y=0.5,
+        reduce_boxes_in_lowest_layer=False, interpolated_scale_aspect_ratio=1.0,
+        fixed_anchor_size=False):
+    """
+    SSD anchors of MediaPipe (SsdAnchorsCalculator).
+    The table is computed once per config and cached.
+
+    Parameters
+    ----------
+    num_layers: int
+    strides: list of int
+    input_size_height, input_size_width: int
+    min_scale, max_scale: float
+    aspect_ratios: list of float
+    anchor_offset_x, anchor_offset_y: float
+    reduce_boxes_in_lowest_layer: bool
+    interpolated_scale_aspect_ratio: float
+    fixed_anchor_size: bool
+        If True, the width and height of the anchors are 1.
+
+    Returns
+    -------
+    anchors: numpy.ndarray
+        (num_anchors, 4) read-only anchors of (x_center, y_center, w, h).
+    """
+    return _ssd_anchors(
+        num_layers, tuple(strides), input_size_height, input_size_width,
+        min_scale, max_scale, tuple(aspect_ratios), anchor_offset_x, anchor_offset_y,
+        reduce_boxes_in_lowest_layer, interpolated_scale_aspect_ratio,
+        fixed_anchor_size)
+
+
+@lru_cache(maxsize=None)
+def _load_anchors(path, mtime, dtype):
+    anchors = np.load(path).astype(dtype)
+    anchors.flags.writeable = False
+    return anchors
+
+
+def load_anchors(path, dtype=np.float32):
+    """
+    Load the anchors saved as .npy, which are read only once per process.
+
+    Returns
+    -------
+    anchors: numpy.ndarray
+        (num_anchors, 4) read-only anchors of (x_center, y_center, w, h).
+    """
+    path = os.path.abspath(path)
+    return _load_anchors(path, os.path.getmtime(path), np.dtype(dtype))
+
+
+def decode_boxes(
+        raw_boxes, anchors, x_scale, y_scale=None, w_scale=None, h_scale=None,
+        num_keypoints=0, reverse_output_order=False,
+        apply_exponential_on_box_size=False, box_format='xyxy'):
+    """
+    Decode the raw boxes and keypoints of the SSD model with the anchors
+    (TensorsToDetectionsCalculator). Processes all the boxes at once.
+
+    Parameters
+    ----------
+    raw_boxes: numpy.ndarray
+        (..., num_anchors, num_coords) raw boxes of
+        (x_center, y_center, w, h, key1_x, key1_y, ...).
+    anchors: numpy.ndarray
+        (num_anchors, 4) anchors of (x_center, y_center, w, h).
+    x_scale, y_scale, w_scale, h_scale: float
+        y_scale, w_scale and h_scale are x_scale if None.
+    num_keypoints: int
+    reverse_output_order: bool
+        If True, the raw boxes are (y_center, x_center, h, w, key1_y, key1_x, ...).
+    apply_exponential_on_box_size: bool
+    box_format: string
+        'xyxy' for (xmin, ymin, xmax, ymax), 'yxyx' for (ymin, xmin, ymax, xmax).
+
+    Returns
+    -------
+    boxes: numpy.ndarray
+        (..., num_anchors, 4 + num_keypoints * 2) boxes followed by
+        the keypoints of (x, y).
+    """
+    y_scale = x_scale if y_scale is None else y_scale
+    w_scale = x_scale if w_scale is None else w_scale
+    h_scale = x_scale if h_scale is None else h_scale
+
+    raw_boxes = np.asarray(raw_boxes)
+    anchors = np.asarray(anchors)
+    ax, ay, aw, ah = anchors[:, 0], anchors[:, 1], anchors[:, 2], anchors[:, 3]
+
+    if reverse_output_order:
+        y, x, h, w = [raw_boxes[..., i] for i in range(4)]
+    else:
+        x, y, w, h = [raw_boxes[..., i] for i in range(4)]
+
+    x_center = x / x_scale * aw + ax
+    y_center = y / y_scale * ah + ay
+    if apply_exponential_on_box_size:
+        h = np.exp(h / h_scale) * ah
+        w = np.exp(w / w_scale) * aw
+    else:
+        h = h / h_scale * ah
+        w = w / w_scale * aw
+
+    dtype = np.result_type(raw_boxes, anchors)
+    boxes = np.zeros(raw_boxes.shape[:-1] + (4 + num_keypoints * 2,), dtype=dtype)
+    if box_format == 'xyxy':
+        boxes[..., 0] = x_center - w / 2.  # xmin
+        boxes[..., 1] = y_center - h / 2.  # ymin
+        boxes[..., 2] = x_center + w / 2.  # xmax
+        boxes[..., 3] = y_center + h / 2.  # ymax
+    elif box_format == 'yxyx':
+        boxes[..., 0] = y_center - h / 2.  # ymin
+        boxes[..., 1] = x_center - w / 2.  # xmin
+        boxes[..., 2] = y_center + h / 2.  # ymax
+        boxes[..., 3] = x_center + w / 2.  # xmax
+    else:
+        raise ValueError('Unknown box format: %s' % box_format)
+
+    if 0 < num_keypoints:
+        keypoints = raw_boxes[..., 4:4 + num_keypoints * 2]
+        if reverse_output_order:
+            kx, ky = keypoints[..., 1::2], keypoints[..., 0::2]
+        else:
+            kx, ky = keypoints[..., 0::2], keypoints[..., 1::2]
+        boxes[..., 4::2] = kx / x_scale * aw[:, None] + ax[:, None]
+        boxes[..., 5::2] = ky / y_scale * ah[:, None] + ay[:, None]
+
+    return boxes
+
+
+def weighted_nms(
+        detections, scores, iou_thres,
+        box_scale=1.0, offset=0, score_mode='mean'):
+    """
+    Weighted non-maximum suppression of the BlazeFace paper
+    (NonMaxSuppressionCalculator with WEIGHTED algorithm).
+    The overlapping detections are blended into their weighted mean.
+
+    Parameters
+    ----------
+    detections: numpy.ndarray
+        (N, D) detections, whose first 4 columns are the box.
+    scores: numpy.ndarray
+        (N,) scores.
+    iou_thres: float
+        The detections overlapping the top one more than this are blended.
+    box_scale: float
+        The boxes are scaled by this to compute the IoU (ex. to pixels with offset=1).
+    offset: int
+        See nms_utils.box_iou.
+    score_mode: string
+        The score of the blended detection.
+        'mean' for the mean of the scores, 'max' for the top score.
+
+    Returns
+    -------
+    detections: numpy.ndarray
+        (K, D) blended detections, sorted by descending score.
+    scores: numpy.ndarray
+        (K,) scores.
+    """
+    detections = np.asarray(detections)
+    scores = np.asarray(scores)
+    if len(detections) == 0:
+        return detections[:0], scores[:0]
+
+    boxes = detections[:, :4] * box_scale
+    ious = box_iou(boxes, boxes, offset=offset)
+
+    out_detections = []
+    out_scores = []
+    remaining = np.argsort(-scores, kind='stable')
+    while 0 < len(remaining):
+        top = remaining[0]
+        overlap = ious[top, remaining] > iou_thres
+        overlap[0] = True
+        overlapping = remaining[overlap]
+        remaining = remaining[~overlap]
+
+        if len(overlapping) == 1:
+            out_detections.append(detections[top])
+            out_scores.append(scores[top])
+            continue
+
+        s = scores[overlapping]
+        total_score = np.sum(s)
+        out_detections.append(np.sum(detections[overlapping] * s[:, None], axis=0) / total_score)
+        out_scores.append(total_score / len(overlapping) if score_mode == 'mean' else np.max(s))
+
+    return np.stack(out_detections), np.array(out_scores)
@@ -1,12 +1,37 @@
 import os
+import re
+import json
+import base64
+import hashlib
+import urllib.error
 import urllib.request
 import ssl
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # logger
 from logging import getLogger
 logger = getLogger(__name__)
 
+# The downloads are configured by the environment variables.
+# AILIA_MODELS_CACHE: the directory of the cache of the downloaded files shared by the checkouts.
+#   The files are kept by their SHA-256 and hard linked (or copied) to the save path.
+CACHE_DIR = os.environ.get('AILIA_MODELS_CACHE')
+# AILIA_MODELS_OFFLINE: if set to 1, fail without network access when the files are not prepared.
+OFFLINE = os.environ.get('AILIA_MODELS_OFFLINE', '0').lower() not in ('', '0', 'false')
+# AILIA_MODELS_MANIFEST: the JSON of {url: sha256} to verify the downloaded files.
+#   If not set, model_manifest.json next to this file is used if it exists
+#   (written by scripts/write_model_manifest.py).
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_manifest.json')
+MANIFEST_PATH = os.environ.get('AILIA_MODELS_MANIFEST')
+# AILIA_MODELS_DOWNLOAD_WORKERS: the number of the files downloaded at the same time.
+MAX_WORKERS = int(os.environ.get('AILIA_MODELS_DOWNLOAD_WORKERS', 4))
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+_manifest = None
+
 
 def progress_print(block_count, block_size, total_size):
     """
@@ -34,30 +59,369 @@ def progress_print(block_count, block_size, total_size):
     print(f'[{bar} {percentage:.2f}% ( {total_size_kb:.0f}KB )]', end='\r')
 
 
-def urlretrieve(remote_path, weight_path, progress_print):
-    temp_path = weight_path + ".tmp"
+def file_sha256(path):
+    """
+    SHA-256 hex digest of the file.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest():
+    """
+    Load the manifest of AILIA_MODELS_MANIFEST, which is read once per process.
+
+    Returns
+    -------
+    manifest: dict
+        {url: sha256} of the files. Empty if the manifest is not set.
+    """
+    global _manifest
+    if _manifest is None:
+        manifest = {}
+        path = MANIFEST_PATH
+        if not path and os.path.isfile(DEFAULT_MANIFEST_PATH):
+            path = DEFAULT_MANIFEST_PATH
+        if path:
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        _manifest = manifest
+    return _manifest
+
+
+def _url_index_path(url):
+    return os.path.join(CACHE_DIR, 'urls', hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+
+def _blob_path(digest):
+    return os.path.join(CACHE_DIR, 'blobs', digest)
+
+
+def _replace_with_link(src, dst):
+    # link to the temporary path, so that the incomplete file is not seen
+    temp_path = '%s.%d.tmp' % (dst, os.getpid())
+    try:
+        os.link(src, temp_path)
+    except OSError:
+        # the different file system, or the link is not supported
+        shutil.copyfile(src, temp_path)
+    os.replace(temp_path, dst)
+
+
+def _read_index(path):
+    # the index is "<sha256>\n<url>\n", the url is missing in the old index
+    with open(path, 'r') as f:
+        lines = f.read().splitlines()
+    digest = lines[0].strip() if lines else None
+    url = lines[1].strip() if 1 < len(lines) else None
+    return digest, url
+
+
+def _cached_digest(url):
+    # the digest of the file recorded when the url was downloaded
+    path = _url_index_path(url)
+    if os.path.isfile(path):
+        return _read_index(path)[0]
+    return None
+
+
+def cached_files():
+    """
+    The files in the cache of AILIA_MODELS_CACHE.
+
+    Returns
+    -------
+    files: dict
+        {url: sha256} of the cached files.
+    """
+    files = {}
+    urls_dir = os.path.join(CACHE_DIR, 'urls') if CACHE_DIR else None
+    if urls_dir is None or not os.path.isdir(urls_dir):
+        return files
+    for name in os.listdir(urls_dir):
+        if name.endswith('.tmp'):
+            continue
+        digest, url = _read_index(os.path.join(urls_dir, name))
+        if digest and url and os.path.isfile(_blob_path(digest)):
+            files[url] = digest
+    return files
+
+
+def _store_cache(url, file_path, digest):
+    os.makedirs(os.path.join(CACHE_DIR, 'blobs'), exist_ok=True)
+    os.makedirs(os.path.join(CACHE_DIR, 'urls'), exist_ok=True)
+
+    blob_path = _blob_path(digest)
+    if not os.path.isfile(blob_path):
+        _replace_with_link(file_path, blob_path)
+
+    index_path = _url_index_path(url)
+    temp_path = '%s.%d.tmp' % (index_path, os.getpid())
+    with open(temp_path, 'w') as f:
+        f.write(digest + '\n' + url + '\n')
+    os.replace(temp_path, index_path)
+
+
+def _meta_path(temp_path):
+    return temp_path + '.meta'
+
+
+def _load_meta(temp_path):
+    # the response headers saved when the download of temp_path was started
+    path = _meta_path(temp_path)
+    if os.path.isfile(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            pass
+    return {}
+
+
+def _save_meta(temp_path, headers):
+    meta = {
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'md5': _header_md5(headers),
+    }
+    with open(_meta_path(temp_path), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def _remove_partial(temp_path):
+    for path in (temp_path, _meta_path(temp_path)):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def _header_md5(headers):
+    # MD5 of the whole file given by the server (x-goog-hash of Google Cloud Storage)
+    for value in headers.get_all('x-goog-hash') or []:
+        for item in value.split(','):
+            key, _, digest = item.strip().partition('=')
+            if key == 'md5':
+                return base64.b64decode(digest).hex()
+    return None
+
+
+def _content_range(headers):
+    # (start, total) of "bytes start-end/total" or "bytes */total", None if unknown
+    m = re.match(r'bytes (\d+|\*)(?:-\d+)?/(\d+|\*)', headers.get('Content-Range', ''))
+    if m is None:
+        return None, None
+    start, total = m.groups()
+    return (
+        None if start == '*' else int(start),
+        None if total == '*' else int(total),
+    )
+
+
+def _fetch(url, temp_path, progress=None):
+    """
+    Download the url to temp_path.
+    If temp_path is left by the interrupted download, it is resumed by the HTTP range request
+    with If-Range, so that the file changed on the server is downloaded from the beginning.
+    The file is verified with its size and the MD5 given by the server if any.
+
+    Returns
+    -------
+    digest: string
+        SHA-256 hex digest of the downloaded file.
+    resumed: bool
+        True if the download is resumed.
+    """
+    offset = os.path.getsize(temp_path) if os.path.isfile(temp_path) else 0
+    meta = _load_meta(temp_path) if 0 < offset else {}
+    validator = meta.get('etag') or meta.get('last_modified')
+    if 0 < offset and validator is None:
+        # the partial file can not be validated, so download from the beginning
+        offset = 0
+
+    request = urllib.request.Request(url)
+    if 0 < offset:
+        request.add_header('Range', 'bytes=%d-' % offset)
+        request.add_header('If-Range', validator)
     try:
-        #raise ssl.SSLError # test
-        urllib.request.urlretrieve(
-            remote_path,
-            temp_path,
-            progress_print,
-        )
-    except ssl.SSLError as e:
-        logger.info(f'SSLError detected, so try to download without ssl')
-        remote_path = remote_path.replace("https","http")
-        urllib.request.urlretrieve(
-            remote_path,
-            temp_path,
-            progress_print,
-        )
-    shutil.move(temp_path, weight_path)
+        response = urllib.request.urlopen(request, timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and 0 < offset:
+            _, total = _content_range(e.headers)
+            if total == offset:
+                # the range is not satisfiable, as the file is already downloaded
+                h, h_md5 = hashlib.sha256(), hashlib.md5()
+                _update_hashes(temp_path, h, h_md5)
+                if meta.get('md5') in (None, h_md5.hexdigest()):
+                    return h.hexdigest(), True
+            # the partial file does not match the file on the server
+            logger.info('The partial file is invalid, so download from the beginning')
+            _remove_partial(temp_path)
+            return _fetch(url, temp_path, progress)
+        raise
+
+    if 0 < offset and response.status == 206 and _content_range(response.headers)[0] != offset:
+        # the range is not the one requested, so download from the beginning
+        response.close()
+        _remove_partial(temp_path)
+        return _fetch(url, temp_path, progress)
+
+    h, h_md5 = hashlib.sha256(), hashlib.md5()
+    with response:
+        resumed = 0 < offset and response.status == 206
+        if resumed:
+            logger.info(f'Resume downloading from {offset} bytes')
+            _update_hashes(temp_path, h, h_md5)
+        else:
+            # the whole file is sent (200), as the file is changed on the server
+            # or the range request is not supported
+            offset = 0
+            meta = _save_meta(temp_path, response.headers)
+
+        length = response.headers.get('Content-Length')
+        total_size = offset + int(length) if length is not None else -1
+
+        size = offset
+        with open(temp_path, 'ab' if resumed else 'wb') as f:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                h.update(chunk)
+                h_md5.update(chunk)
+                size += len(chunk)
+                if progress is not None and 0 < total_size:
+                    progress(size, 1, total_size)
+
+    if 0 <= total_size and size < total_size:
+        # temp_path is kept to resume the next time
+        raise IOError(f'Download of {url} is incomplete ({size} / {total_size} bytes)')
+
+    md5 = meta.get('md5')
+    if md5 is not None and h_md5.hexdigest() != md5:
+        _remove_partial(temp_path)
+        if resumed:
+            # the partial file may be broken, so download from the beginning
+            logger.info('MD5 of the resumed file is mismatched, so try to download again')
+            return _fetch(url, temp_path, progress)
+        raise IOError(f'MD5 of {url} is mismatched (expected {md5}, but {h_md5.hexdigest()})')
+
+    return h.hexdigest(), resumed
+
+
+def _update_hashes(path, *hashes):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            for h in hashes:
+                h.update(chunk)
+
+
+def _is_ssl_error(e):
+    if isinstance(e, ssl.SSLError):
+        return True
+    return isinstance(e, urllib.error.URLError) and isinstance(e.reason, ssl.SSLError)
+
+
+def download_file(remote_path, file_path, progress=None, sha256=None):
+    """
+    Download the file.
+    The file is taken from the cache of AILIA_MODELS_CACHE if it is cached,
+    and the downloaded file is verified with the SHA-256 of the manifest,
+    in addition to its size and the MD5 given by the server.
+
+    Parameters
+    ----------
+    remote_path: string
+        The url of the file.
+    file_path: string
+        The path to save the file.
+    progress: function
+        progress(block_count, block_size, total_size) is called while downloading.
+    sha256: string
+        The SHA-256 hex digest of the file. If None, the one of the manifest is used.
+    """
+    expected = sha256 if sha256 is not None else load_manifest().get(remote_path)
+
+    if CACHE_DIR:
+        digest = expected if expected is not None else _cached_digest(remote_path)
+        if digest is not None and os.path.isfile(_blob_path(digest)):
+            logger.info(f'{file_path} is found in the cache')
+            _replace_with_link(_blob_path(digest), file_path)
+            return
+
+    if OFFLINE:
+        raise FileNotFoundError(f'{file_path} is not prepared, and can not be downloaded in the offline mode')
+
+    temp_path = file_path + ".tmp"
+
+    def fetch(url):
+        try:
+            #raise ssl.SSLError # test
+            return _fetch(url, temp_path, progress)
+        except (ssl.SSLError, urllib.error.URLError) as e:
+            if not _is_ssl_error(e):
+                raise
+            logger.info(f'SSLError detected, so try to download without ssl')
+            return _fetch(url.replace("https", "http"), temp_path, progress)
+
+    digest, resumed = fetch(remote_path)
+    if expected is not None and digest != expected and resumed:
+        # the partial file may be broken, so download from the beginning
+        logger.info(f'SHA-256 of the resumed file is mismatched, so try to download again')
+        _remove_partial(temp_path)
+        digest, _ = fetch(remote_path)
+    if expected is not None and digest != expected:
+        _remove_partial(temp_path)
+        raise IOError(f'SHA-256 of {remote_path} is mismatched (expected {expected}, but {digest})')
+
+    shutil.move(temp_path, file_path)
+    _remove_partial(temp_path)
+
+    if CACHE_DIR:
+        _store_cache(remote_path, file_path, digest)
+
+
+def download_files(files, max_workers=None):
+    """
+    Download the files at the same time.
+    The progress is displayed only for the first file.
+
+    Parameters
+    ----------
+    files: list of tuple
+        (remote_path, file_path) of the files. See download_file.
+    max_workers: int
+        The number of the files downloaded at the same time.
+        If None, AILIA_MODELS_DOWNLOAD_WORKERS (default 4).
+    """
+    if len(files) == 0:
+        return
+
+    max_workers = MAX_WORKERS if max_workers is None else max_workers
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = [
+            executor.submit(
+                download_file, remote_path, file_path,
+                progress_print if i == 0 else None)
+            for i, (remote_path, file_path) in enumerate(files)
+        ]
+        # raise the error if any
+        for future in futures:
+            future.result()
+
+
+def urlretrieve(remote_path, weight_path, progress_print):
+    download_file(remote_path, weight_path, progress_print)
 
 
 def check_and_download_models(weight_path, model_path, remote_path):
     """
     Check if the onnx file and prototxt file exists,
     and if necessary, download the files to the given path.
+    The files are downloaded at the same time.
 
     Parameters
     ----------
@@ -70,21 +434,15 @@ def check_and_download_models(weight_path, model_path, remote_path):
         ex. "https://storage.googleapis.com/ailia-models/mobilenetv2/"
     """
 
+    files = []
     if not os.path.exists(weight_path):
         logger.info(f'Downloading onnx file... (save path: {weight_path})')
-        urlretrieve(
-            remote_path + os.path.basename(weight_path),
-            weight_path,
-            progress_print,
-        )
-        logger.info('\n')
+        files.append((remote_path + os.path.basename(weight_path), weight_path))
     if model_path!=None and not os.path.exists(model_path):
         logger.info(f'Downloading prototxt file... (save path: {model_path})')
-        urlretrieve(
-            remote_path + os.path.basename(model_path),
-            model_path,
-            progress_print,
-        )
+        files.append((remote_path + os.path.basename(model_path), model_path))
+    if files:
+        download_files(files)
         logger.info('\n')
     logger.info('ONNX file and Prototxt file are prepared!')
 
@@ -105,5 +463,5 @@ def check_and_download_file(file_path, remote_path):
 
     if not os.path.exists(file_path):
         logger.info('Downloading %s...' % file_path)
-        urlretrieve(remote_path + os.path.basename(file_path), file_path, progress_print)
+        download_file(remote_path + os.path.basename(file_path), file_path, progress_print)
     logger.info('%s is prepared!' % file_path)
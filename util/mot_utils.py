@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+
+# logger
+from logging import getLogger
+logger = getLogger(__name__)
+
+SAVE_FORMATS = {
+    'mot': '{frame},{id},{x1},{y1},{w},{h},-1,-1,-1,-1\n',
+    'mot_score': '{frame},{id},{x1:.2f},{y1:.2f},{w:.2f},{h:.2f},{score:.2f},-1,-1,-1\n',
+    'kitti': ('{frame} {id} pedestrian 0 0 -10 {x1} {y1} {x2} {y2} '
+              '-10 -10 -10 -1000 -1000 -1000 -10\n'),
+}
+
+# record of the binary result file
+MOT_RESULT_DTYPE = np.dtype([
+    ('frame', '<i4'), ('id', '<i4'),
+    ('x', '<f4'), ('y', '<f4'), ('w', '<f4'), ('h', '<f4'),
+    ('score', '<f4'),
+])
+
+
+class MOTResultWriter:
+    """
+    Append-only writer of tracking results.
+    Each frame is written once, so the cost does not grow with video length.
+
+    Parameters
+    ----------
+    filename: string
+        The path of the result file.
+    data_type: string
+        'mot', 'mot_score', 'kitti' for text, or 'binary' for records of
+        MOT_RESULT_DTYPE which can be read by load_binary_results.
+    flush_interval: int
+        Flush the buffer to the file every flush_interval frames.
+    """
+
+    def __init__(self, filename, data_type='mot', flush_interval=100):
+        if data_type != 'binary' and data_type not in SAVE_FORMATS:
+            raise ValueError(data_type)
+
+        self.filename = filename
+        self.data_type = data_type
+        self.flush_interval = flush_interval
+        self.n_frames = 0
+
+        mode = 'wb' if data_type == 'binary' else 'w'
+        self.f = open(filename, mode)
+
+    def write(self, frame_id, tlwhs, track_ids, scores=None):
+        """
+        Append the results of one frame.
+        """
+        if scores is None:
+            scores = [1.0] * len(track_ids)
+
+        rows = [
+            (frame_id, track_id, *tlwh, score)
+            for tlwh, track_id, score in zip(tlwhs, track_ids, scores)
+            if track_id >= 0
+        ]
+        self.write_rows(rows)
+
+    def write_rows(self, rows):
+        """
+        Append rows of (frame, id, x, y, w, h, score), usually of one frame.
+        """
+        if self.data_type == 'binary':
+            records = np.zeros(len(rows), dtype=MOT_RESULT_DTYPE)
+            for i, name in enumerate(MOT_RESULT_DTYPE.names):
+                records[name] = [row[i] for row in rows]
+            records.tofile(self.f)
+        else:
+            self.f.write(self.format_rows(rows))
+
+        self.n_frames += 1
+        if self.flush_interval and self.n_frames % self.flush_interval == 0:
+            self.f.flush()
+
+    def format_rows(self, rows):
+        save_format = SAVE_FORMATS[self.data_type]
+        lines = []
+        for row in rows:
+            frame_id, track_id, x1, y1, w, h, score = row[:7]
+            if self.data_type == 'kitti':
+                frame_id -= 1
+            x2, y2 = x1 + w, y1 + h
+            lines.append(save_format.format(
+                frame=int(frame_id), id=int(track_id),
+                x1=x1, y1=y1, x2=x2, y2=y2, w=w, h=h, score=score
+            ))
+        return ''.join(lines)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_binary_results(filename, mmap=True):
+    """
+    Load the results written by MOTResultWriter with data_type='binary'
+    as a structured array of MOT_RESULT_DTYPE.
+    """
+    if mmap and os.path.getsize(filename) > 0:
+        return np.memmap(filename, dtype=MOT_RESULT_DTYPE, mode='r')
+    return np.fromfile(filename, dtype=MOT_RESULT_DTYPE)
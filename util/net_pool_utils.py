@@ -0,0 +1,195 @@
+from collections import OrderedDict
+
+import numpy as np
+
+import ailia
+
+# logger
+from logging import getLogger
+logger = getLogger(__name__)
+
+
+def power_of_two_sizes(max_size):
+    """
+    The sizes of the power of two up to max_size, and max_size.
+    ex. (1, 2, 4, 8, 16) for 16, (1, 2, 4, 6) for 6.
+    """
+    sizes = []
+    size = 1
+    while size < max_size:
+        sizes.append(size)
+        size *= 2
+    sizes.append(max_size)
+    return tuple(sizes)
+
+
+def _round_up(s, m):
+    if isinstance(m, (tuple, list)):
+        # the smallest of the sizes, or the multiple of the largest one
+        for size in m:
+            if s <= size:
+                return size
+        m = m[-1]
+    if not m or m <= 1:
+        return s
+    return -(-s // m) * m
+
+
+def bucket_shape(shape, buckets=None):
+    """
+    Round the shape up to the bucket.
+
+    Parameters
+    ----------
+    shape: tuple of int
+    buckets: tuple of int or tuple
+        The multiple to round up each axis to. 1 or None keeps the axis as is.
+        The axis can also be the tuple of the increasing sizes, which is rounded up
+        to the smallest size, or to the multiple of the largest size beyond it.
+        If None, the shape is not rounded.
+        ex. (1, 1, 128, 128) for the NCHW image of any size,
+        ((1, 2, 4), 1, 1, 1) for the batch of 1, 2, 4, 8, 12, ...
+
+    Returns
+    -------
+    shape: tuple of int
+    """
+    shape = tuple(int(s) for s in shape)
+    if buckets is None:
+        return shape
+
+    if len(buckets) != len(shape):
+        raise ValueError('buckets %s does not match the shape %s' % (buckets, shape))
+
+    return tuple(_round_up(s, m) for s, m in zip(shape, buckets))
+
+
+def pad_to_shape(x, shape, pad_value=0):
+    """
+    Pad the end of each axis of the array to the shape.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+    shape: tuple of int
+        The shape which is equal to or larger than x.shape.
+    pad_value: float or numpy.ndarray
+        The value of the padding, which is broadcast to the shape.
+        ex. (1, C, 1, 1) array for the per channel value of the NCHW image.
+
+    Returns
+    -------
+    x: numpy.ndarray
+    """
+    if x.shape == tuple(shape):
+        return x
+
+    out = np.empty(shape, dtype=x.dtype)
+    out[...] = pad_value
+    out[tuple(slice(0, s) for s in x.shape)] = x
+
+    return out
+
+
+class NetPool:
+    """
+    Pool of the networks of a model, one per input shape bucket.
+    The shape of the input is rounded up to the bucket and the input is padded,
+    so that the inputs of the similar size share the same network.
+    The network of each bucket is opened once with its input shape,
+    and kept until it is evicted as the least recently used one.
+    This avoids set_input_shape and re-initializing the network on every image
+    (ailia SDK <= 1.2.16 requires to reopen the network if the shape is changed).
+
+    Only the first input of the network is bucketed,
+    and the caller crops the outputs of the padded input.
+    The pool is not thread safe, use one pool per thread.
+
+    Parameters
+    ----------
+    model_path: string
+        The path of the prototxt.
+    weight_path: string
+        The path of the weight (onnx).
+    buckets: tuple of int
+        See bucket_shape. If None, one network is kept per input shape.
+    max_size: int
+        Max number of the networks kept in the pool.
+    pad_value: float or numpy.ndarray
+        The default value of the padding, see pad_to_shape.
+    **kwargs
+        The arguments of ailia.Net, ex. env_id, memory_mode.
+    """
+
+    def __init__(
+            self, model_path, weight_path,
+            buckets=None, max_size=4, pad_value=0, **kwargs):
+        self.model_path = model_path
+        self.weight_path = weight_path
+        self.buckets = None if buckets is None else tuple(buckets)
+        self.max_size = max_size
+        self.pad_value = pad_value
+        self.kwargs = kwargs
+        self.nets = OrderedDict()
+
+    def __len__(self):
+        return len(self.nets)
+
+    def bucket_shape(self, shape):
+        return bucket_shape(shape, self.buckets)
+
+    def pad(self, x, pad_value=None):
+        """
+        Pad the input to the shape of its bucket.
+        """
+        pad_value = self.pad_value if pad_value is None else pad_value
+        return pad_to_shape(x, self.bucket_shape(x.shape), pad_value)
+
+    def get(self, shape):
+        """
+        Get the network of the input shape, which is opened if not in the pool.
+        """
+        shape = tuple(int(s) for s in shape)
+        if shape in self.nets:
+            self.nets.move_to_end(shape)
+            return self.nets[shape]
+
+        logger.debug('open the network for the input shape %s' % (shape,))
+        net = ailia.Net(self.model_path, self.weight_path, **self.kwargs)
+        net.set_input_shape(shape)
+
+        self.nets[shape] = net
+        while len(self.nets) > self.max_size:
+            self.nets.popitem(last=False)
+
+        return net
+
+    def predict(self, inputs, pad_value=None):
+        """
+        Run the network of the bucket of the input.
+
+        Parameters
+        ----------
+        inputs: numpy.ndarray or list or dict
+            The input of ailia.Net.predict.
+            The first input (of the list or the dict) is padded to its bucket.
+        pad_value: float or numpy.ndarray
+            If None, the default value of the pool.
+
+        Returns
+        -------
+        outputs:
+            The outputs of ailia.Net.predict for the padded input.
+        """
+        if isinstance(inputs, dict):
+            inputs = dict(inputs)
+            name = next(iter(inputs))
+            inputs[name] = x = self.pad(inputs[name], pad_value)
+        elif isinstance(inputs, (list, tuple)):
+            inputs = list(inputs)
+            inputs[0] = x = self.pad(inputs[0], pad_value)
+        else:
+            inputs = x = self.pad(inputs, pad_value)
+
+        net = self.get(x.shape)
+        return net.predict(inputs)
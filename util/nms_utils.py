@@ -21,36 +21,71 @@ def bb_intersection_over_union(boxA, boxB):
     return iou
 
 
+def box_iou(boxes_a, boxes_b, offset=0):
+    """
+    Pairwise intersection over union of boxes in (x1, y1, x2, y2) format.
+
+    Parameters
+    ----------
+    boxes_a: numpy.ndarray
+        (N, 4) boxes. Extra columns are ignored.
+    boxes_b: numpy.ndarray
+        (M, 4) boxes. Extra columns are ignored.
+    offset: int
+        1 to count the pixels of the box edges as bb_intersection_over_union does,
+        0 for continuous coordinates.
+
+    Returns
+    -------
+    iou: numpy.ndarray
+        (N, M) intersection over union.
+    """
+    a = np.asarray(boxes_a, dtype=np.float64)[..., :4].reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64)[..., :4].reshape(-1, 4)
+
+    area_a = (a[:, 2] - a[:, 0] + offset) * (a[:, 3] - a[:, 1] + offset)
+    area_b = (b[:, 2] - b[:, 0] + offset) * (b[:, 3] - b[:, 1] + offset)
+
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.maximum(rb - lt + offset, 0)
+    inter = wh[:, :, 0] * wh[:, :, 1]
+
+    return inter / (area_a[:, None] + area_b[None, :] - inter)
+
+
 def nms_between_categories(detections, w, h, categories=None, iou_threshold=0.25):
     # Normally darknet use per class nms
     # But some cases need between class nms
     # https://github.com/opencv/opencv/issues/17111
 
+    n = len(detections)
+    if n == 0:
+        return []
+
+    boxes = np.array([
+        [w * obj.x, h * obj.y, w * (obj.x + obj.w), h * (obj.y + obj.h)]
+        for obj in detections
+    ])
+    probs = np.array([obj.prob for obj in detections])
+    if categories is None:
+        in_categories = np.ones(n, dtype=bool)
+    else:
+        in_categories = np.array([obj.category in categories for obj in detections])
+
     # remove overwrapped detection
-    det = []
-    keep = []
-    for idx in range(len(detections)):
-        obj = detections[idx]
-        is_keep = True
-        for idx2 in range(len(det)):
-            if not keep[idx2]:
-                continue
-            box_a = [w * det[idx2].x, h * det[idx2].y, w * (det[idx2].x + det[idx2].w), h * (det[idx2].y + det[idx2].h)]
-            box_b = [w * obj.x, h * obj.y, w * (obj.x + obj.w), h * (obj.y + obj.h)]
-            iou = bb_intersection_over_union(box_a, box_b)
-            if iou >= iou_threshold and (
-                    categories == None or ((det[idx2].category in categories) and (obj.category in categories))):
-                if det[idx2].prob <= obj.prob:
-                    keep[idx2] = False
-                else:
-                    is_keep = False
-        det.append(obj)
-        keep.append(is_keep)
-
-    det = []
-    for idx in range(len(detections)):
-        if keep[idx]:
-            det.append(detections[idx])
+    keep = np.zeros(n, dtype=bool)
+    for idx in range(n):
+        overlap = box_iou(boxes[idx], boxes[:idx], offset=1)[0] >= iou_threshold
+        overlap &= keep[:idx]
+        if categories is not None:
+            overlap &= in_categories[:idx] & in_categories[idx]
+
+        weaker = overlap & (probs[:idx] <= probs[idx])
+        keep[np.nonzero(weaker)[0]] = False
+        keep[idx] = not np.any(overlap & ~weaker)
+
+    det = [detections[idx] for idx in np.nonzero(keep)[0]]
 
     return det
 
@@ -58,24 +93,25 @@ def nms_between_categories(detections, w, h, categories=None, iou_threshold=0.25
 def nms_boxes(boxes, scores, iou_thres):
     # Performs non-maximum suppression (NMS) on the boxes according to their intersection-over-union (IoU).
 
-    keep = []
-    for i, box_a in enumerate(boxes):
-        is_keep = True
-        for j in range(i):
-            if not keep[j]:
-                continue
-            box_b = boxes[j]
-            iou = bb_intersection_over_union(box_a, box_b)
-            if iou >= iou_thres:
-                if scores[i] > scores[j]:
-                    keep[j] = False
-                else:
-                    is_keep = False
-                    break
+    n = len(boxes)
+    boxes = np.asarray(boxes)
+    scores = np.asarray(scores)
 
-        keep.append(is_keep)
+    keep = np.zeros(n, dtype=bool)
+    for i in range(n):
+        # iou with the kept boxes only, one row per box to keep the memory O(n)
+        kept = np.nonzero(keep[:i])[0]
+        overlap = box_iou(boxes[i], boxes[kept], offset=1)[0] >= iou_thres
+        candidates = kept[overlap]
+        stronger = candidates[scores[i] <= scores[candidates]]
+        if len(stronger) > 0:
+            # suppressed by the first stronger box
+            keep[candidates[candidates < stronger[0]]] = False
+        else:
+            keep[candidates] = False
+            keep[i] = True
 
-    return np.array(keep).nonzero()[0]
+    return keep.nonzero()[0]
 
 
 def batched_nms(boxes, scores, labels, iou_thres):
@@ -96,20 +132,178 @@ def batched_nms(boxes, scores, labels, iou_thres):
 
 
 def packed_nms(boxes, scores, iou_thres):
+    boxes = np.asarray(boxes)
     packed_idx = []
     remained = np.argsort(-scores)
     while 0 < len(remained):
-        idx = remained
-        i = idx[0]
-        candidates = [i]
-        remained = []
-        for j in idx[1:]:
-            similarity = bb_intersection_over_union(boxes[i], boxes[j])
-            if similarity > iou_thres:
-                candidates.append(j)
-            else:
-                remained.append(j)
+        i = remained[0]
+        others = remained[1:]
+        similarity = box_iou(boxes[i], boxes[others], offset=1)[0]
+        overlap = similarity > iou_thres
+        candidates = [i] + list(others[overlap])
+        remained = others[~overlap]
 
         packed_idx.append(candidates)
 
     return packed_idx
+
+
+def _hard_nms(boxes, scores, iou_thres, offset):
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = boxes[:, 2]
+    y2 = boxes[:, 3]
+
+    areas = (x2 - x1 + offset) * (y2 - y1 + offset)
+    order = np.argsort(-scores, kind='stable')
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+
+        w = np.maximum(0.0, xx2 - xx1 + offset)
+        h = np.maximum(0.0, yy2 - yy1 + offset)
+        inter = w * h
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+
+        inds = np.where(ovr <= iou_thres)[0]
+        order = order[inds + 1]
+
+    keep = np.array(keep, dtype=np.int64)
+    return keep, scores[keep]
+
+
+def _soft_nms(boxes, scores, iou_thres, sigma, score_thres, offset, kernel):
+    scores = scores.copy()
+    remained = np.arange(len(scores))
+
+    keep = []
+    keep_scores = []
+    while remained.size > 0:
+        top = np.argmax(scores[remained])
+        i = remained[top]
+        keep.append(i)
+        keep_scores.append(scores[i])
+
+        remained = np.delete(remained, top)
+        if remained.size == 0:
+            break
+
+        iou = box_iou(boxes[i], boxes[remained], offset=offset)[0]
+        if kernel == 'gaussian':
+            weight = np.exp(-(iou * iou) / sigma)
+        else:
+            weight = np.where(iou > iou_thres, 1 - iou, 1)
+        scores[remained] *= weight
+
+        remained = remained[scores[remained] >= score_thres]
+
+    return np.array(keep, dtype=np.int64), np.array(keep_scores, dtype=scores.dtype)
+
+
+def _matrix_nms(boxes, scores, labels, sigma, score_thres, offset, kernel):
+    order = np.argsort(-scores, kind='stable')
+    boxes = boxes[order]
+    sorted_scores = scores[order]
+
+    # iou with the boxes of higher score (and same label)
+    iou = np.triu(box_iou(boxes, boxes, offset=offset), k=1)
+    if labels is not None:
+        sorted_labels = labels[order]
+        iou *= sorted_labels[:, None] == sorted_labels[None, :]
+
+    # maximum iou of each box with the boxes of higher score
+    compensate = iou.max(axis=0)[:, None]
+
+    if kernel == 'gaussian':
+        decay = np.exp(-sigma * (iou ** 2 - compensate ** 2))
+    else:
+        decay = (1 - iou) / (1 - compensate)
+    decayed_scores = sorted_scores * decay.min(axis=0)
+
+    mask = decayed_scores >= score_thres
+    keep = order[mask]
+    keep_scores = decayed_scores[mask]
+
+    idx = np.argsort(-keep_scores, kind='stable')
+    return keep[idx], keep_scores[idx]
+
+
+def nms(
+        boxes, scores, iou_thres=0.5, labels=None, method='hard',
+        score_thres=0.0, sigma=None, kernel='gaussian', offset=0,
+        return_scores=False):
+    """
+    Non-maximum suppression of boxes vectorized with NumPy.
+
+    Parameters
+    ----------
+    boxes: numpy.ndarray
+        (N, 4) boxes in (x1, y1, x2, y2) format. Extra columns are ignored.
+    scores: numpy.ndarray
+        (N,) scores.
+    iou_thres: float
+        Boxes overlapping more than this are suppressed ('hard'),
+        or decayed by the linear kernel ('soft').
+    labels: numpy.ndarray
+        (N,) class labels. If given, boxes suppress only the boxes of the same
+        label (class-aware), otherwise all boxes (class-agnostic).
+    method: string
+        'hard' for greedy NMS, 'soft' for Soft-NMS, 'matrix' for Matrix NMS.
+    score_thres: float
+        The boxes whose score is decayed below this are removed ('soft', 'matrix').
+    sigma: float
+        The parameter of the gaussian kernel, whose meaning follows each paper.
+        'soft': the decay is exp(-iou^2 / sigma), larger sigma decays less (default 0.5).
+        'matrix': the decay is exp(-sigma * (iou^2 - compensate^2)),
+        larger sigma decays more (default 2.0).
+    kernel: string
+        'gaussian' or 'linear' ('soft', 'matrix').
+    offset: int
+        1 to count the pixels of the box edges as the legacy implementations do.
+    return_scores: bool
+        Also return the scores of the kept boxes, decayed by 'soft' and 'matrix'.
+
+    Returns
+    -------
+    keep: numpy.ndarray
+        Indices of the kept boxes, sorted by descending score.
+    scores: numpy.ndarray
+        Scores of the kept boxes (only if return_scores).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    scores = np.asarray(scores)
+    if len(boxes) == 0:
+        keep = np.zeros((0,), dtype=np.int64)
+        return (keep, scores[keep]) if return_scores else keep
+    boxes = boxes[:, :4]
+
+    if labels is not None:
+        labels = np.asarray(labels)
+        if method != 'matrix':
+            # batched offset trick: move the boxes of each label far apart,
+            # so that the boxes of different labels never overlap
+            span = boxes.max() - boxes.min() + offset + 1
+            boxes = boxes + (labels.astype(np.float64) * span)[:, None]
+
+    if method == 'hard':
+        keep, keep_scores = _hard_nms(boxes, scores, iou_thres, offset)
+    elif method == 'soft':
+        sigma = 0.5 if sigma is None else sigma
+        keep, keep_scores = _soft_nms(
+            boxes, scores, iou_thres, sigma, score_thres, offset, kernel)
+    elif method == 'matrix':
+        sigma = 2.0 if sigma is None else sigma
+        keep, keep_scores = _matrix_nms(
+            boxes, scores, labels, sigma, score_thres, offset, kernel)
+    else:
+        raise ValueError('Unknown nms method: %s' % method)
+
+    if return_scores:
+        return keep, keep_scores
+    return keep
@@ -1,6 +1,9 @@
 import os
 import sys
 import re
+import queue
+import atexit
+import threading
 
 import numpy as np
 import cv2
@@ -11,6 +14,25 @@ from image_utils import normalize_image
 from logging import getLogger
 logger = getLogger(__name__)
 
+# default of get_capture / get_writer, updated by --threaded_io
+_threaded_io = {
+    'enabled': False,
+    'capture_queue_size': 4,
+    'writer_queue_size': 16,
+}
+
+
+def set_threaded_io(enabled=True, capture_queue_size=None, writer_queue_size=None):
+    """
+    Set whether get_capture and get_writer return the threaded capture and writer
+    when `threaded` is not specified.
+    """
+    _threaded_io['enabled'] = enabled
+    if capture_queue_size is not None:
+        _threaded_io['capture_queue_size'] = capture_queue_size
+    if writer_queue_size is not None:
+        _threaded_io['writer_queue_size'] = writer_queue_size
+
 
 def calc_adjust_fsize(f_height, f_width, height, width):
     # calculate the image size of the output('img') of adjust_frame_size
@@ -126,7 +148,7 @@ def preprocess_frame(
     return img, data
 
 
-def get_writer(savepath, height, width, fps=20, rgb=True):
+def get_writer(savepath, height, width, fps=20, rgb=True, threaded=None):
     """get cv2.VideoWriter
 
     Parameters
@@ -136,11 +158,26 @@ def get_writer(savepath, height, width, fps=20, rgb=True):
     width : int
     fps : int
     rgb : bool, default is True
+    threaded : bool, default is None
+        Encode frames in a background thread.
+        If None, the setting of set_threaded_io (--threaded_io) is used.
 
     Returns
     -------
-    writer : cv2.VideoWriter()
+    writer : cv2.VideoWriter() or ThreadedVideoWriter()
     """
+    writer = _get_writer(savepath, height, width, fps, rgb)
+
+    if threaded is None:
+        threaded = _threaded_io['enabled']
+    if threaded:
+        writer = ThreadedVideoWriter(
+            writer, queue_size=_threaded_io['writer_queue_size'])
+
+    return writer
+
+
+def _get_writer(savepath, height, width, fps, rgb):
     # stream output
     if re.match(r'localhost\:',savepath) or re.match(r'[0-9]+(?:\.[0-9]+){3}\:',savepath):
         # Usage : 
@@ -175,6 +212,178 @@ def get_writer(savepath, height, width, fps=20, rgb=True):
     return writer
 
 
+class ThreadedVideoCapture:
+    """
+    Capture which decodes frames in a background thread,
+    so that decoding overlaps with the inference of the previous frames.
+    It can be used in place of cv2.VideoCapture.
+
+    Frames are prefetched into a bounded queue, so seeking by
+    set(cv2.CAP_PROP_POS_FRAMES, ...) is not supported and raises ValueError.
+    get(cv2.CAP_PROP_POS_FRAMES) returns the position of the frames returned by read,
+    not the one of the background thread.
+    The wrapped capture is called under a lock, as it is not thread safe.
+
+    Parameters
+    ----------
+    capture : cv2.VideoCapture or BaslerCameraCapture
+    queue_size : int
+        Max number of prefetched frames.
+    """
+
+    def __init__(self, capture, queue_size=4):
+        self.capture = capture
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stopped = threading.Event()
+        self.finished = False
+        self.lock = threading.Lock()
+
+        # the position of the consumer
+        get = getattr(capture, 'get', None)
+        self.pos_frames = int(get(cv2.CAP_PROP_POS_FRAMES)) if get else 0
+
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+        self.thread.start()
+
+    def _reader(self):
+        try:
+            while not self.stopped.is_set():
+                with self.lock:
+                    ret, frame = self.capture.read()
+                if not ret:
+                    break
+                self._put((True, frame))
+        finally:
+            self._put((False, None))
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read(self):
+        if self.finished:
+            return False, None
+
+        ret, frame = self.queue.get()
+        if not ret:
+            self.finished = True
+        else:
+            self.pos_frames += 1
+        return ret, frame
+
+    def isOpened(self):
+        if self.finished:
+            return False
+        is_opened = getattr(self.capture, 'isOpened', None)
+        if is_opened is None:
+            return True
+        with self.lock:
+            return is_opened()
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.pos_frames)
+        if prop_id == cv2.CAP_PROP_POS_MSEC and hasattr(self.capture, 'get'):
+            with self.lock:
+                fps = self.capture.get(cv2.CAP_PROP_FPS)
+            return self.pos_frames * 1000.0 / fps if 0 < fps else 0.0
+        with self.lock:
+            return self.capture.get(prop_id)
+
+    def set(self, prop_id, value):
+        if prop_id in (cv2.CAP_PROP_POS_FRAMES, cv2.CAP_PROP_POS_MSEC, cv2.CAP_PROP_POS_AVI_RATIO):
+            raise ValueError('ThreadedVideoCapture does not support seeking')
+        with self.lock:
+            return self.capture.set(prop_id, value)
+
+    def release(self):
+        self.stopped.set()
+        self.thread.join()
+        self.finished = True
+
+        if hasattr(self.capture, 'release'):
+            self.capture.release()
+        elif hasattr(self.capture, 'stop_capture'):
+            self.capture.stop_capture()
+
+    def __getattr__(self, name):
+        attr = getattr(self.capture, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        return locked
+
+
+class ThreadedVideoWriter:
+    """
+    Writer which encodes frames in a background thread,
+    so that encoding overlaps with the inference of the next frames.
+    It can be used in place of cv2.VideoWriter.
+
+    Parameters
+    ----------
+    writer : cv2.VideoWriter
+    queue_size : int
+        Max number of frames waiting to be encoded.
+    """
+
+    def __init__(self, writer, queue_size=16):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.error = None
+        self.released = False
+
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+        # write the remaining frames even if release() is not called
+        atexit.register(self.release)
+
+    def _writer(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.writer.write(frame)
+            except Exception as e:
+                self.error = e
+
+    def write(self, frame):
+        if self.released:
+            raise RuntimeError('writer is already released')
+        if self.error is not None:
+            raise self.error
+
+        # the caller may reuse the buffer of the frame
+        self.queue.put(np.array(frame, copy=True))
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.release()
+        atexit.unregister(self.release)
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+
 class BaslerCameraCapture:
     def __init__(self):
         self.camera = None
@@ -214,7 +423,7 @@ class BaslerCameraCapture:
             self.camera = None
             
 
-def get_capture(video):
+def get_capture(video, threaded=None):
     """
     Get cv2.VideoCapture
 
@@ -225,10 +434,13 @@ def get_capture(video):
     ----------
     video : str
         webcamera-id or video path
+    threaded : bool, default is None
+        Decode frames in a background thread.
+        If None, the setting of set_threaded_io (--threaded_io) is used.
 
     Returns
     -------
-    capture : cv2.VideoCapture
+    capture : cv2.VideoCapture or ThreadedVideoCapture
     """
     try:
         video_id = int(video)
@@ -249,4 +461,10 @@ def get_capture(video):
         elif check_file_existance(video):
             capture = cv2.VideoCapture(video)
 
+    if threaded is None:
+        threaded = _threaded_io['enabled']
+    if threaded:
+        capture = ThreadedVideoCapture(
+            capture, queue_size=_threaded_io['capture_queue_size'])
+
     return capture